@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from bot.config import (
+    RATE_BURST, RATE_PER_MINUTE, ADMISSION_MAX_WAIT, ADMISSION_MAX_IN_FLIGHT, logger,
+)
+from bot.core.metrics import Histogram, register_collector
+
+# Приоритеты: меньше — раньше
+CONFIRM, READ, WRITE, CHAT = range(4)
+PRIORITY_NAMES = ("confirm", "read", "write", "chat")
+
+ACTION_PRIORITY = {
+    "show_period": READ, "show_workers": READ, "show_history": READ,
+    "show_changes_period": READ, "check_changes": READ, "check_coverage": READ,
+    "show_stats": READ,
+    "update": WRITE, "update_many": WRITE, "undo": WRITE, "undo_batch": WRITE,
+    "fill_schedule": WRITE,
+}
+
+MAX_TRACKED_USERS = 1000
+
+_buckets: OrderedDict = OrderedDict()  # user_id -> [токены, время обновления]
+_waiters: list = []  # куча (приоритет, порядковый номер, future)
+_seq = itertools.count()
+_in_flight = 0
+_stats = {"admitted": 0, "throttled": 0, "rejected": 0, "queued": 0}
+_wait_time = [Histogram() for _ in PRIORITY_NAMES]
+
+
+def action_priority(action: str | None) -> int:
+    return ACTION_PRIORITY.get(action, CHAT)
+
+
+# ===================== ЛИМИТ НА ПОЛЬЗОВАТЕЛЯ =====================
+
+
+def _take_token(user_id: int, now: float) -> float:
+    """Берёт токен из корзины пользователя; возвращает, сколько ждать до него.
+
+    Токен можно взять «в долг» — следующие сообщения встанут за ним по времени.
+    Корзины хранятся в LRU: давно молчавшие пользователи вытесняются, а
+    вернувшись, получают полную корзину — как и положено после паузы.
+    """
+    rate = RATE_PER_MINUTE / 60
+    state = _buckets.pop(user_id, None)
+    tokens, updated = state if state else (RATE_BURST, now)
+    tokens = min(RATE_BURST, tokens + (now - updated) * rate) - 1
+    _buckets[user_id] = [tokens, now]
+    while len(_buckets) > MAX_TRACKED_USERS:
+        _buckets.popitem(last=False)
+    return 0.0 if tokens >= 0 else -tokens / rate
+
+
+async def admit(user_id: int) -> bool:
+    """Пропускает сообщение пользователя, при превышении лимита — с короткой задержкой.
+
+    False — только если ждать пришлось бы дольше ADMISSION_MAX_WAIT (флуд).
+    """
+    wait = _take_token(user_id, time.monotonic())
+    if wait > ADMISSION_MAX_WAIT:
+        _buckets[user_id][0] += 1  # токен не потрачен
+        _stats["rejected"] += 1
+        logger.info("[ADMISSION] user=%s отклонён: ждать %.1fс", user_id, wait)
+        return False
+    _stats["admitted"] += 1
+    if wait > 0:
+        _stats["throttled"] += 1
+        logger.debug("[ADMISSION] user=%s ждёт токен %.1fс", user_id, wait)
+        await asyncio.sleep(wait)
+    return True
+
+
+# ===================== ОБЩИЙ ЛИМИТ =====================
+
+
+def _release():
+    global _in_flight
+    while _waiters:
+        _, _, fut = heapq.heappop(_waiters)
+        if not fut.done():
+            fut.set_result(None)  # слот переходит следующему без декремента
+            return
+    _in_flight -= 1
+
+
+@asynccontextmanager
+async def slot(priority: int):
+    """Слот на тяжёлую работу (LLM, Sheets, распознавание).
+
+    Одновременно работают не больше ADMISSION_MAX_IN_FLIGHT задач; остальные ждут
+    в очереди по приоритету: подтверждения → чтение → запись → болтовня.
+    """
+    global _in_flight
+    started = time.monotonic()
+    if _in_flight < ADMISSION_MAX_IN_FLIGHT and not _waiters:
+        _in_flight += 1
+    else:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(_waiters, (priority, next(_seq), fut))
+        _stats["queued"] += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                _release()  # слот уже выдан, но задача отменена
+            raise
+    _wait_time[priority].observe(time.monotonic() - started)
+    try:
+        yield
+    finally:
+        _release()
+
+
+def queue_depth() -> list[int]:
+    depth = [0] * len(PRIORITY_NAMES)
+    for priority, _, fut in _waiters:
+        if not fut.done():
+            depth[priority] += 1
+    return depth
+
+
+@register_collector
+def _prometheus_lines() -> list[str]:
+    lines = [
+        "# HELP admission_queue_depth Задачи в очереди на слот по приоритету",
+        "# TYPE admission_queue_depth gauge",
+    ]
+    for name, n in zip(PRIORITY_NAMES, queue_depth()):
+        lines.append(f'admission_queue_depth{{priority="{name}"}} {n}')
+    lines += [
+        "# HELP admission_in_flight Задачи, занявшие слот",
+        "# TYPE admission_in_flight gauge",
+        f"admission_in_flight {_in_flight}",
+        "# HELP admission_messages_total Сообщения по результату проверки лимита",
+        "# TYPE admission_messages_total counter",
+    ]
+    for key in ("admitted", "throttled", "rejected"):
+        lines.append(f'admission_messages_total{{result="{key}"}} {_stats[key]}')
+    lines += [
+        "# HELP admission_wait_seconds Ожидание слота",
+        "# TYPE admission_wait_seconds histogram",
+    ]
+    for name, hist in zip(PRIORITY_NAMES, _wait_time):
+        for le, n in hist.cumulative():
+            lines.append(f'admission_wait_seconds_bucket{{priority="{name}",le="{le}"}} {n}')
+        lines.append(f'admission_wait_seconds_sum{{priority="{name}"}} {hist.sum:.6f}')
+        lines.append(f'admission_wait_seconds_count{{priority="{name}"}} {hist.count}')
+    return lines
@@ -1,11 +1,15 @@
 import os
 import json
 import logging
+import multiprocessing
+from functools import cache
 from datetime import datetime, timezone, timedelta
 
 MSK = timezone(timedelta(hours=3))
 from dotenv import load_dotenv
 
+from bot.logs import setup_logging, parse_levels
+
 # ===================== ENV =====================
 
 load_dotenv()
@@ -15,37 +19,171 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH", "service_account.json")
 
+# Воркеры вебхука (WEBHOOK_WORKERS > 1) делят файлы истории, снимка, outbox
+# и кэша распознавания — запись под блокировкой файла (bot/shared.py)
+WORKER_INDEX = int(os.getenv("BOT_WORKER_INDEX", "0"))
+WORKER_PORT = int(os.getenv("BOT_WORKER_PORT", "0"))
 HISTORY_FILE = "history.json"
 SNAPSHOT_FILE = "snapshot.json"
+# Правки, ещё не записанные в таблицу
+OUTBOX_FILE = "outbox.json"
+# Записи бота в таблицу (правки, откаты, заполнение) — фоновая проверка их пропускает
+OWN_WRITES_FILE = "own_writes.json"
 EMPLOYEES_FILE = "employees.json"
+TRANSCRIPT_CACHE_FILE = os.getenv("TRANSCRIPT_CACHE_FILE", "transcripts.json")
 
 CACHE_TTL = 60
-RATE_LIMIT_SECONDS = 3
+
+# Запись правок: сначала в локальный outbox (ответ пользователю сразу),
+# в таблицу — пачкой через OUTBOX_FLUSH_DELAY секунд; если Sheets недоступна —
+# повтор с паузой, растущей до OUTBOX_MAX_BACKOFF
+OUTBOX_FLUSH_DELAY = float(os.getenv("OUTBOX_FLUSH_DELAY", "1"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+# Сколько раз правка ждёт, пока её лист не читается; потом снимается с сообщением в чат
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+
+# Параллельная обработка апдейтов (апдейты одного пользователя — по очереди)
+# и потоки для запросов к Google Sheets
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+SHEETS_WORKERS = int(os.getenv("SHEETS_WORKERS", "4"))
+
+# Допуск запросов: корзина токенов на пользователя и общий лимит тяжёлых задач
+# (LLM, Sheets, распознавание); сверх лимита — очередь по приоритету
+RATE_BURST = int(os.getenv("RATE_BURST", "5"))
+RATE_PER_MINUTE = float(os.getenv("RATE_PER_MINUTE", "20"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "6"))
 GC_CHECK_INTERVAL = 300
 PENDING_TTL = 120
 
+# Кэш распознанных голосовых (ключ — file_unique_id, опционально хэш содержимого)
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "1000"))
+TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", str(7 * 24 * 3600)))
+TRANSCRIPT_CACHE_HASH = os.getenv("TRANSCRIPT_CACHE_HASH", "1") == "1"
+TRANSCRIPT_CACHE_FLUSH_INTERVAL = int(os.getenv("TRANSCRIPT_CACHE_FLUSH_INTERVAL", "60"))
+
+# Корпус запросов для tools/replay.py (выключен по умолчанию): текст, разбор,
+# задержка и токены; ID пользователей — HMAC с CORPUS_SALT
+CORPUS_ENABLED = os.getenv("CORPUS_ENABLED", "0") == "1"
+CORPUS_FILE = os.getenv("CORPUS_FILE", "corpus.jsonl")
+CORPUS_MAX_BYTES = int(os.getenv("CORPUS_MAX_BYTES", str(10 * 1024 * 1024)))
+CORPUS_BACKUPS = int(os.getenv("CORPUS_BACKUPS", "5"))
+CORPUS_SALT = os.getenv("CORPUS_SALT", "")
+
+# Предобработка голосовых (нужен ffmpeg): обрезка тишины и нарезка длинных записей
+VOICE_PREPROCESS = os.getenv("VOICE_PREPROCESS", "1") == "1"
+VOICE_CHUNK_SECONDS = float(os.getenv("VOICE_CHUNK_SECONDS", "20"))
+VOICE_MIN_CHUNK_SECONDS = float(os.getenv("VOICE_MIN_CHUNK_SECONDS", "5"))
+# Кадр анализа — 30 мс: кусок короче двух кадров нарезку не сдвинет
+if VOICE_CHUNK_SECONDS < 0.06:
+    raise ValueError(f"VOICE_CHUNK_SECONDS={VOICE_CHUNK_SECONDS}: нужно не меньше 0.06")
+if not 0.03 <= VOICE_MIN_CHUNK_SECONDS < VOICE_CHUNK_SECONDS:
+    raise ValueError(f"VOICE_MIN_CHUNK_SECONDS={VOICE_MIN_CHUNK_SECONDS}: нужно от 0.03 до VOICE_CHUNK_SECONDS")
+VOICE_SILENCE_DB = float(os.getenv("VOICE_SILENCE_DB", "-40"))
+VOICE_CHUNK_WORKERS = int(os.getenv("VOICE_CHUNK_WORKERS", "4"))
+
+# PNG картинок расписания: 0 цветов — полноцветный RGB, иначе палитра;
+# compress_level 0–9 и optimize меняют размер на время кодирования
+IMAGE_PALETTE_COLORS = int(os.getenv("IMAGE_PALETTE_COLORS", "64"))
+IMAGE_PNG_COMPRESS_LEVEL = int(os.getenv("IMAGE_PNG_COMPRESS_LEVEL", "6"))
+IMAGE_PNG_OPTIMIZE = os.getenv("IMAGE_PNG_OPTIMIZE", "0") == "1"
+
+# Длинные периоды (квартал, 60–90 дней) показываются альбомом из нескольких картинок
+MAX_PERIOD_DAYS = int(os.getenv("MAX_PERIOD_DAYS", "92"))
+SCHEDULE_PAGE_DAYS = int(os.getenv("SCHEDULE_PAGE_DAYS", "0"))  # 0 — страница на месяц
+IMAGE_RENDER_PROCESSES = int(os.getenv("IMAGE_RENDER_PROCESSES", "2"))
+
+# Пустой лист-шаблон (шапка, заливка, ширины), из которого создаются новые месяцы
+TEMPLATE_SHEET = os.getenv("TEMPLATE_SHEET", "")
+
+# Покрытие смен: окно, в котором кто-то должен быть на смене, и границы численности
+COVERAGE_WINDOW = os.getenv("COVERAGE_WINDOW", "09:00 - 01:00")
+COVERAGE_MIN_STAFF = int(os.getenv("COVERAGE_MIN_STAFF", "1"))
+COVERAGE_MAX_STAFF = int(os.getenv("COVERAGE_MAX_STAFF", "2"))
+COVERAGE_WARNINGS = os.getenv("COVERAGE_WARNINGS", "1") == "1"
+
+# Отчёты по часам: норма смены для переработки и допустимый возраст кэша листов
+STANDARD_SHIFT_HOURS = float(os.getenv("STANDARD_SHIFT_HOURS", "8"))
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "600"))
+
 # Автоотправка расписания в топик
 SCHEDULE_CHAT_ID = int(os.getenv("SCHEDULE_CHAT_ID", "0"))
 SCHEDULE_THREAD_ID = int(os.getenv("SCHEDULE_THREAD_ID", "0"))
 SCHEDULE_TIME = os.getenv("SCHEDULE_TIME", "08:00")  # HH:MM по локальному времени
+# Несколько получателей: "chat_id:thread_id,chat_id" (без thread — в общий чат);
+# по умолчанию — SCHEDULE_CHAT_ID/SCHEDULE_THREAD_ID
+SCHEDULE_TARGETS = [
+    (int(chat), int(thread) if thread else None)
+    for chat, _, thread in (t.strip().partition(":") for t in os.getenv("SCHEDULE_TARGETS", "").split(","))
+    if chat
+] or ([(SCHEDULE_CHAT_ID, SCHEDULE_THREAD_ID)] if SCHEDULE_CHAT_ID and SCHEDULE_THREAD_ID else [])
+SCHEDULE_DAY_OFFSET = int(os.getenv("SCHEDULE_DAY_OFFSET", "0"))  # 1 — вечером постить завтрашний день
+# Картинка готовится заранее: за столько минут до SCHEDULE_TIME, с повторами при ошибках
+SCHEDULE_PRESTAGE_MINUTES = int(os.getenv("SCHEDULE_PRESTAGE_MINUTES", "60"))
+
+# Фоновая проверка правок в таблице: опрос листов текущего и следующего месяца,
+# интервал растёт вдвое, пока изменений нет, и сбрасывается на минимум при правке
+WATCH_ENABLED = os.getenv("WATCH_ENABLED", "1") == "1"
+WATCH_MIN_INTERVAL = int(os.getenv("WATCH_MIN_INTERVAL", "60"))
+WATCH_MAX_INTERVAL = int(os.getenv("WATCH_MAX_INTERVAL", "900"))
+# Личные уведомления сотрудникам — нужен telegram_id в employees.json
+WATCH_NOTIFY_EMPLOYEES = os.getenv("WATCH_NOTIFY_EMPLOYEES", "0") == "1"
+# Сколько секунд запись бота не считается чужой правкой; больше WATCH_MAX_INTERVAL
+WATCH_OWN_WRITES_TTL = int(os.getenv("WATCH_OWN_WRITES_TTL", "3600"))
+
+# Режим получения апдейтов: polling или webhook (встроенный HTTP-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com/telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+# Адрес Bot API — для локального telegram-bot-api или тестового сервера
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+TELEGRAM_FILE_URL = os.getenv("TELEGRAM_FILE_URL", "https://api.telegram.org/file/bot")
+
+# Telegram ID администраторов (через запятую) — доступ к /llm_stats и /metrics
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+
+# Замеры этапов: /metrics на локальном порту (0 — выключен; воркер i слушает
+# METRICS_PORT + i) и лог апдейтов, обработанных дольше SLOW_REQUEST_SECONDS
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "10"))  # 0 — не логировать
+
+# Прогрев сразу после старта: подключение к Sheets, текущий месяц в кэше,
+# клиенты Claude/Groq и процессы рендера — первый запрос не платит за них
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
 
 # ===================== ЛОГИРОВАНИЕ =====================
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("bot.log", encoding="utf-8"),
-        logging.StreamHandler(),
-    ],
-)
-# Внешние библиотеки — только WARNING, чтобы не спамить
-logging.getLogger("httpx").setLevel(logging.WARNING)
-logging.getLogger("httpcore").setLevel(logging.WARNING)
-logging.getLogger("telegram").setLevel(logging.INFO)
-logging.getLogger("gspread").setLevel(logging.INFO)
-logging.getLogger("google").setLevel(logging.WARNING)
-logging.getLogger("urllib3").setLevel(logging.WARNING)
+# Очередь + фоновый поток (bot/logs.py): форматирование и запись не в event loop.
+# В файл — JSON по строке на запись (LOG_JSON=0 — текст), ротация по времени
+# и размеру; у воркеров вебхука свои файлы, чтобы не ротировать один на всех
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+if WORKER_PORT:
+    LOG_FILE = "{0}.worker{2}{1}".format(*os.path.splitext(LOG_FILE), WORKER_INDEX)
+LOG_JSON = os.getenv("LOG_JSON", "1") == "1"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "7"))
+# Каждая N-я DEBUG-запись с одним шаблоном (1 — все)
+LOG_DEBUG_SAMPLE = int(os.getenv("LOG_DEBUG_SAMPLE", "1"))
+# Уровни по логгерам: "bot=DEBUG,gspread=WARNING"; внешние библиотеки по умолчанию
+# не ниже WARNING/INFO, чтобы не спамить
+LOG_LEVELS = {
+    "httpx": "WARNING", "httpcore": "WARNING", "telegram": "INFO", "gspread": "INFO",
+    "google": "WARNING", "urllib3": "WARNING", "apscheduler": "WARNING",
+    **parse_levels(os.getenv("LOG_LEVELS", "")),
+}
+
+# Процессы пула рендера лог в файл не открывают — записи идут родителю (log_to_queue)
+if multiprocessing.parent_process() is None:
+    setup_logging(
+        LOG_LEVEL, LOG_FILE, LOG_JSON, LOG_MAX_BYTES, LOG_ROTATE_WHEN, LOG_BACKUPS, LOG_LEVELS, LOG_DEBUG_SAMPLE,
+    )
 logger = logging.getLogger("bot")
 
 # ===================== КОНСТАНТЫ =====================
@@ -79,9 +217,23 @@ def load_employees() -> dict:
     return {}
 
 
-EMPLOYEES_CONFIG = load_employees()
-ANCHOR_DATE = datetime.strptime(
-    EMPLOYEES_CONFIG.get("anchor_date", "2026-02-01"), "%Y-%m-%d"
-).date()
-EMPLOYEES = EMPLOYEES_CONFIG.get("employees", {})
-NAMES = list(EMPLOYEES.keys())
+@cache
+def _employee_settings() -> dict:
+    employees_config = load_employees()
+    employees = employees_config.get("employees", {})
+    return {
+        "EMPLOYEES_CONFIG": employees_config,
+        "ANCHOR_DATE": datetime.strptime(employees_config.get("anchor_date", "2026-02-01"), "%Y-%m-%d").date(),
+        "EMPLOYEES": employees,
+        "NAMES": list(employees.keys()),
+    }
+
+
+def __getattr__(name: str):
+    """EMPLOYEES_CONFIG, ANCHOR_DATE, EMPLOYEES, NAMES — employees.json читается
+    при первом обращении, а не при импорте config. Модули берут их как
+    config.NAMES в момент вызова, а не from bot.config import NAMES.
+    """
+    if name in ("EMPLOYEES_CONFIG", "ANCHOR_DATE", "EMPLOYEES", "NAMES"):
+        return _employee_settings()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
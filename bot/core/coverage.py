@@ -0,0 +1,198 @@
+import re
+from datetime import date, timedelta
+
+import numpy as np
+
+from bot.config import COVERAGE_WINDOW, COVERAGE_MIN_STAFF, COVERAGE_MAX_STAFF
+
+_SHIFT_RE = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$")
+_DATE_RE = re.compile(r"(\d{1,2})[./](\d{1,2})")
+
+
+# ===================== РАЗБОР СМЕН =====================
+
+
+def _parse_one(cell: str) -> tuple[int, int]:
+    """«HH:MM - HH:MM» → (начало, конец) в минутах от начала дня; конец > начала.
+
+    Ночная смена («17:00 - 01:00») заканчивается на следующие сутки: конец + 1440.
+    Не-смена (выходной, пусто) → (-1, -1).
+    """
+    m = _SHIFT_RE.match(cell or "")
+    if not m:
+        return -1, -1
+    start = int(m.group(1)) * 60 + int(m.group(2))
+    end = int(m.group(3)) * 60 + int(m.group(4))
+    if end <= start:
+        end += 1440
+    return start, end
+
+
+def shift_intervals(cells) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Матрица строк смен → массивы начала, конца (минуты) и маска валидных смен.
+
+    Разбираются только уникальные строки (их единицы), дальше — индексами.
+    """
+    arr = np.asarray(cells, dtype=object)
+    if arr.size == 0:
+        empty = np.zeros(arr.shape, dtype=np.int32)
+        return empty, empty, empty.astype(bool)
+    uniq, inverse = np.unique(arr.astype(str), return_inverse=True)
+    parsed = np.array([_parse_one(u) for u in uniq], dtype=np.int32).reshape(-1, 2)
+    start = parsed[inverse, 0].reshape(arr.shape)
+    end = parsed[inverse, 1].reshape(arr.shape)
+    return start, end, start >= 0
+
+
+def parse_window(window: str) -> tuple[int, int]:
+    """Окно покрытия «09:00 - 01:00» → часы [начало, конец), конец может быть > 24."""
+    start, end = _parse_one(window)
+    if start < 0:
+        return 0, 24
+    return start // 60, -(-end // 60)
+
+
+# ===================== СЕТКА МЕСЯЦА =====================
+
+
+def month_matrix(all_values: list) -> tuple[list[str], list[str], np.ndarray]:
+    """Лист месяца → (даты «DD.MM», имена, матрица ячеек дни × сотрудники)."""
+    if len(all_values) < 2:
+        return [], [], np.empty((0, 0), dtype=object)
+    header = all_values[1]
+    cols = [j for j in range(1, len(header)) if header[j].strip()]
+    names = [header[j].strip() for j in cols]
+    dates, rows = [], []
+    for row in all_values[2:]:
+        if not row or not row[0].strip():
+            continue
+        m = _DATE_RE.search(row[0])
+        if not m:
+            continue
+        dates.append(f"{m.group(1).zfill(2)}.{m.group(2).zfill(2)}")
+        rows.append([row[j].strip() if j < len(row) else "" for j in cols])
+    return dates, names, np.array(rows, dtype=object).reshape(len(rows), len(cols))
+
+
+# ===================== ПОКРЫТИЕ =====================
+
+
+def hourly_headcount(start: np.ndarray, end: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Сколько человек на смене в каждый час: массив (дни + 1) × 24.
+
+    Строка i — сутки i-й строки сетки; последняя строка — хвост ночных смен
+    последнего дня, ушедший в следующие сутки.
+    """
+    days = start.shape[0]
+    if days == 0:
+        return np.zeros((1, 24), dtype=np.int32)
+    offset = (np.arange(days, dtype=np.int32) * 1440)[:, None]
+    abs_start = np.where(valid, start + offset, 0)
+    abs_end = np.where(valid, end + offset, 0)
+    bins = np.arange((days + 1) * 24, dtype=np.int32) * 60
+    on_shift = (abs_start[..., None] < bins + 60) & (abs_end[..., None] > bins) & valid[..., None]
+    return on_shift.sum(axis=(0, 1)).reshape(days + 1, 24)
+
+
+def _windows(hours: np.ndarray) -> list[tuple[int, int]]:
+    """Индексы True → список непрерывных отрезков [начало, конец)."""
+    if hours.size == 0:
+        return []
+    edges = np.diff(np.concatenate(([0], hours.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def analyze(
+    dates: list[str],
+    cells: np.ndarray,
+    window: str = COVERAGE_WINDOW,
+    min_staff: int = COVERAGE_MIN_STAFF,
+    max_staff: int = COVERAGE_MAX_STAFF,
+) -> list[dict]:
+    """Непокрытые окна и перебор людей по дням.
+
+    Возвращает [{"date", "kind": "gap"|"over", "from": час, "to": час, "count"}],
+    часы окна могут переходить за полночь (to > 24).
+    """
+    start, end, valid = shift_intervals(cells)
+    flat = hourly_headcount(start, end, valid).ravel()
+    w_start, w_end = parse_window(window)
+
+    issues = []
+    for i, date_key in enumerate(dates):
+        counts = flat[i * 24 + w_start: i * 24 + w_end]
+        for kind, mask in (("gap", counts < min_staff), ("over", counts > max_staff)):
+            for a, b in _windows(mask):
+                issues.append({
+                    "date": date_key,
+                    "kind": kind,
+                    "from": w_start + int(a),
+                    "to": w_start + int(b),
+                    "count": int(counts[a:b].min() if kind == "gap" else counts[a:b].max()),
+                })
+    return issues
+
+
+def analyze_month(all_values: list) -> list[dict]:
+    dates, _, cells = month_matrix(all_values)
+    return analyze(dates, cells)
+
+
+# ===================== ТЕКСТ =====================
+
+
+def _hour(h: int) -> str:
+    return f"{h % 24:02d}:00"
+
+
+def format_issue(issue: dict) -> str:
+    span = f"{_hour(issue['from'])}–{_hour(issue['to'])}"
+    if issue["kind"] == "gap":
+        who = "никого" if issue["count"] == 0 else f"только {issue['count']}"
+        return f"🕳 {issue['date']} {span}: {who}"
+    return f"👥 {issue['date']} {span}: {issue['count']} на смене"
+
+
+def format_report(issues: list[dict], title: str) -> str:
+    if not issues:
+        return f"✅ {title}: всё покрыто, перебора нет."
+    gaps = [i for i in issues if i["kind"] == "gap"]
+    over = [i for i in issues if i["kind"] == "over"]
+    lines = [f"📊 *{title}*\n"]
+    if gaps:
+        lines.append(f"*Дыры в покрытии ({len(gaps)}):*")
+        lines.extend(format_issue(i) for i in gaps[:20])
+        if len(gaps) > 20:
+            lines.append(f"...и ещё {len(gaps) - 20}")
+    if over:
+        lines.append(f"\n*Перебор ({len(over)}):*")
+        lines.extend(format_issue(i) for i in over[:20])
+        if len(over) > 20:
+            lines.append(f"...и ещё {len(over) - 20}")
+    return "\n".join(lines)
+
+
+def edit_warning(before: list, after: list, affected_dates: set[str] | None = None) -> str | None:
+    """Предупреждение о проблемах, которые появятся после правки.
+
+    before/after — листы месяца до и после изменения; сравниваются только
+    затронутые дни (и следующий — из-за ночных смен).
+    """
+    key = lambda i: (i["date"], i["kind"], i["from"], i["to"])  # noqa: E731
+    old = {key(i) for i in analyze_month(before)}
+    new = [i for i in analyze_month(after) if key(i) not in old]
+    if affected_dates is not None:
+        new = [i for i in new if i["date"] in affected_dates]
+    if not new:
+        return None
+    return "⚠️ После правки:\n" + "\n".join(format_issue(i) for i in new[:5])
+
+
+def with_next_days(date_keys: set[str], year: int) -> set[str]:
+    """Добавляет к датам «DD.MM» следующие сутки (хвосты ночных смен)."""
+    result = set(date_keys)
+    for key in date_keys:
+        d, m = key.split(".")
+        nxt = date(year, int(m), int(d)) + timedelta(days=1)
+        result.add(nxt.strftime("%d.%m"))
+    return result
@@ -1,26 +1,43 @@
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
 import os
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 from PIL import Image, ImageDraw, ImageFont
 
-from bot.config import logger
+from bot.config import (
+    IMAGE_PALETTE_COLORS, IMAGE_PNG_COMPRESS_LEVEL, IMAGE_PNG_OPTIMIZE, IMAGE_RENDER_PROCESSES,
+    LOG_LEVEL, logger,
+)
+from bot.logs import child_log_queue, log_to_queue
+from bot.tracing import span, traced
 
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/calibri.ttf",
+]
+BOLD_FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+    "C:/Windows/Fonts/arialbd.ttf",
+    "C:/Windows/Fonts/calibrib.ttf",
+]
 
+# Холст 1×1 только для измерения текста — те же метрики, что и у draw.textbbox
+_measure_draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+
+@lru_cache(maxsize=1)
 def _get_fonts():
-    font_paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-        "C:/Windows/Fonts/arial.ttf",
-        "C:/Windows/Fonts/calibri.ttf",
-    ]
-    bold_paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
-        "C:/Windows/Fonts/arialbd.ttf",
-        "C:/Windows/Fonts/calibrib.ttf",
-    ]
-    font_path = next((f for f in font_paths if os.path.exists(f)), None)
-    font_bold = next((f for f in bold_paths if os.path.exists(f)), None)
+    """Шрифты ищутся и загружаются один раз на процесс."""
+    font_path = next((f for f in FONT_PATHS if os.path.exists(f)), None)
+    font_bold = next((f for f in BOLD_FONT_PATHS if os.path.exists(f)), None)
     try:
         return (
             ImageFont.truetype(font_bold or font_path, 20),
@@ -34,54 +51,211 @@ def _get_fonts():
         return d, d, d, d
 
 
-def generate_schedule_image(title: str, headers: list, rows: list) -> str:
-    DATE_COL_W, NAME_COL_W = 90, 125
-    ROW_H, HEADER_H, TITLE_H, PAD = 48, 55, 65, 20
+@lru_cache(maxsize=4096)
+def _text_size(text: str, font) -> tuple[int, int]:
+    """Размер текста; ячейки повторяются («Вых», «9-17», имена), поэтому мемоизируем."""
+    bb = _measure_draw.textbbox((0, 0), text, font=font)
+    return bb[2] - bb[0], bb[3] - bb[1]
+
+
+# ===================== РАЗМЕТКА И ЦВЕТА =====================
+
+DATE_COL_W, NAME_COL_W = 90, 125
+ROW_H, HEADER_H, TITLE_H, PAD = 48, 55, 65, 20
+
+BG = (15, 15, 25)
+HEADER_FILL, HEADER_TEXT = (35, 35, 60), (130, 170, 255)
+DATE_FILL, DATE_TEXT = (28, 28, 48), (200, 200, 220)
+OFF_FILL, OFF_TEXT = (65, 25, 25), (235, 100, 100)
+WORK_FILL, WORK_TEXT = (25, 70, 50), (100, 235, 160)
+
+
+# ===================== СПРАЙТЫ =====================
+
+
+@lru_cache(maxsize=64)
+def _rounded_sprite(w: int, h: int, r: int, fill: tuple) -> Image.Image:
+    """Скруглённая плашка ячейки (w×h, отступы 1/2 px) как RGBA-спрайт."""
+    sprite = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sprite)
+    x1, y1, x2, y2 = 1, 2, w - 1, h - 2
+    draw.rectangle([x1 + r, y1, x2 - r, y2], fill=fill)
+    draw.rectangle([x1, y1 + r, x2, y2 - r], fill=fill)
+    for cx, cy in [(x1, y1), (x2 - 2 * r, y1), (x1, y2 - 2 * r), (x2 - 2 * r, y2 - 2 * r)]:
+        draw.ellipse([cx, cy, cx + 2 * r, cy + 2 * r], fill=fill)
+    return sprite
+
+
+@lru_cache(maxsize=2048)
+def _text_origin(w: int, h: int, text: str, font) -> tuple[int, int, bool]:
+    """Позиция текста по центру ячейки w×h и умещается ли он в ней целиком."""
+    tw, th = _text_size(text, font)
+    x, y = (w - tw) // 2, (h - th) // 2
+    left, top, right, bottom = _measure_draw.textbbox((x, y), text, font=font)
+    return x, y, left >= 0 and top >= 0 and right <= w and bottom <= h
+
+
+@lru_cache(maxsize=2048)
+def _cell_tile(w: int, h: int, r: int, fill: tuple, text: str, font, color: tuple) -> Image.Image:
+    """Готовая ячейка: фон, плашка и текст по центру — растеризуется один раз.
+
+    Текст, который не умещается, в плитку не попадает — его рисует _paste_cells.
+    """
+    tile = Image.new("RGB", (w, h), BG)
+    sprite = _rounded_sprite(w, h, r, fill)
+    tile.paste(sprite, (0, 0), sprite)
+    x, y, fits = _text_origin(w, h, text, font)
+    if fits:
+        ImageDraw.Draw(tile).text((x, y), text, font=font, fill=color)
+    return tile
+
+
+def _paste_cells(img: Image.Image, x: int, y: int, cells: list[tuple]):
+    """Кладёт ячейки (w, h, r, fill, text, font, color) слева направо.
+
+    Длинный текст, как и при рисовании ячеек по одной, не обрезается: он
+    рисуется поверх картинки и заходит на соседей. Ячейки правее кладутся
+    уже только плашкой, чтобы не стереть его в зазорах между ними.
+    """
+    draw = None
+    overflow = False
+    for w, h, r, fill, text, font, color in cells:
+        tx, ty, fits = _text_origin(w, h, text, font)
+        if overflow:
+            sprite = _rounded_sprite(w, h, r, fill)
+            img.paste(sprite, (x, y), sprite)
+        else:
+            img.paste(_cell_tile(w, h, r, fill, text, font, color), (x, y))
+        if overflow or not fits:
+            draw = draw or ImageDraw.Draw(img)
+            draw.text((x + tx, y + ty), text, font=font, fill=color)
+            overflow = True
+        x += w
+
+
+@lru_cache(maxsize=32)
+def _header_band(headers: tuple) -> Image.Image:
+    """Полоса заголовков таблицы во всю ширину картинки — одна на набор имён."""
+    _, font_header, _, _ = _get_fonts()
+    band = Image.new("RGB", (PAD * 2 + DATE_COL_W + NAME_COL_W * len(headers), HEADER_H), BG)
+    _paste_cells(band, PAD, 0, [
+        (DATE_COL_W, HEADER_H, 8, HEADER_FILL, "Дата", font_header, HEADER_TEXT),
+        *((NAME_COL_W, HEADER_H, 8, HEADER_FILL, name, font_header, HEADER_TEXT) for name in headers),
+    ])
+    return band
+
+
+def _value_cell(val: str, font) -> tuple:
+    if val == "Выходной":
+        return NAME_COL_W, ROW_H, 6, OFF_FILL, "Вых", font, OFF_TEXT
+    return NAME_COL_W, ROW_H, 6, WORK_FILL, val.replace(":00", "").replace(" ", ""), font, WORK_TEXT
+
+
+# ===================== РЕНДЕР =====================
+
+
+def schedule_image_key(title: str, headers: list, rows: list) -> str:
+    """Хэш содержимого таблицы: одинаковые данные — одна и та же картинка."""
+    payload = json.dumps([title, headers, rows], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def encode_png(
+    img: Image.Image,
+    palette_colors: int = IMAGE_PALETTE_COLORS,
+    compress_level: int = IMAGE_PNG_COMPRESS_LEVEL,
+    optimize: bool = IMAGE_PNG_OPTIMIZE,
+) -> bytes:
+    """PNG в памяти; при palette_colors > 0 — палитровый (P-mode), в разы меньше RGB."""
+    if palette_colors > 0:
+        img = img.quantize(
+            colors=palette_colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE,
+        )
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=compress_level, optimize=optimize)
+    return buf.getvalue()
+
+
+@traced("render")
+def generate_schedule_image(title: str, headers: list, rows: list) -> bytes:
     total_w = PAD * 2 + DATE_COL_W + NAME_COL_W * len(headers)
     total_h = PAD * 2 + TITLE_H + HEADER_H + ROW_H * len(rows)
-    img = Image.new("RGB", (total_w, total_h), (15, 15, 25))
-    draw = ImageDraw.Draw(img)
-    font_title, font_header, font_cell, font_date = _get_fonts()
-
-    def rr(x1, y1, x2, y2, r, fill):
-        draw.rectangle([x1 + r, y1, x2 - r, y2], fill=fill)
-        draw.rectangle([x1, y1 + r, x2, y2 - r], fill=fill)
-        for cx, cy in [(x1, y1), (x2 - 2 * r, y1), (x1, y2 - 2 * r), (x2 - 2 * r, y2 - 2 * r)]:
-            draw.ellipse([cx, cy, cx + 2 * r, cy + 2 * r], fill=fill)
-
-    def ct(text, x, y, w, h, font, color):
-        bb = draw.textbbox((0, 0), text, font=font)
-        tw, th = bb[2] - bb[0], bb[3] - bb[1]
-        draw.text((x + (w - tw) // 2, y + (h - th) // 2), text, font=font, fill=color)
-
-    ct(title, PAD, PAD, total_w - PAD * 2, TITLE_H, font_title, (130, 170, 255))
-
-    y = PAD + TITLE_H
-    x = PAD
-    rr(x + 1, y + 2, x + DATE_COL_W - 1, y + HEADER_H - 2, 8, (35, 35, 60))
-    ct("Дата", x, y, DATE_COL_W, HEADER_H, font_header, (130, 170, 255))
-    x += DATE_COL_W
-    for name in headers:
-        rr(x + 1, y + 2, x + NAME_COL_W - 1, y + HEADER_H - 2, 8, (35, 35, 60))
-        ct(name, x, y, NAME_COL_W, HEADER_H, font_header, (130, 170, 255))
-        x += NAME_COL_W
+    img = Image.new("RGB", (total_w, total_h), BG)
+    font_title, _, font_cell, font_date = _get_fonts()
+
+    tw, th = _text_size(title, font_title)
+    ImageDraw.Draw(img).text(
+        (PAD + (total_w - PAD * 2 - tw) // 2, PAD + (TITLE_H - th) // 2),
+        title, font=font_title, fill=HEADER_TEXT,
+    )
+    img.paste(_header_band(tuple(headers)), (0, PAD + TITLE_H))
 
     for ri, row in enumerate(rows):
-        y = PAD + TITLE_H + HEADER_H + ri * ROW_H
-        x = PAD
-        rr(x + 1, y + 2, x + DATE_COL_W - 1, y + ROW_H - 2, 6, (28, 28, 48))
-        ct(f"{row['date']} {row['day']}", x, y, DATE_COL_W, ROW_H, font_date, (200, 200, 220))
-        x += DATE_COL_W
-        for val in row["values"]:
-            if val == "Выходной":
-                rr(x + 1, y + 2, x + NAME_COL_W - 1, y + ROW_H - 2, 6, (65, 25, 25))
-                ct("Вых", x, y, NAME_COL_W, ROW_H, font_cell, (235, 100, 100))
-            else:
-                rr(x + 1, y + 2, x + NAME_COL_W - 1, y + ROW_H - 2, 6, (25, 70, 50))
-                ct(val.replace(":00", "").replace(" ", ""), x, y, NAME_COL_W, ROW_H, font_cell, (100, 235, 160))
-            x += NAME_COL_W
-
-    fd, path = tempfile.mkstemp(suffix=".png")
-    os.close(fd)
-    img.save(path)
-    return path
+        _paste_cells(img, PAD, PAD + TITLE_H + HEADER_H + ri * ROW_H, [
+            (DATE_COL_W, ROW_H, 6, DATE_FILL, f"{row['date']} {row['day']}", font_date, DATE_TEXT),
+            *(_value_cell(val, font_cell) for val in row["values"]),
+        ])
+
+    return encode_png(img)
+
+
+@lru_cache(maxsize=1)
+def placeholder_image() -> bytes:
+    """Заглушка «Готовлю расписание…» — статус-фото, которое потом заменяется картинкой."""
+    text = "Готовлю расписание…"
+    font_title = _get_fonts()[0]
+    tw, th = _text_size(text, font_title)
+    img = Image.new("RGB", (tw + PAD * 4, th + PAD * 4), BG)
+    ImageDraw.Draw(img).text((PAD * 2, PAD * 2), text, font=font_title, fill=HEADER_TEXT)
+    return encode_png(img)
+
+
+# ===================== ПАРАЛЛЕЛЬНЫЙ РЕНДЕР =====================
+
+_render_pool: ProcessPoolExecutor | None = None
+
+
+def _init_render_worker(log_queue, level: str):
+    log_to_queue(log_queue, level)
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    """Пул запускается через spawn, а не fork: к этому моменту в процессе уже
+    работают потоки Sheets, логирования и голосовых, и унаследованная занятая
+    блокировка (tracing, метрики) навсегда подвесила бы процесс рендера."""
+    global _render_pool
+    if _render_pool is None:
+        ctx = multiprocessing.get_context("spawn")
+        _render_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_RENDER_PROCESSES, mp_context=ctx,
+            initializer=_init_render_worker, initargs=(child_log_queue(ctx), LOG_LEVEL),
+        )
+    return _render_pool
+
+
+async def render_pages(pages: list[tuple]) -> list[bytes]:
+    """Рендерит страницы (title, headers, rows) параллельно в пуле процессов."""
+    loop = asyncio.get_running_loop()
+    pool = _get_render_pool()
+    # Замер в дочернем процессе сюда не долетает — меряем всю пачку целиком
+    with span("render"):
+        return list(await asyncio.gather(
+            *(loop.run_in_executor(pool, generate_schedule_image, *page) for page in pages)
+        ))
+
+
+def _warm_render_worker():
+    _get_fonts()
+
+
+async def warm_render_pool():
+    """Поднимает процессы пула заранее и загружает в них шрифты."""
+    loop = asyncio.get_running_loop()
+    pool = _get_render_pool()
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_render_worker) for _ in range(IMAGE_RENDER_PROCESSES)))
+    placeholder_image()
+
+
+def shutdown_render_pool():
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
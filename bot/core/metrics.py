@@ -0,0 +1,185 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# ===================== ГИСТОГРАММЫ =====================
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+MAX_METRIC_USERS = 200
+
+
+class Histogram:
+    """Кумулятивная гистограмма в духе Prometheus."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        result, acc = [], 0
+        for le, c in zip(self.buckets, self.counts):
+            acc += c
+            result.append((f"{le:g}", acc))
+        result.append(("+Inf", acc + self.counts[-1]))
+        return result
+
+
+class _LLMStats:
+    __slots__ = ("calls", "input_tokens", "output_tokens", "cache_read_tokens",
+                 "cache_write_tokens", "errors", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.errors: dict[str, int] = defaultdict(int)
+        self.latency = Histogram()
+
+
+# ===================== РЕЕСТР =====================
+
+_lock = threading.Lock()
+_llm: dict[tuple, _LLMStats] = {}
+_known_users: set[str] = set()
+_collectors: list = []
+
+
+def _user_label(user_id) -> str:
+    if user_id is None:
+        return "-"
+    label = str(user_id)
+    if label in _known_users:
+        return label
+    if len(_known_users) >= MAX_METRIC_USERS:
+        return "other"
+    _known_users.add(label)
+    return label
+
+
+def record_llm_call(
+    model: str, call: str, action: str, user_id, latency: float,
+    usage=None, error: Exception | None = None,
+):
+    """Записывает один вызов LLM: токены, задержку и класс ошибки."""
+    with _lock:
+        key = (model, call, action or "-", _user_label(user_id))
+        stats = _llm.get(key)
+        if stats is None:
+            stats = _llm[key] = _LLMStats()
+        stats.calls += 1
+        stats.latency.observe(latency)
+        if usage is not None:
+            stats.input_tokens += getattr(usage, "input_tokens", 0) or 0
+            stats.output_tokens += getattr(usage, "output_tokens", 0) or 0
+            stats.cache_read_tokens += getattr(usage, "cache_read_input_tokens", 0) or 0
+            stats.cache_write_tokens += getattr(usage, "cache_creation_input_tokens", 0) or 0
+        if error is not None:
+            stats.errors[type(error).__name__] += 1
+
+
+def register_collector(fn):
+    """Регистрирует функцию, отдающую дополнительные строки для /metrics."""
+    _collectors.append(fn)
+    return fn
+
+
+def reset_metrics():
+    with _lock:
+        _llm.clear()
+        _known_users.clear()
+
+
+# ===================== ЭКСПОРТ =====================
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**kw) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in kw.items()) + "}"
+
+
+def render_prometheus() -> str:
+    """Экспорт метрик LLM в текстовом формате Prometheus."""
+    with _lock:
+        items = sorted(_llm.items())
+        lines = []
+
+        counters = [
+            ("llm_calls_total", "Вызовы LLM", "calls"),
+            ("llm_input_tokens_total", "Входные токены", "input_tokens"),
+            ("llm_output_tokens_total", "Выходные токены", "output_tokens"),
+            ("llm_cache_read_tokens_total", "Токены, прочитанные из кэша промпта", "cache_read_tokens"),
+            ("llm_cache_write_tokens_total", "Токены, записанные в кэш промпта", "cache_write_tokens"),
+        ]
+        for metric, help_text, attr in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (model, call, action, user), s in items:
+                lbl = _labels(model=model, call=call, action=action, user=user)
+                lines.append(f"{metric}{lbl} {getattr(s, attr)}")
+
+        lines.append("# HELP llm_errors_total Ошибки LLM по классам")
+        lines.append("# TYPE llm_errors_total counter")
+        for (model, call, action, user), s in items:
+            for err, n in sorted(s.errors.items()):
+                lbl = _labels(model=model, call=call, action=action, user=user, error=err)
+                lines.append(f"llm_errors_total{lbl} {n}")
+
+        lines.append("# HELP llm_latency_seconds Задержка вызовов LLM")
+        lines.append("# TYPE llm_latency_seconds histogram")
+        for (model, call, action, user), s in items:
+            base = dict(model=model, call=call, action=action, user=user)
+            for le, n in s.latency.cumulative():
+                lines.append(f"llm_latency_seconds_bucket{_labels(**base, le=le)} {n}")
+            lines.append(f"llm_latency_seconds_sum{_labels(**base)} {s.latency.sum:.6f}")
+            lines.append(f"llm_latency_seconds_count{_labels(**base)} {s.latency.count}")
+
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def llm_summary(top_users: int = 5) -> str:
+    """Короткая сводка по расходу токенов для админ-команды."""
+    with _lock:
+        by_path: dict[tuple, list] = defaultdict(lambda: [0, 0, 0, 0, 0, 0.0])
+        by_user: dict[str, list] = defaultdict(lambda: [0, 0])
+        for (model, call, action, user), s in _llm.items():
+            agg = by_path[(model, call, action)]
+            agg[0] += s.calls
+            agg[1] += s.input_tokens
+            agg[2] += s.output_tokens
+            agg[3] += s.cache_read_tokens
+            agg[4] += sum(s.errors.values())
+            agg[5] += s.latency.sum
+            u = by_user[user]
+            u[0] += s.calls
+            u[1] += s.input_tokens + s.output_tokens
+
+    if not by_path:
+        return "📈 Вызовов LLM пока не было."
+
+    lines = ["📈 LLM: вызовы / токены (вход+выход, кэш) / ср. задержка\n"]
+    for (model, call, action), (calls, inp, out, cached, errs, lat) in sorted(
+        by_path.items(), key=lambda kv: -(kv[1][1] + kv[1][2])
+    ):
+        err_text = f", ошибок {errs}" if errs else ""
+        lines.append(
+            f"• {call}/{action} [{model}]: {calls} / {inp}+{out} (кэш {cached}) / "
+            f"{lat / calls:.2f}с{err_text}"
+        )
+    lines.append("\n👤 Топ пользователей по токенам:")
+    for user, (calls, tokens) in sorted(by_user.items(), key=lambda kv: -kv[1][1])[:top_users]:
+        lines.append(f"• {user}: {tokens} токенов за {calls} вызовов")
+    return "\n".join(lines)
@@ -0,0 +1,153 @@
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from bot.config import OUTBOX_FILE, OUTBOX_MAX_ATTEMPTS, MSK, logger
+from bot.core.schedule import find_row_and_col
+from bot.shared import SharedJsonFile
+
+# Правки, принятые у пользователя, но ещё не записанные в таблицу.
+# Запись: {"id", "month", "name", "date" (DD.MM), "value", "expected", "seq",
+# "created", "chat_id", "attempts"}; expected — значение ячейки, которое видел пользователь.
+# Лежит на диске до подтверждения записи — переживает перезапуск и сбой Sheets.
+# Файл общий для воркеров вебхука: правку из одного воркера видят (overlay),
+# снимают (discard) и записывают в таблицу (flush) все остальные.
+
+_lock = threading.Lock()
+_listeners: list = []
+_file = SharedJsonFile(OUTBOX_FILE, default=list)
+_flush_file = SharedJsonFile(f"{OUTBOX_FILE}.flush")
+
+_entries: list[dict] = _file.read()
+
+
+def _refresh():
+    if _file.changed():
+        data = _file.read()
+        with _lock:
+            _entries[:] = data
+
+
+def _save():
+    with _lock:
+        data = list(_entries)
+    _file.write(data)
+
+
+@contextmanager
+def flushing():
+    """Запись outbox в таблицу — одним процессом за раз; False — уже пишет другой."""
+    with _flush_file.lock(blocking=False) as acquired:
+        yield acquired
+
+
+def add_listener(fn):
+    """fn() вызывается после добавления правок — из любого потока."""
+    _listeners.append(fn)
+    return fn
+
+
+def enqueue(edits: list[dict], request_id=None, chat_id: int | None = None) -> int:
+    """Кладёт правки {"month", "name", "date", "value", "expected"} в очередь.
+
+    request_id (update_id апдейта) делает постановку идемпотентной: повторная
+    доставка того же апдейта не добавит правки второй раз.
+    """
+    added = 0
+    with _file.lock():
+        _refresh()
+        with _lock:
+            known = {e["id"] for e in _entries}
+            seq = max((e["seq"] for e in _entries), default=0)
+            for edit in edits:
+                entry_id = f"{request_id}:{edit['name']}:{edit['date']}" if request_id is not None else uuid.uuid4().hex
+                if entry_id in known:
+                    continue
+                seq += 1
+                _entries.append({
+                    **edit, "id": entry_id, "seq": seq, "chat_id": chat_id,
+                    "created": datetime.now(MSK).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+                added += 1
+        if added:
+            _save()
+    if added:
+        for listener in _listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Ошибка обработчика outbox: {e}")
+    return added
+
+
+def pending(month: str | None = None) -> list[dict]:
+    """Незаписанные правки (копии) в порядке постановки."""
+    _refresh()
+    with _lock:
+        return [dict(e) for e in _entries if month is None or e["month"] == month]
+
+
+def overlay(month: str, all_values: list) -> list:
+    """Данные листа с применёнными незаписанными правками — то, что видит пользователь."""
+    entries = pending(month)
+    if not entries or not all_values:
+        return all_values
+    year = datetime.now(MSK).year
+    result = [list(row) for row in all_values]
+    for e in entries:
+        row, col = find_row_and_col(result, int(e["date"].split(".")[0]), month, e["name"], year)
+        if row is None or col is None:
+            continue
+        result[row].extend([""] * (col + 1 - len(result[row])))
+        result[row][col] = e["value"]
+    return result
+
+
+def ack(ids: set[str]):
+    """Убирает записанные (или отброшенные) правки."""
+    if not ids:
+        return
+    with _file.lock():
+        _refresh()
+        with _lock:
+            _entries[:] = [e for e in _entries if e["id"] not in ids]
+        _save()
+
+
+def retry_later(ids: set[str]) -> list[dict]:
+    """Правки остались в outbox, потому что их лист не прочитался.
+
+    Считает попытки; правки, исчерпавшие OUTBOX_MAX_ATTEMPTS, снимает и возвращает.
+    """
+    if not ids:
+        return []
+    with _file.lock():
+        _refresh()
+        with _lock:
+            dropped = []
+            for e in _entries:
+                if e["id"] in ids:
+                    e["attempts"] = e.get("attempts", 0) + 1
+                    if e["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                        dropped.append(dict(e))
+            if dropped:
+                gone = {e["id"] for e in dropped}
+                _entries[:] = [e for e in _entries if e["id"] not in gone]
+        _save()
+    return dropped
+
+
+def discard(name: str, date_str: str) -> list[dict]:
+    """Снимает незаписанные правки ячейки — перед откатом через бота."""
+    day, month = date_str.split(".")
+    key = (name, f"{int(day):02d}.{month.zfill(2)}")
+    with _file.lock():
+        _refresh()
+        with _lock:
+            dropped = [e for e in _entries if (e["name"], e["date"]) == key]
+            if dropped:
+                _entries[:] = [e for e in _entries if (e["name"], e["date"]) != key]
+        if dropped:
+            _save()
+    return dropped
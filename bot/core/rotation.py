@@ -0,0 +1,91 @@
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from bot import config
+
+OFF = "Выходной"
+
+_N_ON_M_OFF = re.compile(r"^\s*(\d+)\s*/\s*(\d+)\s*$")
+
+
+def _employee_cycle(name: str, cfg: dict) -> list[str]:
+    """Цикл сотрудника из employees.json в виде списка смен по дням.
+
+    Поддерживаются:
+    - {"shift", "anchor_pos"} — классический 2/2;
+    - {"shift", "pattern": "5/2"} — N рабочих / M выходных;
+    - {"pattern": ["09:00 - 21:00", "21:00 - 09:00", "Выходной", ...]} — явный цикл
+      (например, чередование дневных и ночных смен).
+    """
+    pattern = cfg.get("pattern", "2/2")
+    if isinstance(pattern, list):
+        if not pattern or not all(isinstance(p, str) for p in pattern):
+            raise ValueError(f"{name}: pattern должен быть непустым списком смен")
+        return [p.strip() or OFF for p in pattern]
+
+    m = _N_ON_M_OFF.match(str(pattern))
+    if not m:
+        raise ValueError(f"{name}: не понял pattern {pattern!r} (ожидаю 'N/M' или список смен)")
+    on, off = int(m.group(1)), int(m.group(2))
+    if on + off == 0:
+        raise ValueError(f"{name}: пустой цикл {pattern!r}")
+    shift = cfg.get("shift")
+    if on and not shift:
+        raise ValueError(f"{name}: для pattern {pattern!r} нужен shift")
+    return [shift] * on + [OFF] * off
+
+
+class RotationEngine:
+    """Скомпилированные циклы всех сотрудников.
+
+    Циклы хранятся как коды смен в матрице (сотрудник × позиция цикла);
+    расписание на любой период считается одной векторной операцией.
+    """
+
+    def __init__(self, employees: dict, anchor_date: date, names: list[str] | None = None):
+        self.names = list(names if names is not None else employees.keys())
+        self.anchor_date = anchor_date
+        codes_by_shift = {OFF: 0}
+
+        cycles = []
+        for name in self.names:
+            cycle = _employee_cycle(name, employees[name])
+            cycles.append([codes_by_shift.setdefault(s, len(codes_by_shift)) for s in cycle])
+        self.vocab = list(codes_by_shift)
+
+        max_len = max((len(c) for c in cycles), default=1)
+        self.table = np.zeros((len(cycles), max_len), dtype=np.int16)
+        for i, cycle in enumerate(cycles):
+            self.table[i, : len(cycle)] = cycle
+        self.lengths = np.array([len(c) for c in cycles], dtype=np.int64)
+        self.anchors = np.array(
+            [int(employees[n].get("anchor_pos", 0)) for n in self.names], dtype=np.int64,
+        )
+        self._vocab_arr = np.array(self.vocab, dtype=object)
+
+    def codes(self, start: date, end: date) -> np.ndarray:
+        """Коды смен (сотрудник × день) за период [start, end]."""
+        days = (end - start).days + 1
+        if days <= 0 or not self.names:
+            return np.zeros((len(self.names), max(days, 0)), dtype=np.int16)
+        delta = np.arange(days, dtype=np.int64) + (start - self.anchor_date).days
+        idx = (self.anchors[:, None] + delta[None, :]) % self.lengths[:, None]
+        return np.take_along_axis(self.table, idx, axis=1)
+
+    def shifts(self, start: date, end: date) -> np.ndarray:
+        """Строки смен (сотрудник × день) за период."""
+        return self._vocab_arr[self.codes(start, end)]
+
+    def work_mask(self, start: date, end: date) -> np.ndarray:
+        return self.codes(start, end) != 0
+
+    def dates(self, start: date, end: date) -> list[date]:
+        return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> RotationEngine:
+    return RotationEngine(config.EMPLOYEES, config.ANCHOR_DATE, config.NAMES)
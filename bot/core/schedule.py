@@ -2,34 +2,34 @@ import re
 from datetime import date, datetime
 from calendar import monthrange
 
-from bot.config import EMPLOYEES, ANCHOR_DATE, MSK, NAMES
+from bot import config
+from bot.config import MSK
+from bot.core.rotation import OFF, get_engine
 
 
 def is_work_day(name: str, target_date: date) -> bool:
-    if name not in EMPLOYEES:
-        return False
-    delta = (target_date - ANCHOR_DATE).days
-    pos = (EMPLOYEES[name]["anchor_pos"] + delta) % 4
-    return pos in (0, 1)
+    return get_shift(name, target_date) != OFF
 
 
 def get_shift(name: str, target_date: date) -> str:
-    if is_work_day(name, target_date):
-        return EMPLOYEES[name]["shift"]
-    return "Выходной"
+    if name not in config.EMPLOYEES:
+        return OFF
+    engine = get_engine()
+    return engine.shifts(target_date, target_date)[engine.names.index(name), 0]
 
 
 def generate_month_updates(month_num: str, year: int) -> list:
-    updates = []
+    engine = get_engine()
     days_in_month = monthrange(year, int(month_num))[1]
+    shifts = engine.shifts(date(year, int(month_num), 1), date(year, int(month_num), days_in_month))
+    updates = []
     for day in range(1, days_in_month + 1):
-        d = date(year, int(month_num), day)
         day_z = str(day).zfill(2)
-        for name in NAMES:
+        for i, name in enumerate(engine.names):
             updates.append({
                 "name": name,
                 "date": f"{day_z}.{month_num}",
-                "time": get_shift(name, d),
+                "time": shifts[i, day - 1],
             })
     return updates
 
@@ -1,45 +1,84 @@
 import asyncio
+import contextvars
 import time
 from collections import defaultdict
+from functools import cache
 from datetime import datetime, timedelta
 from calendar import monthrange
 from concurrent.futures import ThreadPoolExecutor
 
-import gspread
-from google.oauth2.service_account import Credentials
-
+from bot import config
 from bot.config import (
-    SPREADSHEET_ID, SERVICE_ACCOUNT_PATH, CACHE_TTL, GC_CHECK_INTERVAL,
-    MONTHS_SHEETS, MONTHS_RU, MSK, NAMES, DAYS_RU, logger,
+    SPREADSHEET_ID, SERVICE_ACCOUNT_PATH, CACHE_TTL, GC_CHECK_INTERVAL, SHEETS_WORKERS,
+    MONTHS_SHEETS, MONTHS_RU, MSK, DAYS_RU,
+    MAX_PERIOD_DAYS, SCHEDULE_PAGE_DAYS, TEMPLATE_SHEET, COVERAGE_WARNINGS,
+    STATS_CACHE_TTL, OUTBOX_MAX_ATTEMPTS, logger,
 )
 from bot.core.schedule import (
     validate_time, col_index_to_letter, find_row_and_col, find_date_row,
 )
+from bot.core.coverage import analyze_month, edit_warning, with_next_days
+from bot.core.stats import aggregate
+from bot.core import outbox
+from bot.tracing import span, current_update_id
 from bot.state import (
-    sheets_cache, sheets_cache_time, history,
-    save_history_entry, delete_history_entry, invalidate_cache,
+    sheets_cache, sheets_cache_time, history, refresh_history,
+    save_history_entry, delete_history_entry, invalidate_cache, record_own_writes,
 )
 
 # ===================== КЛИЕНТ =====================
 
+# gspread и google-auth импортируются при первом подключении (см. _get_gspread_client)
 _gc = None
 _gc_last_check = 0.0
-_executor = ThreadPoolExecutor(max_workers=2)
+_spreadsheet = None
+_worksheets: dict[str, object] = {}
+_executor = ThreadPoolExecutor(max_workers=SHEETS_WORKERS)
+
+
+def _sheets_op(method: str, endpoint: str) -> str:
+    """Короткое имя вызова Sheets API для замеров: values:batchGet, batchUpdate, ..."""
+    rest = endpoint.split("?", 1)[0].split("/spreadsheets/", 1)[-1].split("/", 1)
+    if ":" in rest[0]:
+        return rest[0].split(":", 1)[1]
+    if len(rest) == 1:
+        return "metadata"
+    if rest[1].startswith("values:"):
+        return rest[1]
+    return f"values.{method.lower()}"
+
+
+@cache
+def _traced_http_client():
+    """HTTP-клиент gspread со спаном на каждый запрос к API."""
+    from gspread.http_client import HTTPClient
+
+    class _TracedHTTPClient(HTTPClient):
+        def request(self, method: str, endpoint: str, *args, **kwargs):
+            with span(f"sheets.{_sheets_op(method, endpoint)}"):
+                return super().request(method, endpoint, *args, **kwargs)
+
+    return _TracedHTTPClient
 
 
 def _get_gspread_client():
-    global _gc, _gc_last_check
+    global _gc, _gc_last_check, _spreadsheet
     now = time.time()
     if _gc and now - _gc_last_check < GC_CHECK_INTERVAL:
         return _gc
     try:
         logger.info("Переподключаюсь к Google Sheets...")
+        import gspread
+        from google.oauth2.service_account import Credentials
+
         creds = Credentials.from_service_account_file(
             SERVICE_ACCOUNT_PATH,
             scopes=["https://www.googleapis.com/auth/spreadsheets"],
         )
-        _gc = gspread.authorize(creds)
+        _gc = gspread.authorize(creds, http_client=_traced_http_client())
         _gc_last_check = now
+        _spreadsheet = None
+        _worksheets.clear()
         logger.info("Подключился к Google Sheets")
     except Exception as e:
         logger.error(f"Ошибка подключения к Google Sheets: {e}")
@@ -52,20 +91,19 @@ def shutdown_executor():
 
 
 async def run_in_executor(func, *args):
+    """Вызов в пуле потоков Sheets; contextvars (трейс апдейта) едут вместе с ним."""
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(_executor, func, *args)
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, ctx.run, func, *args)
 
 
 # ===================== СИНХРОННЫЕ ОПЕРАЦИИ =====================
 
 
-def _get_worksheet(month: str):
-    sheet_name = MONTHS_SHEETS.get(month)
-    if not sheet_name:
-        raise ValueError(f"Нет листа для месяца {month}")
+def _with_retry(fn, *args):
     for attempt in range(5):
         try:
-            return _get_gspread_client().open_by_key(SPREADSHEET_ID).worksheet(sheet_name), sheet_name
+            return fn(*args)
         except Exception as e:
             if "429" in str(e) and attempt < 4:
                 wait = 2 ** attempt
@@ -75,21 +113,129 @@ def _get_worksheet(month: str):
                 raise
 
 
-def _get_sheet_data(month: str):
+def _get_worksheet(month: str):
+    """Хэндл листа; открытие стоит запроса метаданных, поэтому хэндлы живут
+    до переподключения клиента (GC_CHECK_INTERVAL)."""
+    sheet_name = MONTHS_SHEETS.get(month)
+    if not sheet_name:
+        raise ValueError(f"Нет листа для месяца {month}")
+    ws = _worksheets.get(month)
+    if ws is None:
+        ws = _worksheets[month] = _with_retry(lambda: _get_spreadsheet().worksheet(sheet_name))
+    return ws, sheet_name
+
+
+def _get_spreadsheet():
+    global _spreadsheet
+    gc = _get_gspread_client()
+    if _spreadsheet is None:
+        _spreadsheet = _with_retry(lambda: gc.open_by_key(SPREADSHEET_ID))
+    return _spreadsheet
+
+
+# Последние прочитанные данные листов — ими отвечаем, пока Sheets недоступна
+_last_values: dict[str, list] = {}
+
+
+def _fetch_months(months: list[str]) -> dict[str, list | None]:
+    """Листы из таблицы одним values:batchGet; None — лист не прочитан."""
+    from gspread.utils import fill_gaps
+
+    result: dict[str, list | None] = {}
+    try:
+        spreadsheet = _get_spreadsheet()
+        resp = _with_retry(spreadsheet.values_batch_get, [f"'{MONTHS_SHEETS[m]}'" for m in months])
+        for month, value_range in zip(months, resp.get("valueRanges", [])):
+            result[month] = fill_gaps(value_range.get("values", []))
+    except Exception as e:
+        # batchGet падает целиком, если хотя бы одного листа нет — читаем по одному
+        logger.warning(f"batchGet по {months} не удался ({e}), читаю листы по одному")
+        for month in months:
+            try:
+                ws, _ = _get_worksheet(month)
+                result[month] = ws.get_all_values()
+            except Exception as e2:
+                logger.error(f"Не удалось загрузить лист {month}: {e2}")
+                _worksheets.pop(month, None)
+                result[month] = None
+    for month, values in result.items():
+        if values is not None:
+            _last_values[month] = values
+    return result
+
+
+def _get_months_values(
+    months: list[str], fresh: bool = False, max_age: float = CACHE_TTL, raw: bool = False,
+) -> dict[str, list | None]:
+    """Данные нескольких листов: свежие — из кэша, остальные одним values:batchGet.
+
+    max_age — сколько секунд кэш считается свежим; правки через бота сбрасывают
+    кэш месяца сразу, так что длинный max_age теряет только внешние правки.
+    Без raw поверх таблицы лежат ещё не записанные правки из outbox, а лист,
+    который не удалось прочитать, отдаётся в последнем прочитанном виде.
+    """
     now = time.time()
-    if month in sheets_cache and now - sheets_cache_time.get(month, 0) < CACHE_TTL:
-        return sheets_cache[month], None
+    result: dict[str, list | None] = {}
+    missing = []
+    for month in dict.fromkeys(months):
+        if not fresh and month in sheets_cache and now - sheets_cache_time.get(month, 0) < max_age:
+            result[month] = sheets_cache[month]
+        elif month in MONTHS_SHEETS:
+            missing.append(month)
+        else:
+            result[month] = None
+
+    if missing:
+        for month, values in _fetch_months(missing).items():
+            if values is not None:
+                sheets_cache[month] = values
+                sheets_cache_time[month] = now
+            elif not raw and month in _last_values:
+                logger.warning(f"Лист {month} недоступен — отдаю последние прочитанные данные")
+                values = _last_values[month]
+            result[month] = values
+
+    if raw:
+        return result
+    return {m: outbox.overlay(m, v) if v is not None else None for m, v in result.items()}
+
+
+def _get_sheet_data(month: str):
+    data = _get_months_values([month])[month]
+    if data is None:
+        return None, f"лист {month} не прочитан"
+    return data, None
+
+
+def _coverage_warning(all_values: list, changes: list[tuple], year: int) -> str:
+    """Проверка покрытия до записи: changes — [(row, col, значение, "DD.MM")]."""
+    if not COVERAGE_WARNINGS or not changes:
+        return ""
     try:
-        ws, _ = _get_worksheet(month)
-        data = ws.get_all_values()
-        sheets_cache[month] = data
-        sheets_cache_time[month] = now
-        return data, ws
+        after = [list(row) for row in all_values]
+        for row, col, value, _ in changes:
+            after[row].extend([""] * (col + 1 - len(after[row])))
+            after[row][col] = value
+        dates = with_next_days({c[3] for c in changes}, year)
+        warning = edit_warning(all_values, after, dates)
+        return f"\n{warning}" if warning else ""
     except Exception as e:
-        return None, str(e)
+        logger.warning(f"Не удалось проверить покрытие: {e}")
+        return ""
 
 
-def _update_sheet(name: str, date_str: str, new_time: str, is_undo: bool = False) -> str:
+def _cell_value(all_values: list, row: int, col: int) -> str:
+    return all_values[row][col] if col < len(all_values[row]) else ""
+
+
+def _update_sheet(
+    name: str, date_str: str, new_time: str, is_undo: bool = False, chat_id: int | None = None,
+) -> str:
+    """Правка ячейки. Новое значение не пишется в таблицу сразу, а ложится в
+    outbox (см. _flush_outbox_sync) — ответ пользователю не ждёт Sheets.
+
+    Откат пишет в таблицу сам, сняв незаписанные правки этой ячейки.
+    """
     try:
         parts = date_str.split(".")
         day = int(parts[0])
@@ -101,58 +247,81 @@ def _update_sheet(name: str, date_str: str, new_time: str, is_undo: bool = False
         if not is_undo and not validate_time(new_time):
             return f"❌ Некорректный формат времени: {new_time}"
 
-        ws, _ = _get_worksheet(month_num)
-        all_values = ws.get_all_values()
-        row_index, col_index = find_row_and_col(all_values, day, month_num, name, year)
-
-        if row_index is None:
-            return f"❌ Не нашёл дату '{day_z}.{month_z}.{year}'"
-        if col_index is None:
-            return f"❌ Не нашёл имя '{name}'"
-
         history_key = f"{name}_{date_str}"
 
         if is_undo:
+            outbox.discard(name, date_str)
+            ws, _ = _get_worksheet(month_z)
+            all_values = ws.get_all_values()
+            row_index, col_index = find_row_and_col(all_values, day, month_z, name, year)
+            if row_index is None:
+                return f"❌ Не нашёл дату '{day_z}.{month_z}.{year}'"
+            if col_index is None:
+                return f"❌ Не нашёл имя '{name}'"
+            refresh_history()
             if history_key in history:
                 entry = history[history_key]
                 old_value = entry["old"] if isinstance(entry, dict) else entry
+                warning = _coverage_warning(
+                    all_values, [(row_index, col_index, old_value, f"{day_z}.{month_z}")], year,
+                )
+                record_own_writes([(name, date_str, old_value)])
                 ws.update_cell(row_index + 1, col_index + 1, old_value)
-                invalidate_cache(month_num)
+                invalidate_cache(month_z)
                 delete_history_entry(history_key)
-                return f"↩️ Восстановлено! {name} / {day_z}.{month_z}.{year} → {old_value}"
+                return f"↩️ Восстановлено! {name} / {day_z}.{month_z}.{year} → {old_value}{warning}"
             return f"❌ Нет сохранённого значения для {name} / {day_z}.{month_z}.{year}"
 
-        current_value = all_values[row_index][col_index]
+        all_values = _get_months_values([month_z])[month_z]
+        if all_values is None:
+            return f"❌ Не удалось загрузить лист {MONTHS_RU.get(month_z, month_z)}"
+        row_index, col_index = find_row_and_col(all_values, day, month_z, name, year)
+        if row_index is None:
+            return f"❌ Не нашёл дату '{day_z}.{month_z}.{year}'"
+        if col_index is None:
+            return f"❌ Не нашёл имя '{name}'"
+
+        current_value = _cell_value(all_values, row_index, col_index)
+        warning = _coverage_warning(
+            all_values, [(row_index, col_index, new_time, f"{day_z}.{month_z}")], year,
+        )
         save_history_entry(history_key, current_value, new_time)
-        ws.update_cell(row_index + 1, col_index + 1, new_time)
-        invalidate_cache(month_num)
-        return f"✅ {name} / {day_z}.{month_z} → {new_time} _(было: {current_value})_"
+        outbox.enqueue([{
+            "month": month_z, "name": name, "date": f"{day_z}.{month_z}", "key": history_key,
+            "value": new_time, "expected": current_value,
+        }], current_update_id(), chat_id)
+        invalidate_cache(month_z)
+        return f"✅ {name} / {day_z}.{month_z} → {new_time} _(было: {current_value})_{warning}"
 
     except Exception as e:
         logger.error(f"Ошибка в update_sheet: {e}", exc_info=True)
         return f"❌ Ошибка: {e}"
 
 
-def _batch_update_sheet(updates: list) -> list:
+def _batch_update_sheet(updates: list, chat_id: int | None = None) -> list:
+    """Несколько правок: одно чтение всех месяцев, правки — в outbox одной пачкой."""
     by_month: dict[str, list] = defaultdict(list)
     for u in updates:
-        month_num = u["date"].split(".")[1]
+        month_num = u["date"].split(".")[1].zfill(2)
         by_month[month_num].append(u)
 
     results = []
+    edits = []
+    month_values = _get_months_values(list(by_month))
+    year = datetime.now(MSK).year
     for month_num, month_updates in by_month.items():
+        all_values = month_values.get(month_num)
+        if all_values is None:
+            results.append(f"❌ Не удалось загрузить лист {MONTHS_RU.get(month_num, month_num)}")
+            continue
         try:
-            ws, _ = _get_worksheet(month_num)
-            all_values = ws.get_all_values()
-            year = datetime.now(MSK).year
-            batch = []
+            changes = []
             for u in month_updates:
                 name = u["name"]
                 date_str = u["date"]
                 new_time = u["time"]
                 day = int(date_str.split(".")[0])
                 day_z = str(day).zfill(2)
-                month_z = month_num.zfill(2)
 
                 if not validate_time(new_time):
                     results.append(f"❌ Некорректный формат для {name}: {new_time}")
@@ -160,158 +329,429 @@ def _batch_update_sheet(updates: list) -> list:
 
                 row_index, col_index = find_row_and_col(all_values, day, month_num, name, year)
                 if row_index is None:
-                    results.append(f"❌ Не нашёл дату '{day_z}.{month_z}' для {name}")
+                    results.append(f"❌ Не нашёл дату '{day_z}.{month_num}' для {name}")
                     continue
                 if col_index is None:
                     results.append(f"❌ Не нашёл имя '{name}'")
                     continue
 
-                current_value = all_values[row_index][col_index]
+                # Все правки одной ячейки в пачке видят значение из таблицы:
+                # история и откат вернут то, что было до пачки
+                current_value = _cell_value(all_values, row_index, col_index)
                 save_history_entry(f"{name}_{date_str}", current_value, new_time)
-                col_letter = col_index_to_letter(col_index)
-                batch.append({"range": f"{col_letter}{row_index + 1}", "values": [[new_time]]})
-                results.append(f"✅ {name} / {day_z}.{month_z} → {new_time} _(было: {current_value})_")
-
-            if batch:
-                ws.batch_update(batch)
-                invalidate_cache(month_num)
-                logger.info(f"Батч: {len(batch)} ячеек в месяце {month_num}")
+                u["old"] = current_value
+                edits.append({
+                    "month": month_num, "name": name, "date": f"{day_z}.{month_num}",
+                    "key": f"{name}_{date_str}", "value": new_time, "expected": current_value,
+                })
+                changes.append((row_index, col_index, new_time, f"{day_z}.{month_num}"))
+                results.append(f"✅ {name} / {day_z}.{month_num} → {new_time} _(было: {current_value})_")
+
+            if changes:
+                warning = _coverage_warning(all_values, changes, year)
+                if warning:
+                    results.append(warning.strip())
         except Exception as e:
             logger.error(f"Ошибка batch_update месяц {month_num}: {e}", exc_info=True)
             results.append(f"❌ Ошибка для месяца {month_num}: {e}")
+
+    if edits:
+        outbox.enqueue(edits, current_update_id(), chat_id)
+        for month_num in {e["month"] for e in edits}:
+            invalidate_cache(month_num)
+        logger.info(f"Батч: {len(edits)} ячеек в outbox")
     return results
 
 
-def _create_month_sheet(month_num: str, year: int):
-    sheet_name = MONTHS_SHEETS.get(month_num)
-    if not sheet_name:
-        raise ValueError(f"Нет названия листа для месяца {month_num}")
-    month_name_ru = MONTHS_RU.get(month_num, sheet_name)
-    days_in_month = monthrange(year, int(month_num))[1]
+def _flush_outbox_sync() -> tuple[int, list[dict], int]:
+    """Записывает outbox в таблицу одним values:batchUpdate.
+
+    Правки одной ячейки схлопываются в последнюю. Ячейка пишется, только если
+    в таблице всё ещё значение, которое видел автор первой правки; если там уже
+    итоговое значение — правка просто подтверждается (повторная запись после
+    сбоя). Иначе ячейку успели поправить мимо бота: правка снимается, запись в
+    истории удаляется, а запись попадает в конфликты. Правки листа, который не
+    прочитался, остаются в outbox, но попытка засчитывается: после
+    OUTBOX_MAX_ATTEMPTS они тоже снимаются и попадают в конфликты ("unreadable").
 
-    spreadsheet = _get_gspread_client().open_by_key(SPREADSHEET_ID)
-    ws = spreadsheet.add_worksheet(title=sheet_name, rows=days_in_month + 5, cols=len(NAMES) + 1)
-    logger.info(f"Создан лист: {sheet_name}")
+    → (записано ячеек, конфликты [{...правка, "remote"}], осталось из-за
+    непрочитанных листов). Пока outbox пишет другой воркер, ничего не делает —
+    правки останутся на следующий раз.
+    """
+    with outbox.flushing() as acquired:
+        if not acquired:
+            return 0, [], 0
+        return _flush_outbox_locked()
 
-    header1 = [""] + [month_name_ru] + [""] * (len(NAMES) - 1)
-    header2 = [""] + NAMES
-    ws.update("A1", [header1, header2])
 
-    date_col = [[f"{str(day).zfill(2)}.{month_num}.{year}"] for day in range(1, days_in_month + 1)]
-    ws.update("A3", date_col)
-    invalidate_cache(month_num)
-    logger.info(f"Лист {sheet_name} создан: {days_in_month} дней")
-    return ws
+def _flush_outbox_locked() -> tuple[int, list[dict], int]:
+    cells: dict[tuple, list] = defaultdict(list)
+    for e in outbox.pending():
+        cells[(e["month"], e["name"], e["date"])].append(e)
+    if not cells:
+        return 0, [], 0
 
+    month_values = _get_months_values(list({m for m, _, _ in cells}), fresh=True, raw=True)
 
-def _execute_fill_sync(updates: list, month_num: str) -> tuple[int, list[str]]:
+    year = datetime.now(MSK).year
+    data, own, done, conflicts = [], [], set(), []
+    unread: dict[tuple, list] = {}
+    written_months = set()
+    for (month, name, date_str), entries in cells.items():
+        all_values = month_values.get(month)
+        if all_values is None:
+            unread[(month, name, date_str)] = entries
+            continue
+        base, final = entries[0]["expected"].strip(), entries[-1]["value"]
+        row_index, col_index = find_row_and_col(all_values, int(date_str.split(".")[0]), month, name, year)
+        remote = None
+        if row_index is not None and col_index is not None:
+            remote = _cell_value(all_values, row_index, col_index).strip()
+        if remote == final.strip():
+            pass
+        elif remote == base:
+            col_letter = col_index_to_letter(col_index)
+            data.append({"range": f"'{MONTHS_SHEETS[month]}'!{col_letter}{row_index + 1}", "values": [[final]]})
+            own.append((name, date_str, final))
+            written_months.add(month)
+        else:
+            conflicts.append({**entries[-1], "remote": remote})
+        done.update(e["id"] for e in entries)
+
+    if data:
+        record_own_writes(own)
+        _with_retry(_get_spreadsheet().values_batch_update, {"valueInputOption": "RAW", "data": data})
+        logger.info(f"[OUTBOX] записано {len(data)} ячеек в месяцах {', '.join(sorted(written_months))}")
+    # Кэш сбрасывается до подтверждения: иначе между ними читался бы старый лист без правок
+    for month in written_months:
+        invalidate_cache(month)
+    outbox.ack(done)
+
+    left = 0
+    if unread:
+        dropped = {e["id"] for e in outbox.retry_later({e["id"] for es in unread.values() for e in es})}
+        for (month, name, date_str), entries in unread.items():
+            if any(e["id"] in dropped for e in entries):
+                outbox.discard(name, date_str)  # более поздние правки той же ячейки — вместе с первой
+                conflicts.append({**entries[-1], "remote": None, "unreadable": True})
+            else:
+                left += len(entries)
+        logger.warning(f"[OUTBOX] не прочитаны листы {', '.join(sorted({m for m, _, _ in unread}))}, "
+                       f"ждут следующей попытки правок: {left}")
+
+    for c in conflicts:
+        delete_history_entry(c["key"], if_new=c["value"])
+        invalidate_cache(c["month"])
+        if c.get("unreadable"):
+            logger.warning(f"[OUTBOX] {c['name']} / {c['date']}: лист не читается {OUTBOX_MAX_ATTEMPTS} попыток, "
+                           f"правка {c['value']!r} снята")
+            continue
+        logger.warning(f"[OUTBOX] конфликт {c['name']} / {c['date']}: в таблице {c['remote']!r}, "
+                       f"правка {c['value']!r} снята")
+    return len(data), conflicts, left
+
+
+def _find_missing_sheets(months: list[str]) -> list[str]:
+    """Месяцы без листа — по одному запросу метаданных таблицы."""
+    meta = _with_retry(_get_spreadsheet().fetch_sheet_metadata, {"fields": "sheets.properties.title"})
+    titles = {sh["properties"]["title"] for sh in meta.get("sheets", [])}
+    return [m for m in months if MONTHS_SHEETS.get(m) not in titles]
+
+
+def _create_month_sheets(months: list[str], year: int) -> list[str]:
+    """Создаёт листы месяцев одним batchUpdate и пишет шапки/даты одним запросом.
+
+    Если задан TEMPLATE_SHEET и он есть в таблице, листы дублируются из него
+    (форматирование и ширины колонок), иначе создаются пустые.
+    """
+    if not months:
+        return []
+    for m in months:
+        if m not in MONTHS_SHEETS:
+            raise ValueError(f"Нет названия листа для месяца {m}")
+
+    spreadsheet = _get_spreadsheet()
+    template_id = None
+    if TEMPLATE_SHEET:
+        meta = _with_retry(spreadsheet.fetch_sheet_metadata, {"fields": "sheets.properties"})
+        for sh in meta.get("sheets", []):
+            if sh["properties"]["title"] == TEMPLATE_SHEET:
+                template_id = sh["properties"]["sheetId"]
+        if template_id is None:
+            logger.warning(f"Шаблон {TEMPLATE_SHEET!r} не найден, создаю пустые листы")
+
+    requests = []
+    for m in months:
+        days_in_month = monthrange(year, int(m))[1]
+        if template_id is not None:
+            requests.append({"duplicateSheet": {"sourceSheetId": template_id, "newSheetName": MONTHS_SHEETS[m]}})
+        else:
+            requests.append({"addSheet": {"properties": {
+                "title": MONTHS_SHEETS[m],
+                "gridProperties": {"rowCount": days_in_month + 5, "columnCount": len(config.NAMES) + 1},
+            }}})
+    _with_retry(spreadsheet.batch_update, {"requests": requests})
+
+    data = []
+    for m in months:
+        sheet_name = MONTHS_SHEETS[m]
+        days_in_month = monthrange(year, int(m))[1]
+        header1 = [""] + [MONTHS_RU.get(m, sheet_name)] + [""] * (len(config.NAMES) - 1)
+        header2 = [""] + config.NAMES
+        # 31 строка: лишние строки шаблона короткого месяца очищаются
+        date_col = [
+            [f"{str(day).zfill(2)}.{m}.{year}" if day <= days_in_month else ""]
+            for day in range(1, 32 if template_id is not None else days_in_month + 1)
+        ]
+        data.append({"range": f"'{sheet_name}'!A1", "values": [header1, header2]})
+        data.append({"range": f"'{sheet_name}'!A3", "values": date_col})
+    _with_retry(spreadsheet.values_batch_update, {"valueInputOption": "RAW", "data": data})
+
+    for m in months:
+        invalidate_cache(m)
+    logger.info(f"Созданы листы: {', '.join(MONTHS_SHEETS[m] for m in months)}")
+    return [MONTHS_SHEETS[m] for m in months]
+
+
+def _sheet_ids(spreadsheet) -> dict[str, int]:
+    meta = _with_retry(spreadsheet.fetch_sheet_metadata, {"fields": "sheets.properties"})
+    return {sh["properties"]["title"]: sh["properties"]["sheetId"] for sh in meta.get("sheets", [])}
+
+
+def _fill_format_request(sheet_id: int, row: int, col: int, is_off: bool) -> dict:
+    # Заливка: зелёный — рабочий день, красный — выходной
+    bg = {"red": 1, "green": 0.8, "blue": 0.8} if is_off else {"red": 0.8, "green": 1, "blue": 0.8}
+    return {
+        "repeatCell": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": row,
+                "endRowIndex": row + 1,
+                "startColumnIndex": col,
+                "endColumnIndex": col + 1,
+            },
+            "cell": {
+                "userEnteredFormat": {
+                    "backgroundColor": bg,
+                }
+            },
+            "fields": "userEnteredFormat.backgroundColor",
+        }
+    }
+
+
+def _execute_fill_sync(updates: list) -> tuple[int, list[str]]:
+    """Заполняет любое число месяцев: одно чтение, одна запись значений, одна заливка.
+
+    В каждый update дописывается "old" — прежнее значение ячейки для отката.
+    """
     by_month: dict[str, list] = defaultdict(list)
     for u in updates:
         by_month[u["date"].split(".")[1]].append(u)
 
     total_ok = 0
     total_err = []
+    try:
+        spreadsheet = _get_spreadsheet()
+        month_values = _get_months_values(list(by_month), fresh=True, raw=True)
+        sheet_ids = _sheet_ids(spreadsheet)
+    except Exception as e:
+        logger.error(f"Ошибка подготовки fill: {e}", exc_info=True)
+        return 0, [f"❌ Ошибка: {e}"]
 
+    data = []
+    own = []
+    fmt_requests = []
+    filled_months = []
     for mn, month_updates in by_month.items():
-        try:
-            ws, _ = _get_worksheet(mn)
-            all_values = ws.get_all_values()
-            if len(all_values) < 2:
-                total_err.append(f"❌ Лист {mn} пустой — нет заголовков")
+        all_values = month_values.get(mn)
+        sheet_name = MONTHS_SHEETS.get(mn)
+        if all_values is None or sheet_name not in sheet_ids:
+            total_err.append(f"❌ Лист {mn} не найден")
+            continue
+        if len(all_values) < 2:
+            total_err.append(f"❌ Лист {mn} пустой — нет заголовков")
+            continue
+
+        header = all_values[1]
+        col_map = {cell.strip(): j for j, cell in enumerate(header) if cell.strip()}
+        row_map = {}
+        for i, row in enumerate(all_values):
+            if not row or not row[0].strip():
                 continue
+            parts = row[0].strip().replace("/", ".").split(".")
+            if len(parts) >= 2:
+                row_map[f"{parts[0].zfill(2)}.{parts[1].zfill(2)}"] = i
+
+        count = 0
+        for u in month_updates:
+            name = u["name"]
+            day_z, month_z = u["date"].split(".")
+            new_time = u["time"]
+            short_key = f"{day_z}.{month_z}"
+            row_index = row_map.get(short_key)
+            col_index = col_map.get(name)
+            if row_index is None:
+                total_err.append(f"❌ Дата {short_key} не найдена для {name}")
+                continue
+            if col_index is None:
+                total_err.append(f"❌ Столбец {name} не найден")
+                continue
+            row_data = all_values[row_index]
+            u["old"] = row_data[col_index] if col_index < len(row_data) else ""
+            col_letter = col_index_to_letter(col_index)
+            data.append({"range": f"'{sheet_name}'!{col_letter}{row_index + 1}", "values": [[new_time]]})
+            own.append((name, short_key, new_time))
+            fmt_requests.append(
+                _fill_format_request(sheet_ids[sheet_name], row_index, col_index, new_time == "Выходной")
+            )
+            count += 1
+        total_ok += count
+        if count:
+            filled_months.append(mn)
+
+    if not data:
+        return total_ok, total_err
+    record_own_writes(own)
+    try:
+        _with_retry(spreadsheet.values_batch_update, {"valueInputOption": "RAW", "data": data})
+        logger.info(f"fill: {len(data)} ячеек в месяцах {', '.join(filled_months)}")
+    except Exception as e:
+        logger.error(f"Ошибка записи fill: {e}", exc_info=True)
+        return 0, total_err + [f"❌ Ошибка записи: {e}"]
+    finally:
+        for mn in filled_months:
+            invalidate_cache(mn)
+    # Значения уже в таблице — без заливки заполнение всё равно состоялось
+    try:
+        _with_retry(spreadsheet.batch_update, {"requests": fmt_requests})
+    except Exception as e:
+        logger.error(f"Ошибка заливки fill: {e}", exc_info=True)
+        total_err.append(f"⚠️ Значения записаны, но не удалось раскрасить ячейки: {e}")
+    return total_ok, total_err
 
-            header = all_values[1]
-            col_map = {cell.strip(): j for j, cell in enumerate(header) if cell.strip()}
-            row_map = {}
-            for i, row in enumerate(all_values):
-                if not row or not row[0].strip():
-                    continue
-                parts = row[0].strip().replace("/", ".").split(".")
-                if len(parts) >= 2:
-                    row_map[f"{parts[0].zfill(2)}.{parts[1].zfill(2)}"] = i
 
-            batch = []
-            format_cells = []
-            for u in month_updates:
-                name = u["name"]
-                day_z, month_z = u["date"].split(".")
-                new_time = u["time"]
-                short_key = f"{day_z}.{month_z}"
-                row_index = row_map.get(short_key)
-                col_index = col_map.get(name)
-                if row_index is None:
-                    total_err.append(f"❌ Дата {short_key} не найдена для {name}")
-                    continue
-                if col_index is None:
-                    total_err.append(f"❌ Столбец {name} не найден")
-                    continue
-                col_letter = col_index_to_letter(col_index)
-                batch.append({"range": f"{col_letter}{row_index + 1}", "values": [[new_time]]})
-                format_cells.append((row_index, col_index, new_time == "Выходной"))
-                total_ok += 1
-
-            if batch:
-                ws.batch_update(batch)
-                # Заливка: зелёный — рабочий день, красный — выходной
-                fmt_requests = []
-                for row, col, is_off in format_cells:
-                    bg = {"red": 1, "green": 0.8, "blue": 0.8} if is_off else {"red": 0.8, "green": 1, "blue": 0.8}
-                    fmt_requests.append({
-                        "repeatCell": {
-                            "range": {
-                                "sheetId": ws.id,
-                                "startRowIndex": row,
-                                "endRowIndex": row + 1,
-                                "startColumnIndex": col,
-                                "endColumnIndex": col + 1,
-                            },
-                            "cell": {
-                                "userEnteredFormat": {
-                                    "backgroundColor": bg,
-                                }
-                            },
-                            "fields": "userEnteredFormat.backgroundColor",
-                        }
-                    })
-                if fmt_requests:
-                    ws.spreadsheet.batch_update({"requests": fmt_requests})
-                invalidate_cache(mn)
-                logger.info(f"fill: {len(batch)} ячеек в {mn}")
+def _batch_undo_sheet(updates: list) -> list[str]:
+    """Откатывает массовое обновление или заполнение одной записью значений.
+
+    Прежнее значение берётся из update["old"], иначе — из истории. Запись
+    истории удаляется, только если откатывается именно она: значение взято из
+    неё или её "new" совпадает с откатываемым (иначе это более ранняя
+    одиночная правка той же ячейки, например до заполнения).
+    """
+    by_month: dict[str, list] = defaultdict(list)
+    for u in updates:
+        by_month[u["date"].split(".")[1]].append(u)
 
+    results = []
+    try:
+        spreadsheet = _get_spreadsheet()
+        month_values = _get_months_values(list(by_month), fresh=True, raw=True)
+    except Exception as e:
+        logger.error(f"Ошибка подготовки отката: {e}", exc_info=True)
+        return [f"❌ Ошибка: {e}"]
+
+    refresh_history()
+    year = datetime.now(MSK).year
+    data = []
+    own = []
+    restored_keys = []
+    for month_num, month_updates in by_month.items():
+        all_values = month_values.get(month_num)
+        if all_values is None:
+            results.append(f"❌ Лист {month_num} не найден")
+            continue
+        sheet_name = MONTHS_SHEETS[month_num]
+        for u in month_updates:
+            name, date_str = u["name"], u["date"]
+            history_key = f"{name}_{date_str}"
+            outbox.discard(name, date_str)
+            entry = history.get(history_key)
+            if "old" in u:
+                old_value = u["old"]
+                owns_entry = isinstance(entry, dict) and entry.get("new") == u.get("time") != old_value
+            elif entry is not None:
+                old_value = entry["old"] if isinstance(entry, dict) else entry
+                owns_entry = True
+            else:
+                results.append(f"❌ Нет сохранённого значения для {name} / {date_str}")
+                continue
+            day = int(date_str.split(".")[0])
+            row_index, col_index = find_row_and_col(all_values, day, month_num, name, year)
+            if row_index is None or col_index is None:
+                results.append(f"❌ Не нашёл ячейку {name} / {date_str}")
+                continue
+            col_letter = col_index_to_letter(col_index)
+            data.append({"range": f"'{sheet_name}'!{col_letter}{row_index + 1}", "values": [[old_value]]})
+            own.append((name, date_str, old_value))
+            if owns_entry:
+                restored_keys.append(history_key)
+            results.append(f"↩️ {name} / {date_str} → {old_value or '—'}")
+
+    if data:
+        record_own_writes(own)
+        try:
+            _with_retry(spreadsheet.values_batch_update, {"valueInputOption": "RAW", "data": data})
         except Exception as e:
-            logger.error(f"Ошибка fill {mn}: {e}", exc_info=True)
-            total_err.append(f"❌ Ошибка месяца {mn}: {e}")
+            logger.error(f"Ошибка отката: {e}", exc_info=True)
+            return [f"❌ Ошибка отката: {e}"]
+        finally:
+            for month_num in by_month:
+                invalidate_cache(month_num)
+        for key in restored_keys:
+            delete_history_entry(key)
+        logger.info(f"Откат: {len(data)} ячеек")
+    return results
 
-    return total_ok, total_err
+
+def month_snapshot(all_values: list) -> dict:
+    """Снимок одного листа: {"Имя_дата": значение}."""
+    result = {}
+    if len(all_values) < 2:
+        return result
+    headers = all_values[1]
+    for row in all_values[2:]:
+        if not row or not row[0].strip():
+            continue
+        date_key = row[0].strip()
+        for col_idx, name in enumerate(headers):
+            if not name.strip() or col_idx >= len(row):
+                continue
+            result[f"{name.strip()}_{date_key}"] = row[col_idx].strip()
+    return result
+
+
+def _get_month_snapshots_sync(months: list[str]) -> dict[str, dict | None]:
+    """Свежие снимки листов одним batchGet; None — лист не прочитан."""
+    values = _get_months_values(months, fresh=True, raw=True)
+    return {m: month_snapshot(v) if v is not None else None for m, v in values.items()}
 
 
 def _get_current_snapshot_sync() -> dict:
-    result = {}
     today = datetime.now(MSK)
     prev_month = (today.replace(day=1) - timedelta(days=1)).strftime("%m")
     curr_month = today.strftime("%m")
     next_month = (today.replace(day=1) + timedelta(days=32)).strftime("%m")
-    for month_num in {prev_month, curr_month, next_month}:
-        try:
-            ws, _ = _get_worksheet(month_num)
-            all_values = ws.get_all_values()
-            if len(all_values) < 2:
-                continue
-            headers = all_values[1]
-            for row in all_values[2:]:
-                if not row or not row[0].strip():
-                    continue
-                date_key = row[0].strip()
-                for col_idx, name in enumerate(headers):
-                    if not name.strip() or col_idx >= len(row):
-                        continue
-                    result[f"{name.strip()}_{date_key}"] = row[col_idx].strip()
-        except Exception as e:
-            logger.error(f"Ошибка снимка месяц {month_num}: {e}")
+    result = {}
+    for month_num, part in _get_month_snapshots_sync([prev_month, curr_month, next_month]).items():
+        if part is None:
+            logger.error(f"Ошибка снимка месяц {month_num}")
+            continue
+        result.update(part)
     return result
 
 
-def _get_schedule_for_period_sync(date_from_str: str, date_to_str: str):
+def _warmup_sync() -> int:
+    """Подключение, хэндл листа и данные текущего месяца — до первого запроса."""
+    month = datetime.now(MSK).strftime("%m")
+    _get_worksheet(month)
+    values = _get_months_values([month])[month]
+    if values is None:
+        raise RuntimeError(f"лист {MONTHS_SHEETS[month]} не прочитан")
+    return len(values)
+
+
+def _parse_period(date_from_str: str, date_to_str: str, max_days: int):
     year = datetime.now(MSK).year
     try:
         d1 = datetime.strptime(f"{date_from_str}.{year}", "%d.%m.%Y")
@@ -320,27 +760,24 @@ def _get_schedule_for_period_sync(date_from_str: str, date_to_str: str):
         return None, None, "❌ Неверный формат дат"
     if d2 < d1:
         return None, None, "❌ Конечная дата раньше начальной"
-    if (d2 - d1).days > 31:
-        return None, None, "❌ Период не может быть больше 31 дня"
+    if (d2 - d1).days > max_days:
+        days_word = "дня" if max_days % 10 == 1 and max_days % 100 != 11 else "дней"
+        return None, None, f"❌ Период не может быть больше {max_days} {days_word}"
+    return d1, d2, None
+
 
-    month_cache = {}
+def _collect_rows(d1: datetime, d2: datetime, month_values: dict) -> tuple[list | None, list]:
+    year = d1.year
     all_rows = []
     all_headers = None
     current = d1
     while current <= d2:
         month_num = current.strftime("%m")
         day_z = current.strftime("%d")
-        if month_num not in month_cache:
-            try:
-                ws, _ = _get_worksheet(month_num)
-                month_cache[month_num] = ws.get_all_values()
-            except Exception as e:
-                logger.error(f"Не удалось загрузить лист {month_num}: {e}")
-                month_cache[month_num] = None
-        if month_cache[month_num] is None:
+        all_values = month_values.get(month_num)
+        if not all_values or len(all_values) < 2:
             current += timedelta(days=1)
             continue
-        all_values = month_cache[month_num]
         if all_headers is None:
             all_headers = [c.strip() for c in all_values[1][1:] if c.strip()]
 
@@ -354,10 +791,44 @@ def _get_schedule_for_period_sync(date_from_str: str, date_to_str: str):
                 "values": values,
             })
         current += timedelta(days=1)
+    return all_headers, all_rows
+
+
+def _period_months(d1: datetime, d2: datetime) -> list[str]:
+    months = []
+    current = d1.replace(day=1)
+    while current <= d2:
+        months.append(current.strftime("%m"))
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def _page_bounds(d1: datetime, d2: datetime) -> list[tuple[datetime, datetime]]:
+    """Страницы длинного периода: по месяцам или по SCHEDULE_PAGE_DAYS дней."""
+    pages = []
+    start = d1
+    while start <= d2:
+        if SCHEDULE_PAGE_DAYS > 0:
+            end = start + timedelta(days=SCHEDULE_PAGE_DAYS - 1)
+        else:
+            end = (start.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        end = min(end, d2)
+        pages.append((start, end))
+        start = end + timedelta(days=1)
+    return pages
+
 
+def _get_schedule_for_period_sync(date_from_str: str, date_to_str: str):
+    d1, d2, err = _parse_period(date_from_str, date_to_str, 31)
+    if err:
+        return None, None, err
+
+    month_values = _get_months_values(_period_months(d1, d2))
+    all_headers, all_rows = _collect_rows(d1, d2, month_values)
     if not all_rows:
         return None, None, "❌ Не нашёл данные за этот период"
 
+    year = d1.year
     title = (
         f"Расписание на {date_from_str}.{year}"
         if d1 == d2
@@ -366,12 +837,65 @@ def _get_schedule_for_period_sync(date_from_str: str, date_to_str: str):
     return title, all_headers, all_rows
 
 
-def _check_worksheet_exists(month_num: str) -> bool:
-    try:
-        _get_worksheet(month_num)
-        return True
-    except Exception:
-        return False
+def _get_schedule_pages_sync(date_from_str: str, date_to_str: str) -> tuple[list, str | None]:
+    """Расписание за период до MAX_PERIOD_DAYS: список страниц (title, headers, rows).
+
+    Все нужные листы читаются одним запросом; период до 31 дня — одна страница.
+    """
+    d1, d2, err = _parse_period(date_from_str, date_to_str, MAX_PERIOD_DAYS)
+    if err:
+        return [], err
+    if (d2 - d1).days <= 31:
+        title, headers, rows_or_error = _get_schedule_for_period_sync(date_from_str, date_to_str)
+        if title is None:
+            return [], rows_or_error
+        return [(title, headers, rows_or_error)], None
+
+    month_values = _get_months_values(_period_months(d1, d2))
+    pages = []
+    for start, end in _page_bounds(d1, d2):
+        headers, rows = _collect_rows(start, end, month_values)
+        if not rows:
+            continue
+        title = f"Расписание {start.strftime('%d.%m')} — {end.strftime('%d.%m.%Y')}"
+        pages.append((title, headers, rows))
+    if not pages:
+        return [], "❌ Не нашёл данные за этот период"
+    return pages, None
+
+
+def _get_coverage_sync(date_from_str: str, date_to_str: str) -> tuple[str | None, list, str | None]:
+    """Анализ покрытия за период по кэшированным сеткам месяцев."""
+    d1, d2, err = _parse_period(date_from_str, date_to_str, MAX_PERIOD_DAYS)
+    if err:
+        return None, [], err
+    wanted = {(d1 + timedelta(days=i)).strftime("%d.%m") for i in range((d2 - d1).days + 1)}
+    issues = []
+    found = False
+    for month, all_values in _get_months_values(_period_months(d1, d2), max_age=STATS_CACHE_TTL).items():
+        if not all_values:
+            continue
+        found = True
+        issues.extend(i for i in analyze_month(all_values) if i["date"] in wanted)
+    if not found:
+        return None, [], "❌ Не нашёл данные за этот период"
+    issues.sort(key=lambda i: (i["date"][3:], i["date"][:2], i["from"]))
+    return f"Покрытие {date_from_str} — {date_to_str}", issues, None
+
+
+def _get_stats_sync(date_from_str: str, date_to_str: str) -> tuple[str | None, dict, str | None]:
+    """Часы, смены, ночные смены и переработка по сотрудникам за период до года."""
+    d1, d2, err = _parse_period(date_from_str, date_to_str, 366)
+    if err:
+        return None, {}, err
+    wanted = {(d1 + timedelta(days=i)).strftime("%d.%m") for i in range((d2 - d1).days + 1)}
+    grids = [
+        v for v in _get_months_values(_period_months(d1, d2), max_age=STATS_CACHE_TTL).values() if v
+    ]
+    if not grids:
+        return None, {}, "❌ Не нашёл данные за этот период"
+    period = date_from_str if d1 == d2 else f"{date_from_str} — {date_to_str}"
+    return period, aggregate(grids, wanted), None
 
 
 def _get_workers_for_date_sync(date_str: str) -> tuple[list, list, str | None]:
@@ -407,26 +931,49 @@ def _get_workers_for_date_sync(date_str: str) -> tuple[list, list, str | None]:
 # ===================== ASYNC ОБЁРТКИ =====================
 
 
-async def update_sheet(name: str, date_str: str, new_time: str, is_undo: bool = False) -> str:
-    return await run_in_executor(_update_sheet, name, date_str, new_time, is_undo)
+async def update_sheet(
+    name: str, date_str: str, new_time: str, is_undo: bool = False, chat_id: int | None = None,
+) -> str:
+    return await run_in_executor(_update_sheet, name, date_str, new_time, is_undo, chat_id)
+
+async def batch_update_sheet(updates: list, chat_id: int | None = None) -> list[str]:
+    return await run_in_executor(_batch_update_sheet, updates, chat_id)
+
+async def warmup_sheets() -> int:
+    return await run_in_executor(_warmup_sync)
+
+async def flush_outbox() -> tuple[int, list[dict], int]:
+    return await run_in_executor(_flush_outbox_sync)
 
-async def batch_update_sheet(updates: list) -> list[str]:
-    return await run_in_executor(_batch_update_sheet, updates)
+async def execute_fill(updates: list) -> tuple[int, list[str]]:
+    return await run_in_executor(_execute_fill_sync, updates)
 
-async def execute_fill(updates: list, month_num: str) -> tuple[int, list[str]]:
-    return await run_in_executor(_execute_fill_sync, updates, month_num)
+async def batch_undo_sheet(updates: list) -> list[str]:
+    return await run_in_executor(_batch_undo_sheet, updates)
 
 async def get_current_snapshot() -> dict:
     return await run_in_executor(_get_current_snapshot_sync)
 
+async def get_month_snapshots(months: list[str]) -> dict[str, dict | None]:
+    return await run_in_executor(_get_month_snapshots_sync, months)
+
 async def get_schedule_for_period(date_from: str, date_to: str) -> tuple:
     return await run_in_executor(_get_schedule_for_period_sync, date_from, date_to)
 
-async def check_worksheet_exists(month_num: str) -> bool:
-    return await run_in_executor(_check_worksheet_exists, month_num)
+async def get_schedule_pages(date_from: str, date_to: str) -> tuple[list, str | None]:
+    return await run_in_executor(_get_schedule_pages_sync, date_from, date_to)
+
+async def find_missing_sheets(months: list[str]) -> list[str]:
+    return await run_in_executor(_find_missing_sheets, months)
+
+async def create_month_sheets(months: list[str], year: int) -> list[str]:
+    return await run_in_executor(_create_month_sheets, months, year)
+
+async def get_coverage(date_from: str, date_to: str) -> tuple[str | None, list, str | None]:
+    return await run_in_executor(_get_coverage_sync, date_from, date_to)
 
-async def create_month_sheet(month_num: str, year: int):
-    return await run_in_executor(_create_month_sheet, month_num, year)
+async def get_stats(date_from: str, date_to: str) -> tuple[str | None, dict, str | None]:
+    return await run_in_executor(_get_stats_sync, date_from, date_to)
 
 async def get_workers_for_date(date_str: str) -> tuple[list, list, str | None]:
     return await run_in_executor(_get_workers_for_date_sync, date_str)
@@ -0,0 +1,81 @@
+import numpy as np
+
+from bot.config import STANDARD_SHIFT_HOURS
+from bot.core.coverage import month_matrix, shift_intervals
+
+# Ночь — 22:00–06:00; в минутах от начала суток смены (06:00 следующих суток = 1800)
+NIGHT_WINDOWS = ((0, 360), (1320, 1800))
+
+METRICS = {
+    "hours": "часов",
+    "shifts": "смен",
+    "night": "ночных смен",
+    "overtime": "часов переработки",
+}
+
+
+def _overlap(start: np.ndarray, end: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    return np.clip(np.minimum(end, hi) - np.maximum(start, lo), 0, None)
+
+
+def aggregate(month_grids: list[list], wanted_dates: set[str]) -> dict[str, dict]:
+    """Часы, смены, ночные смены и переработка по сотрудникам за набор дат.
+
+    month_grids — листы месяцев как из get_all_values; в расчёт идут только
+    строки с датами «DD.MM» из wanted_dates.
+    """
+    totals: dict[str, dict] = {}
+    standard = STANDARD_SHIFT_HOURS * 60
+    for grid in month_grids:
+        dates, names, cells = month_matrix(grid)
+        if not dates or not names:
+            continue
+        rows = np.array([d in wanted_dates for d in dates], dtype=bool)
+        start, end, valid = shift_intervals(cells[rows])
+        minutes = np.where(valid, end - start, 0)
+        night = sum(_overlap(start, end, lo, hi) for lo, hi in NIGHT_WINDOWS)
+        night = np.where(valid, night, 0)
+        overtime = np.clip(minutes - standard, 0, None)
+
+        per_name = zip(
+            names,
+            minutes.sum(axis=0), valid.sum(axis=0),
+            (night > 0).sum(axis=0), night.sum(axis=0), overtime.sum(axis=0),
+        )
+        for name, mins, shifts, night_shifts, night_mins, over_mins in per_name:
+            t = totals.setdefault(name, {"hours": 0.0, "shifts": 0, "night": 0, "night_hours": 0.0, "overtime": 0.0})
+            t["hours"] += mins / 60
+            t["shifts"] += int(shifts)
+            t["night"] += int(night_shifts)
+            t["night_hours"] += night_mins / 60
+            t["overtime"] += over_mins / 60
+    return totals
+
+
+def _num(value: float) -> str:
+    return f"{value:g}" if value == int(value) else f"{value:.1f}"
+
+
+def format_stats(totals: dict[str, dict], period: str, name: str | None, metric: str) -> str:
+    if name:
+        t = totals.get(name)
+        if t is None:
+            return f"❌ Нет данных по {name} за {period}"
+        return (
+            f"📊 *{name}*, {period}:\n"
+            f"🕐 Часов: {_num(t['hours'])}\n"
+            f"📅 Смен: {t['shifts']}\n"
+            f"🌙 Ночных смен: {t['night']} ({_num(t['night_hours'])} ч ночью)\n"
+            f"⏱ Переработка: {_num(t['overtime'])} ч"
+        )
+    if not totals:
+        return f"❌ Нет данных за {period}"
+    metric = metric if metric in METRICS else "hours"
+    ranked = sorted(totals.items(), key=lambda kv: -kv[1][metric])
+    lines = [f"📊 *{period}* — по количеству {METRICS[metric]}:\n"]
+    for i, (n, t) in enumerate(ranked, 1):
+        lines.append(
+            f"{i}. *{n}* — {_num(t[metric])} "
+            f"_(смен {t['shifts']}, {_num(t['hours'])} ч, ночных {t['night']})_"
+        )
+    return "\n".join(lines)
@@ -1,4 +1,12 @@
 from bot.handlers.telegram import handle_voice, handle_text, error_handler
-from bot.handlers.scheduler import send_daily_schedule
+from bot.handlers.scheduler import send_daily_schedule, setup_daily_schedule
+from bot.handlers.watcher import setup_change_watcher
+from bot.handlers.flusher import setup_outbox_flush, setup_transcript_flush
+from bot.handlers.admin import handle_llm_stats, handle_metrics
 
-__all__ = ["handle_voice", "handle_text", "error_handler", "send_daily_schedule"]
+__all__ = [
+    "handle_voice", "handle_text", "error_handler",
+    "send_daily_schedule", "setup_daily_schedule", "setup_change_watcher",
+    "setup_outbox_flush", "setup_transcript_flush",
+    "handle_llm_stats", "handle_metrics",
+]
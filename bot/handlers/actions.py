@@ -1,30 +1,88 @@
-import os
 import time
 from datetime import datetime
 from calendar import monthrange
 
-from telegram import Update
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
 
-from bot.config import MONTHS_RU, MONTHS_SHEETS, MSK, NAMES, PENDING_TTL, logger
+from bot import config
+from bot.config import MONTHS_RU, MONTHS_SHEETS, MSK, PENDING_TTL, logger
 from bot.state import (
-    history, snapshot, sheets_cache, sheets_cache_time,
+    history, snapshot, sheets_cache, invalidate_cache, refresh_history, refresh_snapshot,
     pending_fill, last_batch, save_snapshot,
+    get_cached_image, put_cached_image, set_cached_image_file_id,
 )
 from bot.core.sheets import (
     update_sheet, batch_update_sheet, execute_fill,
-    get_current_snapshot, get_schedule_for_period,
-    check_worksheet_exists, create_month_sheet,
-    get_workers_for_date, run_in_executor,
+    get_current_snapshot, get_schedule_pages,
+    find_missing_sheets, create_month_sheets,
+    get_workers_for_date, get_coverage, get_stats, run_in_executor,
 )
 from bot.core.schedule import generate_month_updates
-from bot.core.image_gen import generate_schedule_image
+from bot.core.coverage import format_report
+from bot.core.stats import format_stats
+from bot.core.image_gen import generate_schedule_image, schedule_image_key, render_pages
+from bot.handlers.status import StatusMessage
 
 
-async def safe_delete(msg):
+async def send_schedule_image(send_photo, title: str, headers: list, rows: list, **kwargs):
+    """Отправляет картинку расписания, по возможности без рендера и загрузки.
+
+    send_photo — reply_photo сообщения или bot.send_photo с нужным chat_id.
+    Повторный запрос с теми же данными уходит по Telegram file_id.
+    """
+    key = schedule_image_key(title, headers, rows)
+    cached = get_cached_image(key)
+    if cached and cached["file_id"]:
+        try:
+            return await send_photo(photo=cached["file_id"], **kwargs)
+        except BadRequest as e:
+            logger.warning(f"[IMAGE] file_id не принят Telegram, загружаю заново: {e}")
+            set_cached_image_file_id(key, None)
+
+    if cached and cached["png"]:
+        png = cached["png"]
+    else:
+        png = await run_in_executor(generate_schedule_image, title, headers, rows)
+        put_cached_image(key, png, {r["date"].split(".")[1] for r in rows})
+    msg = await send_photo(photo=png, **kwargs)
+    if msg and msg.photo:
+        set_cached_image_file_id(key, msg.photo[-1].file_id)
+    return msg
+
+
+async def send_schedule_album(send_media_group, pages: list[tuple], **kwargs):
+    """Отправляет несколько страниц расписания одной медиагруппой.
+
+    Страницы из кэша уходят по file_id, остальные рендерятся параллельно.
+    """
+    keys = [schedule_image_key(*page) for page in pages]
+    cached = [get_cached_image(key) for key in keys]
+    to_render = [i for i, c in enumerate(cached) if not (c and (c["file_id"] or c["png"]))]
+    rendered = dict(zip(to_render, await render_pages([pages[i] for i in to_render])))
+
+    media = []
+    for i, (key, entry) in enumerate(zip(keys, cached)):
+        if i in rendered:
+            put_cached_image(key, rendered[i], {r["date"].split(".")[1] for r in pages[i][2]})
+            media.append(InputMediaPhoto(rendered[i]))
+        elif entry["file_id"]:
+            media.append(InputMediaPhoto(entry["file_id"]))
+        else:
+            media.append(InputMediaPhoto(entry["png"]))
     try:
-        await msg.delete()
-    except Exception:
-        pass
+        messages = await send_media_group(media=media, **kwargs)
+    except BadRequest as e:
+        if not any(c and c["file_id"] for c in cached):
+            raise
+        logger.warning(f"[IMAGE] медиагруппа по file_id не принята, загружаю заново: {e}")
+        for key in keys:
+            set_cached_image_file_id(key, None)
+        return await send_schedule_album(send_media_group, pages, **kwargs)
+    for key, msg in zip(keys, messages):
+        if msg.photo:
+            set_cached_image_file_id(key, msg.photo[-1].file_id)
+    return messages
 
 
 def compare_snapshots(old: dict, new: dict) -> list:
@@ -39,96 +97,104 @@ def compare_snapshots(old: dict, new: dict) -> list:
     return changes
 
 
-async def handle_fill_schedule(month_num: str, year: int, user_id: int, update: Update):
-    month_name = MONTHS_RU.get(month_num, month_num)
-    days_in_month = monthrange(year, int(month_num))[1]
-    total = days_in_month * len(NAMES)
+def _months_label(months: list[str], year: int) -> str:
+    if len(months) == 1:
+        return f"{MONTHS_RU.get(months[0], months[0])} {year}"
+    return f"{MONTHS_RU.get(months[0], months[0])} — {MONTHS_RU.get(months[-1], months[-1])} {year}"
 
-    tmp_msg = await update.message.reply_text(f"🔍 Проверяю лист {month_name} {year}...")
 
-    sheet_created = False
-    exists = await check_worksheet_exists(month_num)
-    if not exists:
-        try:
-            await create_month_sheet(month_num, year)
-            sheet_created = True
-        except Exception as create_err:
-            await safe_delete(tmp_msg)
-            await update.message.reply_text(f"❌ Не удалось создать лист: {create_err}")
-            return
+async def handle_fill_schedule(months: list[str], year: int, user_id: int, status: StatusMessage):
+    label = _months_label(months, year)
+    await status.stage(f"🔍 Проверяю листы: {label}...")
 
-    await safe_delete(tmp_msg)
+    created = []
+    try:
+        missing = await find_missing_sheets(months)
+        if missing:
+            created = await create_month_sheets(missing, year)
+    except Exception as create_err:
+        await status.finish(f"❌ Не удалось создать лист: {create_err}")
+        return
 
-    updates = generate_month_updates(month_num, year)
-    created_text = " _(лист создан автоматически)_" if sheet_created else ""
+    try:
+        updates = [u for m in months for u in generate_month_updates(m, year)]
+    except ValueError as e:
+        await status.finish(f"❌ Ошибка в графиках employees.json: {e}")
+        return
+    days_total = sum(monthrange(year, int(m))[1] for m in months)
+    created_text = f" _(создано листов: {len(created)})_" if created else ""
 
     pending_fill[user_id] = {
-        "month": month_num,
+        "months": months,
         "year": year,
         "updates": updates,
         "expires_at": time.time() + PENDING_TTL,
     }
-    await update.message.reply_text(
-        f"📅 Заполню *{month_name} {year}* по паттерну 2/2{created_text}\n"
-        f"Сотрудников: {len(NAMES)}, дней: {days_in_month}, записей: {total}\n\n"
+    await status.finish(
+        f"📅 Заполню *{label}* по графику{created_text}\n"
+        f"Сотрудников: {len(config.NAMES)}, дней: {days_total}, записей: {len(updates)}\n\n"
         f"Подтвердить? Напиши *да* или *нет* (2 минуты).",
         parse_mode="Markdown",
     )
 
 
-async def execute_fill_action(pending: dict, user_id: int, update: Update):
-    month_name = MONTHS_RU.get(pending["month"], pending["month"])
-    year = pending["year"]
-    tmp_msg = await update.message.reply_text(
-        f"⏳ Заполняю *{month_name} {year}* по паттерну 2/2...",
-        parse_mode="Markdown",
-    )
+async def execute_fill_action(pending: dict, user_id: int, status: StatusMessage):
+    label = _months_label(pending["months"], pending["year"])
+    await status.stage(f"⏳ Заполняю {label} по графику...")
 
-    total_ok, total_err = await execute_fill(pending["updates"], pending["month"])
-    last_batch[user_id] = pending["updates"]
-    await safe_delete(tmp_msg)
+    total_ok, total_err = await execute_fill(pending["updates"])
+    # Одна пачка отката на все месяцы: в updates уже записаны прежние значения
+    last_batch[user_id] = [u for u in pending["updates"] if "old" in u]
 
     if total_err:
         err_text = "\n".join(total_err[:5])
         if len(total_err) > 5:
             err_text += f"\n...и ещё {len(total_err) - 5} ошибок"
-        await update.message.reply_text(
-            f"✅ Заполнено {total_ok}\n❌ Ошибок: {len(total_err)}\n\n{err_text}",
-            parse_mode="Markdown",
-        )
+        # ⚠️ — замечание (например, не легла заливка), а не ошибка записи
+        errors = sum(e.startswith("❌") for e in total_err)
+        summary = f"✅ Заполнено {total_ok}" + (f"\n❌ Ошибок: {errors}" if errors else "")
+        await status.finish(f"{summary}\n\n{err_text}", parse_mode="Markdown")
     else:
-        await update.message.reply_text(
-            f"✅ *{month_name} {year}* заполнен по паттерну 2/2!\nЗаписей: {total_ok}",
+        await status.finish(
+            f"✅ *{label}* заполнен по графику!\nЗаписей: {total_ok}",
             parse_mode="Markdown",
         )
 
 
-async def handle_show_period(date_from: str, date_to: str, update: Update):
-    tmp_msg = await update.message.reply_text("📊 Генерирую расписание...")
-    result = await get_schedule_for_period(date_from, date_to)
-    await safe_delete(tmp_msg)
-
-    title, headers, rows_or_error = result
-    if title is None:
-        await update.message.reply_text(rows_or_error)
+def _album_chunks(pages: list, limit: int = 10) -> list[list]:
+    """Медиагруппа Telegram — от 2 до 10 фото: страницы делятся на альбомы
+    поровну (11 → 6 + 5), чтобы последний не остался из одной страницы."""
+    count = -(-len(pages) // limit)
+    size, extra = divmod(len(pages), count)
+    chunks, start = [], 0
+    for i in range(count):
+        end = start + size + (i < extra)
+        chunks.append(pages[start:end])
+        start = end
+    return chunks
+
+
+async def handle_show_period(date_from: str, date_to: str, status: StatusMessage):
+    await status.stage_photo("📊 Генерирую расписание...")
+    pages, error = await get_schedule_pages(date_from, date_to)
+    if error:
+        await status.finish(error)
         return
 
-    img_path = await run_in_executor(generate_schedule_image, title, headers, rows_or_error)
-    try:
-        with open(img_path, "rb") as f:
-            await update.message.reply_photo(f)
-    finally:
-        if os.path.exists(img_path):
-            os.unlink(img_path)
+    if len(pages) == 1:
+        await send_schedule_image(status.finish_photo, *pages[0])
+        return
+    for chunk in _album_chunks(pages):
+        await send_schedule_album(status.message.reply_media_group, chunk)
+    await status.clear()
 
 
-async def handle_show_workers(date_str: str, update: Update):
-    tmp_msg = await update.message.reply_text("🔍 Ищу кто работает...")
+async def handle_show_workers(date_str: str, status: StatusMessage):
+    await status.stage("🔍 Ищу кто работает...")
     try:
         workers, off, error = await get_workers_for_date(date_str)
-        await safe_delete(tmp_msg)
         if error:
-            await update.message.reply_text(error)
+            await status.finish(error)
             return
 
         parts = date_str.split(".")
@@ -140,15 +206,31 @@ async def handle_show_workers(date_str: str, update: Update):
         lines.extend(workers if workers else ["Никто не работает"])
         if off:
             lines.append(f"\n😴 *Выходной:* {', '.join(off)}")
-        await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+        await status.finish("\n".join(lines), parse_mode="Markdown")
     except Exception as e:
-        await safe_delete(tmp_msg)
-        await update.message.reply_text(f"❌ Ошибка: {e}")
+        await status.finish(f"❌ Ошибка: {e}")
+
+
+async def handle_check_coverage(date_from: str, date_to: str, status: StatusMessage):
+    title, issues, error = await get_coverage(date_from, date_to)
+    if error:
+        await status.finish(error)
+        return
+    await status.finish(format_report(issues, title), parse_mode="Markdown")
+
+
+async def handle_show_stats(date_from: str, date_to: str, name: str | None, metric: str, status: StatusMessage):
+    period, totals, error = await get_stats(date_from, date_to)
+    if error:
+        await status.finish(error)
+        return
+    await status.finish(format_stats(totals, period, name, metric), parse_mode="Markdown")
 
 
-async def handle_show_history(update: Update):
+async def handle_show_history(status: StatusMessage):
+    refresh_history()
     if not history:
-        await update.message.reply_text("📋 История изменений пуста.")
+        await status.finish("📋 История изменений пуста.")
         return
     lines = ["📋 *Последние изменения:*\n"]
     for key, entry in list(history.items())[-15:]:
@@ -159,21 +241,22 @@ async def handle_show_history(update: Update):
             )
         else:
             lines.append(f"• {name} / {date_key} _(было: {entry})_")
-    await update.message.reply_text("\n\n".join(lines), parse_mode="Markdown")
+    await status.finish("\n\n".join(lines), parse_mode="Markdown")
 
 
-async def handle_show_changes_period(date_from: str, date_to: str, update: Update):
+async def handle_show_changes_period(date_from: str, date_to: str, status: StatusMessage):
     year = datetime.now(MSK).year
     try:
         d1 = datetime.strptime(f"{date_from}.{year}", "%d.%m.%Y")
         d2 = datetime.strptime(f"{date_to}.{year}", "%d.%m.%Y")
     except ValueError:
-        await update.message.reply_text("❌ Неверный формат дат")
+        await status.finish("❌ Неверный формат дат")
         return
 
+    refresh_history()
     lines = [f"📋 *Изменения за {date_from} — {date_to}:*\n"]
     found = False
-    for key, entry in history.items():
+    for key, entry in list(history.items()):
         name, date_key = key.split("_", 1)
         try:
             p = date_key.split(".")
@@ -189,31 +272,27 @@ async def handle_show_changes_period(date_from: str, date_to: str, update: Updat
         except Exception:
             continue
     if not found:
-        await update.message.reply_text(f"📋 Изменений за {date_from} — {date_to} не найдено.")
+        await status.finish(f"📋 Изменений за {date_from} — {date_to} не найдено.")
         return
-    await update.message.reply_text("\n\n".join(lines), parse_mode="Markdown")
+    await status.finish("\n\n".join(lines), parse_mode="Markdown")
 
 
-async def handle_check_changes(update: Update):
-    tmp_msg = await update.message.reply_text("🔄 Проверяю изменения в таблице...")
+async def handle_check_changes(status: StatusMessage):
+    await status.stage("🔄 Проверяю изменения в таблице...")
     new_snapshot = await get_current_snapshot()
+    refresh_snapshot()
     if not snapshot:
-        snapshot.update(new_snapshot)
         save_snapshot(new_snapshot)
-        await safe_delete(tmp_msg)
-        await update.message.reply_text("✅ Снимок таблицы сохранён!")
+        await status.finish("✅ Снимок таблицы сохранён!")
         return
     changes = compare_snapshots(snapshot, new_snapshot)
-    sheets_cache.clear()
-    sheets_cache_time.clear()
-    snapshot.clear()
-    snapshot.update(new_snapshot)
+    for month in list(sheets_cache):
+        invalidate_cache(month)
     save_snapshot(new_snapshot)
-    await safe_delete(tmp_msg)
     if not changes:
-        await update.message.reply_text("✅ Изменений нет — таблица актуальна.")
+        await status.finish("✅ Изменений нет — таблица актуальна.")
         return
     lines = [f"📋 *Найдено изменений: {len(changes)}*\n"]
     for c in changes:
         lines.append(f"👤 *{c['name']}* / {c['date']}\n   {c['old']} → *{c['new']}*")
-    await update.message.reply_text("\n\n".join(lines), parse_mode="Markdown")
+    await status.finish("\n\n".join(lines), parse_mode="Markdown")
@@ -0,0 +1,42 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot.config import ADMIN_IDS, logger
+from bot.core.metrics import llm_summary, render_prometheus
+from bot.services.voice_cache import cache_summary
+from bot.tracing import stage_summary
+
+
+def _is_admin(update: Update) -> bool:
+    user = update.effective_user
+    return bool(user and user.id in ADMIN_IDS)
+
+
+def _latency_summary() -> str:
+    stages = stage_summary()
+    if not stages:
+        return "⏱ Замеров этапов пока нет."
+    lines = ["⏱ Этапы: вызовы / p50 / p95 / p99\n"]
+    for name, s in stages.items():
+        err_text = f", ошибок {s['errors']}" if s["errors"] else ""
+        lines.append(
+            f"• {name}: {s['count']} / {s['p50']:.2f}с / {s['p95']:.2f}с / {s['p99']:.2f}с{err_text}"
+        )
+    return "\n".join(lines)
+
+
+async def handle_llm_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not _is_admin(update):
+        return
+    logger.info(f"[ADMIN] user={update.effective_user.id} /llm_stats")
+    await update.message.reply_text(f"{llm_summary()}\n\n{cache_summary()}\n\n{_latency_summary()}")
+
+
+async def handle_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not _is_admin(update):
+        return
+    logger.info(f"[ADMIN] user={update.effective_user.id} /metrics")
+    await update.message.reply_document(
+        document=render_prometheus().encode("utf-8"),
+        filename="metrics.prom",
+    )
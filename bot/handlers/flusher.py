@@ -0,0 +1,95 @@
+import asyncio
+from functools import partial
+
+from bot.config import OUTBOX_FLUSH_DELAY, OUTBOX_MAX_BACKOFF, TRANSCRIPT_CACHE_FLUSH_INTERVAL, logger
+from bot.core import outbox
+from bot.core.sheets import flush_outbox, run_in_executor
+from bot.services import voice_cache
+
+_scheduled = False
+_failures = 0
+
+
+def _schedule(job_queue, when: float):
+    """Одна запланированная запись на всех: правки за OUTBOX_FLUSH_DELAY уйдут пачкой."""
+    global _scheduled
+    if _scheduled:
+        return
+    _scheduled = True
+    job_queue.run_once(flush_outbox_job, when=when, name="outbox_flush")
+
+
+def _on_enqueue(app, loop: asyncio.AbstractEventLoop):
+    """Правка легла в outbox (из потока Sheets) → запись через OUTBOX_FLUSH_DELAY."""
+    if not _scheduled:
+        loop.call_soon_threadsafe(partial(_schedule, app.job_queue, OUTBOX_FLUSH_DELAY))
+
+
+async def _notify_conflict(bot, c: dict):
+    if c.get("unreadable"):
+        reason = "лист таблицы не читается"
+    elif c["remote"] is None:
+        reason = "в таблице нет такой ячейки"
+    else:
+        reason = f"в таблице уже «{c['remote'] or '—'}»"
+    text = f"⚠️ Не записал {c['name']} / {c['date']} → {c['value']}: {reason}, правка отменена"
+    if not c.get("chat_id"):
+        return
+    try:
+        await bot.send_message(chat_id=c["chat_id"], text=text)
+    except Exception as e:
+        logger.warning(f"[OUTBOX] не удалось сообщить о конфликте в chat={c['chat_id']}: {e}")
+
+
+def _retry_later(job_queue, reason: str):
+    global _failures
+    _failures += 1
+    delay = min(5 * 2 ** (_failures - 1), OUTBOX_MAX_BACKOFF)
+    logger.warning(f"[OUTBOX] {reason}, в очереди {len(outbox.pending())}, повтор через {delay}с")
+    _schedule(job_queue, delay)
+
+
+async def flush_outbox_job(context):
+    """Задача job_queue: запись outbox в таблицу; при сбое Sheets или непрочитанном
+    листе — повтор с растущей паузой."""
+    global _scheduled, _failures
+    _scheduled = False
+    try:
+        _, conflicts, left = await flush_outbox()
+    except Exception as e:
+        _retry_later(context.job_queue, f"запись не удалась ({e})")
+        return
+    for c in conflicts:
+        await _notify_conflict(context.bot, c)
+    if left:
+        _retry_later(context.job_queue, f"не прочитан лист для {left} правок")
+        return
+    _failures = 0
+    if outbox.pending():
+        # Правки пришли во время записи
+        _schedule(context.job_queue, OUTBOX_FLUSH_DELAY)
+
+
+async def _start_flusher(context):
+    outbox.add_listener(partial(_on_enqueue, context.application, asyncio.get_running_loop()))
+    left = len(outbox.pending())
+    if left:
+        logger.info(f"[OUTBOX] незаписанных правок с прошлого запуска: {left}")
+        _schedule(context.job_queue, 0)
+
+
+def setup_outbox_flush(app):
+    """Нужна каждому воркеру: outbox общий, но запись планирует тот, кто принял правку."""
+    app.job_queue.run_once(_start_flusher, when=0, name="outbox_start")
+
+
+async def _flush_transcripts_job(context):
+    await run_in_executor(voice_cache.flush)
+
+
+def setup_transcript_flush(app):
+    """Кэш распознавания — на диск раз в TRANSCRIPT_CACHE_FLUSH_INTERVAL (и при остановке, см. main)."""
+    app.job_queue.run_repeating(
+        _flush_transcripts_job, interval=TRANSCRIPT_CACHE_FLUSH_INTERVAL,
+        first=TRANSCRIPT_CACHE_FLUSH_INTERVAL, name="transcripts_flush",
+    )
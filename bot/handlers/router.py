@@ -1,148 +1,186 @@
 import time
 from datetime import datetime
 
-from telegram import Update
-
+from bot import admission
 from bot.config import MONTHS_SHEETS, PENDING_TTL, MSK, logger
 from bot.state import pending_updates, last_batch
-from bot.core.sheets import update_sheet, batch_update_sheet, run_in_executor
+from bot.core.sheets import update_sheet, batch_update_sheet, batch_undo_sheet, run_in_executor
 from bot.services.ai_client import parse_with_claude, generate_cheer_and_chat
+from bot.services import corpus
 from bot.handlers.actions import (
-    safe_delete,
     handle_fill_schedule, handle_show_period, handle_show_workers,
     handle_show_history, handle_show_changes_period, handle_check_changes,
+    handle_check_coverage, handle_show_stats,
 )
+from bot.handlers.status import StatusMessage
+
+
+MAX_RESULT_LINES = 30
+
+
+def _summarize_results(results: list[str]) -> str:
+    """Длинный список результатов (откат заполнения месяца) сворачивается в итог."""
+    if len(results) <= MAX_RESULT_LINES:
+        return "\n".join(results)
+    errors = [r for r in results if r.startswith("❌")]
+    lines = [f"↩️ Восстановлено записей: {len(results) - len(errors)}"]
+    if errors:
+        lines.append(f"❌ Ошибок: {len(errors)}")
+        lines.extend(errors[:5])
+    return "\n".join(lines)
 
 
-async def process_text(text: str, update: Update, user_id: int):
-    logger.info(f"[PROCESS] user={user_id} text={text!r}")
+async def process_text(text: str, status: StatusMessage, user_id: int, origin: str = "text"):
+    """Разбирает запрос и выполняет действие; все ответы идут через status.
+
+    origin — "text" или "voice" (текст — расшифровка), для корпуса запросов.
+    """
+    logger.info("[PROCESS] user=%s text=%r", user_id, text)
+    meta: dict = {}
     try:
-        data = await run_in_executor(parse_with_claude, text, user_id)
+        async with admission.slot(admission.READ):
+            data = await run_in_executor(parse_with_claude, text, user_id, meta)
     except RuntimeError as e:
         logger.warning(f"[PROCESS] RuntimeError от AI: {e}")
-        await update.message.reply_text(str(e))
+        await status.finish(str(e))
         return
     except Exception as e:
         logger.error(f"[PROCESS] неожиданная ошибка AI: {e}", exc_info=True)
-        await update.message.reply_text("❌ Ошибка соединения с ИИ. Попробуй ещё раз.")
+        await status.finish("❌ Ошибка соединения с ИИ. Попробуй ещё раз.")
         return
 
     action = data.get("action")
-    logger.info(f"[PROCESS] action={action} data={data}")
+    logger.info("[PROCESS] action=%s data=%s", action, data)
+    corpus.record(user_id, origin, text, data, meta)
+    async with admission.slot(admission.action_priority(action)):
+        await _run_action(action, data, text, status, user_id)
+
 
+async def _run_action(action: str | None, data: dict, text: str, status: StatusMessage, user_id: int):
     if action == "fill_schedule":
-        month_num = str(data.get("month", datetime.now(MSK).strftime("%m"))).zfill(2)
+        months = data.get("months") or [str(data.get("month", datetime.now(MSK).strftime("%m"))).zfill(2)]
         year = int(data.get("year", datetime.now(MSK).year))
-        if month_num not in MONTHS_SHEETS:
-            await update.message.reply_text(f"❌ Неизвестный месяц: {month_num}")
+        unknown = [m for m in months if m not in MONTHS_SHEETS]
+        if unknown:
+            await status.finish(f"❌ Неизвестный месяц: {', '.join(unknown)}")
             return
-        await handle_fill_schedule(month_num, year, user_id, update)
+        await handle_fill_schedule(months, year, user_id, status)
 
     elif action == "show_period":
         date_from = data.get("date_from")
         date_to = data.get("date_to")
         if not date_from or not date_to:
-            await update.message.reply_text("⚠️ Не понял период. Уточни даты.")
+            await status.finish("⚠️ Не понял период. Уточни даты.")
             return
-        await handle_show_period(date_from, date_to, update)
+        await handle_show_period(date_from, date_to, status)
 
     elif action == "show_workers":
         date_str = data.get("date")
         if not date_str:
-            await update.message.reply_text("⚠️ Не понял дату.")
+            await status.finish("⚠️ Не понял дату.")
             return
-        await handle_show_workers(date_str, update)
+        await handle_show_workers(date_str, status)
 
     elif action == "show_history":
-        await handle_show_history(update)
+        await handle_show_history(status)
 
     elif action == "show_changes_period":
         date_from = data.get("date_from")
         date_to = data.get("date_to")
         if not date_from or not date_to:
-            await update.message.reply_text("⚠️ Не понял период.")
+            await status.finish("⚠️ Не понял период.")
             return
-        await handle_show_changes_period(date_from, date_to, update)
+        await handle_show_changes_period(date_from, date_to, status)
 
     elif action == "check_changes":
-        await handle_check_changes(update)
+        await handle_check_changes(status)
+
+    elif action == "check_coverage":
+        date_from = data.get("date_from")
+        date_to = data.get("date_to")
+        if not date_from or not date_to:
+            await status.finish("⚠️ Не понял период.")
+            return
+        await handle_check_coverage(date_from, date_to, status)
+
+    elif action == "show_stats":
+        date_from = data.get("date_from")
+        date_to = data.get("date_to")
+        if not date_from or not date_to:
+            await status.finish("⚠️ Не понял период.")
+            return
+        await handle_show_stats(date_from, date_to, data.get("name"), data.get("metric", "hours"), status)
 
     elif action == "update":
         name = data.get("name")
         date_str = data.get("date")
         time_val = data.get("time")
         if name is None or date_str is None or time_val is None:
-            await update.message.reply_text(f"⚠️ Не понял: Имя={name}, Дата={date_str}, Время={time_val}")
+            await status.finish(f"⚠️ Не понял: Имя={name}, Дата={date_str}, Время={time_val}")
             return
-        result = await update_sheet(name, date_str, time_val)
-        await update.message.reply_text(result, parse_mode="Markdown")
+        result = await update_sheet(name, date_str, time_val, chat_id=status.message.chat_id)
+        await status.finish(result, parse_mode="Markdown")
 
     elif action == "update_many":
         updates = data.get("updates", [])
         if not updates:
-            await update.message.reply_text("⚠️ Не понял кому и что менять.")
+            await status.finish("⚠️ Не понял кому и что менять.")
             return
         if len(updates) > 5:
             pending_updates[user_id] = {"updates": updates, "expires_at": time.time() + PENDING_TTL}
             names_list = list({u.get("name", "?") for u in updates})
-            await update.message.reply_text(
+            await status.finish(
                 f"⚠️ Собираюсь изменить *{len(updates)} записей*\n"
                 f"Кому: {', '.join(names_list)}\n\n"
                 f"Подтвердить? Напиши *да* или *нет* (2 минуты)",
                 parse_mode="Markdown",
             )
             return
-        tmp_msg = await update.message.reply_text(f"⏳ Обновляю {len(updates)} записей...")
-        results = await batch_update_sheet(updates)
+        await status.stage(f"⏳ Обновляю {len(updates)} записей...")
+        results = await batch_update_sheet(updates, chat_id=status.message.chat_id)
         last_batch[user_id] = updates
-        await safe_delete(tmp_msg)
-        await update.message.reply_text("\n".join(results), parse_mode="Markdown")
+        await status.finish("\n".join(results), parse_mode="Markdown")
 
     elif action == "undo":
         name = data.get("name")
         date_str = data.get("date")
         if name is None or date_str is None:
-            await update.message.reply_text("⚠️ Не понял для кого и на какую дату.")
+            await status.finish("⚠️ Не понял для кого и на какую дату.")
             return
         result = await update_sheet(name, date_str, "", is_undo=True)
-        await update.message.reply_text(result, parse_mode="Markdown")
+        await status.finish(result, parse_mode="Markdown")
 
     elif action == "undo_batch":
         if user_id not in last_batch or not last_batch[user_id]:
-            await update.message.reply_text("❌ Нет последнего массового обновления.")
+            await status.finish("❌ Нет последнего массового обновления.")
             return
         updates = last_batch[user_id]
-        tmp_msg = await update.message.reply_text(f"↩️ Откатываю {len(updates)} записей...")
-        results = []
-        for u in updates:
-            r = await update_sheet(u["name"], u["date"], "", is_undo=True)
-            results.append(r)
+        await status.stage(f"↩️ Откатываю {len(updates)} записей...")
+        results = await batch_undo_sheet(updates)
         last_batch.pop(user_id, None)
-        await safe_delete(tmp_msg)
-        await update.message.reply_text("\n".join(results), parse_mode="Markdown")
+        await status.finish(_summarize_results(results), parse_mode="Markdown")
 
     elif action == "cheer":
         try:
-            response = await run_in_executor(generate_cheer_and_chat, data.get("type", "support"), None)
+            response = await run_in_executor(
+                generate_cheer_and_chat, data.get("type", "support"), None, user_id,
+            )
         except RuntimeError as e:
-            await update.message.reply_text(str(e))
+            await status.finish(str(e))
             return
-        await update.message.reply_text(response)
+        await status.finish(response)
 
     elif action in ("chat", "unknown"):
-        tmp_msg = await update.message.reply_text("💭 Думаю...")
+        await status.stage("💭 Думаю...")
         try:
-            response = await run_in_executor(generate_cheer_and_chat, None, text)
+            response = await run_in_executor(generate_cheer_and_chat, None, text, user_id)
         except RuntimeError as e:
-            await safe_delete(tmp_msg)
-            await update.message.reply_text(str(e))
+            await status.finish(str(e))
             return
         except Exception:
-            await safe_delete(tmp_msg)
-            await update.message.reply_text("❌ Ошибка ИИ. Попробуй ещё раз.")
+            await status.finish("❌ Ошибка ИИ. Попробуй ещё раз.")
             return
-        await safe_delete(tmp_msg)
-        await update.message.reply_text(response)
+        await status.finish(response)
 
     else:
-        await update.message.reply_text("🤔 Не понял запрос. Попробуй переформулировать.")
+        await status.finish("🤔 Не понял запрос. Попробуй переформулировать.")
@@ -1,41 +1,166 @@
-import os
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta, time as dt_time
+from functools import partial
 
-from bot.config import SCHEDULE_CHAT_ID, SCHEDULE_THREAD_ID, MSK, logger
+from bot.config import (
+    SCHEDULE_TARGETS, SCHEDULE_TIME, SCHEDULE_DAY_OFFSET, SCHEDULE_PRESTAGE_MINUTES,
+    MSK, logger,
+)
+from bot.state import add_invalidate_listener, put_cached_image
 from bot.core.sheets import get_schedule_for_period, run_in_executor
-from bot.core.image_gen import generate_schedule_image
+from bot.core.image_gen import generate_schedule_image, schedule_image_key
+from bot.handlers.actions import send_schedule_image
+
+PRESTAGE_MAX_ATTEMPTS = 8
+PRESTAGE_MAX_BACKOFF = 600
+SEND_MAX_ATTEMPTS = 4
+REFRESH_DELAY = 5  # правки идут пачками — пересобираем один раз после последней
+
+# Подготовленный пост: {"date", "title", "headers", "rows"} или None
+_staged: dict | None = None
+_daily_job = None
+_refresh_pending = False
+_listening = False
+
+
+def _target_date() -> datetime:
+    """Дата, за которую будет следующий пост."""
+    if _daily_job is not None and _daily_job.next_t is not None:
+        base = _daily_job.next_t.astimezone(MSK)
+    else:
+        base = datetime.now(MSK)
+    return base + timedelta(days=SCHEDULE_DAY_OFFSET)
+
+
+def _caption(day: datetime) -> str:
+    return f"📅 Расписание на {day.strftime('%d.%m')} ({day.strftime('%A')})"
+
+
+# ===================== ПОДГОТОВКА =====================
+
+
+async def _stage(day: datetime):
+    """Читает таблицу и рендерит картинку на день; кладёт её в кэш картинок.
+
+    Нет данных — тоже ошибка: чтение листа при сбое Sheets выглядит так же,
+    поэтому повторяем, а «данных нет» пишем только когда попытки кончились.
+    """
+    global _staged
+    date_str = day.strftime("%d.%m")
+    title, headers, rows_or_error = await get_schedule_for_period(date_str, date_str)
+    if title is None:
+        raise RuntimeError(rows_or_error)
+    png = await run_in_executor(generate_schedule_image, title, headers, rows_or_error)
+    put_cached_image(schedule_image_key(title, headers, rows_or_error), png, {day.strftime("%m")})
+    _staged = {"date": date_str, "title": title, "headers": headers, "rows": rows_or_error}
+    logger.info(f"[PRESTAGE] пост на {date_str} готов ({len(png)} байт)")
+
+
+async def prestage_daily_schedule(context):
+    """Готовит пост заранее; при ошибке Sheets повторяет с экспоненциальной паузой."""
+    global _refresh_pending, _listening
+    _refresh_pending = False
+    if not _listening:
+        _listening = True
+        add_invalidate_listener(partial(_on_invalidate, context.application, asyncio.get_running_loop()))
+    attempt = (context.job.data or {}).get("attempt", 0)
+    day = _target_date()
+    try:
+        await _stage(day)
+    except Exception as e:
+        if attempt + 1 >= PRESTAGE_MAX_ATTEMPTS:
+            logger.error(f"[PRESTAGE] не удалось подготовить пост на {day:%d.%m} за {attempt + 1} попыток: {e}")
+            return
+        delay = min(30 * 2 ** attempt, PRESTAGE_MAX_BACKOFF)
+        logger.warning(f"[PRESTAGE] ошибка ({e}), повтор через {delay}с")
+        context.job_queue.run_once(
+            prestage_daily_schedule, when=delay, data={"attempt": attempt + 1}, name="prestage_retry",
+        )
+
+
+def _on_invalidate(app, loop: asyncio.AbstractEventLoop, month: str):
+    """Сброс кэша месяца (из потока Sheets) → пересборка поста, если он про этот месяц."""
+    global _refresh_pending
+    if _staged is None or _staged["date"][3:] != month or _refresh_pending:
+        return
+    _refresh_pending = True
+    logger.debug(f"[PRESTAGE] месяц {month} изменён, пересоберу пост")
+    loop.call_soon_threadsafe(
+        partial(app.job_queue.run_once, prestage_daily_schedule, when=REFRESH_DELAY, name="prestage_refresh"),
+    )
+
+
+# ===================== ОТПРАВКА =====================
 
 
 async def send_daily_schedule(context):
-    """Отправляет расписание на сегодня в топик беседы. Вызывается по расписанию."""
-    if not SCHEDULE_CHAT_ID or not SCHEDULE_THREAD_ID:
-        logger.warning("SCHEDULE_CHAT_ID или SCHEDULE_THREAD_ID не заданы, пропускаю")
+    """Отправляет расписание во все SCHEDULE_TARGETS. Вызывается по расписанию.
+
+    Обычно пост уже подготовлен — остаётся только отправка: первая загрузка
+    картинки, дальше по file_id. Без подготовки данные читаются сейчас.
+    """
+    if not SCHEDULE_TARGETS:
+        logger.warning("Получатели расписания не заданы (SCHEDULE_TARGETS), пропускаю")
         return
+    attempt = (context.job.data or {}).get("attempt", 0)
+    day = datetime.now(MSK) + timedelta(days=SCHEDULE_DAY_OFFSET)
+    date_str = day.strftime("%d.%m")
+    staged = None
     try:
-        today = datetime.now(MSK)
-        date_str = today.strftime("%d.%m")
-
-        title, headers, rows_or_error = await get_schedule_for_period(date_str, date_str)
-        if title is None:
-            await context.bot.send_message(
-                chat_id=SCHEDULE_CHAT_ID,
-                message_thread_id=SCHEDULE_THREAD_ID,
-                text=f"📅 Расписание на {date_str} — данных нет",
+        if _staged is None or _staged["date"] != date_str:
+            logger.warning(f"[SCHEDULE] пост на {date_str} не подготовлен заранее, готовлю сейчас")
+            await _stage(day)
+        staged = _staged
+    except Exception as e:
+        if attempt + 1 < SEND_MAX_ATTEMPTS:
+            delay = 30 * 2 ** attempt
+            logger.warning(f"[SCHEDULE] не удалось подготовить пост ({e}), повтор через {delay}с")
+            context.job_queue.run_once(
+                send_daily_schedule, when=delay, data={"attempt": attempt + 1}, name="daily_retry",
             )
             return
+        logger.error(f"Ошибка подготовки расписания по расписанию: {e}")
 
-        img_path = await run_in_executor(generate_schedule_image, title, headers, rows_or_error)
+    for chat_id, thread_id in SCHEDULE_TARGETS:
         try:
-            with open(img_path, "rb") as f:
-                await context.bot.send_photo(
-                    chat_id=SCHEDULE_CHAT_ID,
-                    message_thread_id=SCHEDULE_THREAD_ID,
-                    photo=f,
-                    caption=f"📅 Расписание на {date_str} ({today.strftime('%A')})",
+            if staged is None:
+                await context.bot.send_message(
+                    chat_id=chat_id, message_thread_id=thread_id,
+                    text=f"📅 Расписание на {date_str} — данных нет",
                 )
-            logger.info(f"Расписание на {date_str} отправлено в топик {SCHEDULE_THREAD_ID}")
-        finally:
-            if os.path.exists(img_path):
-                os.unlink(img_path)
+                continue
+            await send_schedule_image(
+                partial(context.bot.send_photo, chat_id=chat_id, message_thread_id=thread_id),
+                staged["title"], staged["headers"], staged["rows"],
+                caption=_caption(day),
+            )
+            logger.info(f"Расписание на {date_str} отправлено: chat={chat_id}, thread={thread_id}")
+        except Exception as e:
+            logger.error(f"Ошибка отправки расписания в chat={chat_id}: {e}", exc_info=True)
+
+
+# ===================== НАСТРОЙКА =====================
+
+
+def setup_daily_schedule(app):
+    """Регистрирует отправку в SCHEDULE_TIME и подготовку поста заранее."""
+    global _daily_job
+    if not SCHEDULE_TARGETS:
+        logger.info("Автоотправка расписания не настроена (нет SCHEDULE_TARGETS/SCHEDULE_CHAT_ID)")
+        return
+    try:
+        h, m = SCHEDULE_TIME.split(":")
+        send_time = dt_time(hour=int(h), minute=int(m), second=0)
     except Exception as e:
-        logger.error(f"Ошибка отправки расписания по расписанию: {e}", exc_info=True)
+        logger.error(f"Не удалось настроить автоотправку: {e}")
+        return
+    prestage_at = (datetime.combine(datetime.now().date(), send_time)
+                   - timedelta(minutes=SCHEDULE_PRESTAGE_MINUTES)).time()
+
+    _daily_job = app.job_queue.run_daily(send_daily_schedule, time=send_time, name="daily_schedule")
+    app.job_queue.run_daily(prestage_daily_schedule, time=prestage_at, name="prestage")
+    app.job_queue.run_once(prestage_daily_schedule, when=5, name="prestage_startup")
+    targets = ", ".join(f"{c}/{t}" if t else str(c) for c, t in SCHEDULE_TARGETS)
+    logger.info(
+        f"Автоотправка расписания: {SCHEDULE_TIME} (подготовка в {prestage_at:%H:%M}) → {targets}"
+    )
@@ -0,0 +1,123 @@
+from telegram import InputMediaPhoto, Message
+from telegram.error import BadRequest
+
+from bot.config import logger
+from bot.core.image_gen import placeholder_image
+
+# file_id заглушки после первой загрузки — дальше она уходит без повторной выгрузки
+_placeholder_file_id: str | None = None
+
+
+class StatusMessage:
+    """Одно сообщение бота на весь запрос.
+
+    Этапы («Ищу…», «Генерирую…») правят одно и то же сообщение, а итог
+    становится его последней правкой — вместо «отправить статус → удалить →
+    отправить результат». Картинка-результат ставится через edit_message_media,
+    если статус был фото-заглушкой; текстовое сообщение в фото не превратить,
+    тогда статус удаляется.
+
+    После finish*() статус израсходован: следующий finish отправит новое сообщение.
+    """
+
+    def __init__(self, message: Message):
+        self.message = message  # входящее сообщение пользователя
+        self.msg: Message | None = None
+        self.is_photo = False
+        self.header = ""  # строка над этапами, например распознанный текст голосового
+        self.calls = 0
+
+    def _with_header(self, text: str) -> str:
+        return f"{self.header}\n\n{text}" if self.header else text
+
+    async def stage(self, text: str):
+        text = self._with_header(text)
+        if self.msg is None:
+            self.calls += 1
+            self.msg = await self.message.reply_text(text)
+            self.is_photo = False
+            return
+        if self.is_photo:
+            await self._edit_caption(text)
+        elif self.msg.text != text:
+            await self._edit_text(text)
+
+    async def stage_photo(self, caption: str):
+        """Этап в виде фото-заглушки — итоговая картинка заменит её правкой."""
+        global _placeholder_file_id
+        if self.msg is not None:
+            await self.stage(caption)
+            return
+        caption = self._with_header(caption)
+        self.calls += 1
+        try:
+            self.msg = await self.message.reply_photo(photo=_placeholder_file_id or placeholder_image(), caption=caption)
+        except BadRequest as e:
+            if _placeholder_file_id is None:
+                raise
+            logger.warning(f"[STATUS] file_id заглушки не принят, загружаю заново: {e}")
+            _placeholder_file_id = None
+            self.calls += 1
+            self.msg = await self.message.reply_photo(photo=placeholder_image(), caption=caption)
+        self.is_photo = True
+        if self.msg.photo:
+            _placeholder_file_id = self.msg.photo[-1].file_id
+
+    async def finish(self, text: str, parse_mode: str | None = None) -> Message:
+        msg, self.msg = self.msg, None
+        if msg is not None and not self.is_photo:
+            try:
+                self.calls += 1
+                edited = await msg.edit_text(text, parse_mode=parse_mode)
+                return edited if isinstance(edited, Message) else msg
+            except BadRequest as e:
+                logger.debug("[STATUS] не удалось отредактировать статус: %s", e)
+        if msg is not None:
+            await self._delete(msg)
+        self.calls += 1
+        return await self.message.reply_text(text, parse_mode=parse_mode)
+
+    async def finish_photo(self, photo, caption: str | None = None, **kwargs) -> Message:
+        """Совместима с reply_photo — подходит как send_photo для send_schedule_image."""
+        msg = self.msg
+        if msg is not None and self.is_photo:
+            self.calls += 1
+            try:
+                edited = await msg.edit_media(media=InputMediaPhoto(photo, caption=caption), **kwargs)
+            except BadRequest as e:
+                if isinstance(photo, str):
+                    raise  # устаревший file_id — вызывающий повторит с файлом
+                logger.debug("[STATUS] не удалось заменить заглушку: %s", e)
+            else:
+                self.msg = None
+                return edited if isinstance(edited, Message) else msg
+        await self.clear()
+        self.calls += 1
+        return await self.message.reply_photo(photo=photo, caption=caption, **kwargs)
+
+    async def clear(self):
+        """Убирает статус, если итог отправляется отдельно (например, альбомом)."""
+        msg, self.msg = self.msg, None
+        if msg is not None:
+            await self._delete(msg)
+
+    async def _edit_text(self, text: str):
+        self.calls += 1
+        try:
+            self.msg = await self.msg.edit_text(text)
+        except BadRequest as e:
+            logger.debug("[STATUS] не удалось обновить этап: %s", e)
+
+    async def _edit_caption(self, caption: str):
+        self.calls += 1
+        try:
+            self.msg = await self.msg.edit_caption(caption)
+        except BadRequest as e:
+            logger.debug("[STATUS] не удалось обновить подпись: %s", e)
+
+    async def _delete(self, msg: Message):
+        self.calls += 1
+        try:
+            await msg.delete()
+        except Exception:
+            pass
@@ -1,15 +1,14 @@
-import os
-import tempfile
-import time
+import io
 
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from bot.config import RATE_LIMIT_SECONDS, logger
-from bot.state import user_last_request
+from bot import admission
+from bot.config import logger
+from bot.services import voice_cache
 from bot.services.voice import transcribe_voice
 from bot.core.sheets import run_in_executor
-from bot.handlers.actions import safe_delete
+from bot.handlers.status import StatusMessage
 from bot.handlers.confirmations import handle_confirmation
 from bot.handlers.router import process_text
 
@@ -31,46 +30,60 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Ошибка handle_voice: {e}", exc_info=True)
 
 
+async def _download_and_transcribe(voice, context: ContextTypes.DEFAULT_TYPE) -> str:
+    file = await context.bot.get_file(voice.file_id)
+    audio = io.BytesIO()
+    try:
+        logger.debug("[VOICE] скачиваю файл в память (%s байт)", file.file_size or "?")
+        await file.download_to_memory(audio)
+        digest = voice_cache.content_hash(audio.getvalue())
+        text = voice_cache.get_by_hash(digest)
+        if text is not None:
+            logger.debug("[VOICE] совпадение по хэшу содержимого")
+            voice_cache.put(voice.file_unique_id, text)
+            return text
+        voice_cache.record_miss()
+        logger.debug("[VOICE] транскрибирую...")
+        text = await run_in_executor(transcribe_voice, audio)
+        voice_cache.put(voice.file_unique_id, text, digest)
+        return text
+    finally:
+        audio.close()
+
+
 async def _handle_voice_inner(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     duration = update.message.voice.duration
-    logger.info(f"[VOICE] user={user_id} duration={duration}s")
+    logger.info("[VOICE] user=%s duration=%ss", user_id, duration)
 
     if duration < 1:
-        logger.debug(f"[VOICE] user={user_id} слишком короткое ({duration}s)")
+        logger.debug("[VOICE] user=%s слишком короткое (%ss)", user_id, duration)
         await update.message.reply_text("⚠️ Слишком короткое сообщение.")
         return
-    now = time.time()
-    if now - user_last_request[user_id] < RATE_LIMIT_SECONDS:
-        logger.debug(f"[VOICE] user={user_id} rate limit")
-        await update.message.reply_text("⏳ Подожди немного...")
+    if not await admission.admit(user_id):
+        await update.message.reply_text("⏳ Слишком много сообщений подряд — подожди немного.")
         return
-    user_last_request[user_id] = now
 
-    tmp_msg = await update.message.reply_text("🎙 Обрабатываю...")
-    file = await context.bot.get_file(update.message.voice.file_id)
-
-    fd, path = tempfile.mkstemp(suffix=".ogg")
-    os.close(fd)
-    try:
-        logger.debug(f"[VOICE] скачиваю файл → {path}")
-        await file.download_to_drive(path)
-        logger.debug(f"[VOICE] транскрибирую...")
-        text = await run_in_executor(transcribe_voice, path)
-        logger.info(f"[VOICE] user={user_id} распознано: {text!r}")
-    except Exception as e:
-        logger.error(f"[VOICE] ошибка транскрибации: {e}", exc_info=True)
-        await safe_delete(tmp_msg)
-        await update.message.reply_text("❌ Не смог распознать. Попробуй ещё раз.")
-        return
-    finally:
-        if os.path.exists(path):
-            os.unlink(path)
+    voice = update.message.voice
+    status = StatusMessage(update.message)
+    text = voice_cache.get_by_unique_id(voice.file_unique_id)
+    if text is not None:
+        logger.info("[VOICE] user=%s из кэша: %r", user_id, text)
+    else:
+        await status.stage("🎙 Обрабатываю...")
+        try:
+            async with admission.slot(admission.READ):
+                text = await _download_and_transcribe(voice, context)
+            logger.info("[VOICE] user=%s распознано: %r", user_id, text)
+        except Exception as e:
+            logger.error(f"[VOICE] ошибка транскрибации: {e}", exc_info=True)
+            await status.finish("❌ Не смог распознать. Попробуй ещё раз.")
+            return
 
-    await safe_delete(tmp_msg)
-    recognized_msg = await update.message.reply_text(f"📝 Распознал: {text}")
-    await process_text(text, update, user_id)
-    await safe_delete(recognized_msg)
+    # Распознанный текст показывается над следующими этапами; итог его заменяет
+    status.header = f"📝 Распознал: {text}"
+    await process_text(text, status, user_id, origin="voice")
+    logger.debug("[VOICE] user=%s вызовов Bot API на ответ: %d", user_id, status.calls)
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -89,17 +102,21 @@ async def _handle_text_inner(update: Update, context: ContextTypes.DEFAULT_TYPE)
     message_text = update.message.text
     user_id = update.message.from_user.id
     chat_type = update.message.chat.type
-    logger.info(f"[TEXT] user={user_id} chat={chat_type} text={message_text!r:.100}")
+    logger.info("[TEXT] user=%s chat=%s text=%.100r", user_id, chat_type, message_text)
 
     if chat_type in ["group", "supergroup"]:
         if f"@{context.bot.username}" not in message_text:
             return
         message_text = message_text.replace(f"@{context.bot.username}", "").strip()
-        logger.debug(f"[TEXT] после удаления @mention: {message_text!r}")
-    if await handle_confirmation(update, user_id, message_text):
-        logger.debug(f"[TEXT] user={user_id} обработано как подтверждение")
+        logger.debug("[TEXT] после удаления @mention: %r", message_text)
+    if not await admission.admit(user_id):
+        await update.message.reply_text("⏳ Слишком много сообщений подряд — подожди немного.")
+        return
+    status = StatusMessage(update.message)
+    if await handle_confirmation(status, user_id, message_text):
+        logger.debug("[TEXT] user=%s обработано как подтверждение", user_id)
         return
-    await process_text(message_text, update, user_id)
+    await process_text(message_text, status, user_id)
 
 
 async def error_handler(update, context):
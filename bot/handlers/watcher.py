@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+from bot import config
+from bot.config import (
+    SCHEDULE_TARGETS, WATCH_ENABLED, WATCH_MIN_INTERVAL, WATCH_MAX_INTERVAL,
+    WATCH_NOTIFY_EMPLOYEES, MSK, logger,
+)
+from bot.state import snapshot, refresh_snapshot, update_snapshot, invalidate_cache, take_own_writes
+from bot.core.sheets import get_month_snapshots
+from bot.handlers.actions import compare_snapshots
+
+MAX_LINES = 30  # остальное — «и ещё N», чтобы не упереться в лимит сообщения
+
+# Отпечаток последнего увиденного содержимого листа: месяц → hash
+_fingerprints: dict[str, int] = {}
+_interval = WATCH_MIN_INTERVAL
+
+
+def _watched_months() -> list[str]:
+    today = datetime.now(MSK)
+    next_month = (today.replace(day=1) + timedelta(days=32)).strftime("%m")
+    return [today.strftime("%m"), next_month]
+
+
+def _external(changes: list) -> list:
+    """Убирает записи самого бота (правки, откаты, заполнение) — о них автор уже знает."""
+    own = take_own_writes([(c["name"], c["date"], c["new"]) for c in changes])
+    return [c for c, is_own in zip(changes, own) if not is_own]
+
+
+def _format(changes: list, title: str) -> str:
+    lines = [title]
+    for c in changes[:MAX_LINES]:
+        lines.append(f"👤 *{c['name']}* / {c['date']}: {c['old']} → *{c['new']}*")
+    if len(changes) > MAX_LINES:
+        lines.append(f"_…и ещё {len(changes) - MAX_LINES}_")
+    return "\n".join(lines)
+
+
+# ===================== ОПРОС =====================
+
+
+async def poll_changes() -> list:
+    """Один опрос: batchGet по наблюдаемым листам, дифф только изменившихся.
+
+    Лист сравнивается со снимком, только если его отпечаток сменился, —
+    спокойный опрос стоит один запрос к Sheets и пару хэшей.
+    """
+    changes = []
+    refresh_snapshot()
+    for month, part in (await get_month_snapshots(_watched_months())).items():
+        if part is None:
+            continue
+        fingerprint = hash(tuple(sorted(part.items())))
+        if _fingerprints.get(month) == fingerprint:
+            continue
+        _fingerprints[month] = fingerprint
+        old = {k: snapshot[k] for k in part if k in snapshot}
+        month_changes = _external(compare_snapshots(old, part)) if old else []
+        if month_changes:
+            invalidate_cache(month)  # картинки и подготовленный пост пересоберутся
+            changes += month_changes
+        if old != part:
+            update_snapshot(part)
+    return changes
+
+
+async def _notify(bot, changes: list):
+    text = _format(changes, f"✏️ *Правки в таблице: {len(changes)}*\n")
+    for chat_id, thread_id in SCHEDULE_TARGETS:
+        try:
+            await bot.send_message(chat_id=chat_id, message_thread_id=thread_id, text=text, parse_mode="Markdown")
+        except Exception as e:
+            logger.error(f"[WATCH] не удалось отправить правки в chat={chat_id}: {e}")
+    if not WATCH_NOTIFY_EMPLOYEES:
+        return
+    for name in {c["name"] for c in changes}:
+        telegram_id = config.EMPLOYEES.get(name, {}).get("telegram_id")
+        if not telegram_id:
+            continue
+        mine = [c for c in changes if c["name"] == name]
+        try:
+            await bot.send_message(chat_id=telegram_id, text=_format(mine, "✏️ *Твоё расписание изменили*\n"),
+                                   parse_mode="Markdown")
+        except Exception as e:
+            logger.warning(f"[WATCH] не удалось написать {name} ({telegram_id}): {e}")
+
+
+async def watch_changes(context):
+    """Задача job_queue: опрос, одно сообщение на найденные правки, следующий запуск.
+
+    Интервал удваивается, пока правок нет (до WATCH_MAX_INTERVAL), и
+    возвращается к WATCH_MIN_INTERVAL после правки — таблицу правят пачками.
+    """
+    global _interval
+    try:
+        changes = await poll_changes()
+    except Exception as e:
+        logger.warning(f"[WATCH] опрос не удался: {e}")
+        changes = None
+    if changes:
+        logger.info(f"[WATCH] найдено правок: {len(changes)}")
+        await _notify(context.bot, changes)
+        _interval = WATCH_MIN_INTERVAL
+    else:
+        _interval = min(_interval * 2, WATCH_MAX_INTERVAL)
+    context.job_queue.run_once(watch_changes, when=_interval, name="watch_changes")
+
+
+def setup_change_watcher(app):
+    if not WATCH_ENABLED or not SCHEDULE_TARGETS:
+        logger.info("Фоновая проверка правок выключена (WATCH_ENABLED=0 или нет SCHEDULE_TARGETS)")
+        return
+    app.job_queue.run_once(watch_changes, when=WATCH_MIN_INTERVAL, name="watch_changes")
+    logger.info(f"Фоновая проверка правок: каждые {WATCH_MIN_INTERVAL}–{WATCH_MAX_INTERVAL}с")
@@ -0,0 +1,209 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# Логи уходят в очередь, а форматирование и запись на диск — в фоновом потоке
+# QueueListener: вызов logger.* в event loop стоит постановки в очередь.
+# Модуль не импортирует bot.config — config сам вызывает setup_logging()
+# (кроме дочерних процессов multiprocessing — те пишут через родителя).
+
+_listeners: list[QueueListener] = []
+_lock = threading.Lock()
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+# ===================== ФОРМАТ =====================
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, поток, сообщение, исключение."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# ===================== РОТАЦИЯ =====================
+
+
+class SizeTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Ротация по времени (when) и по размеру (max_bytes), что наступит раньше.
+
+    Файлы получают суффикс времени; несколько ротаций по размеру за один
+    интервал — ещё и .1, .2, …; хранятся backup_count последних.
+    """
+
+    def __init__(self, filename: str, when: str = "midnight", max_bytes: int = 0, backup_count: int = 7):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if not self.max_bytes:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.seek(0, 2)
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Номер — больше всех существующих, чтобы порядок имён совпадал с порядком ротаций
+        name = super().rotation_filename(default_name)
+        folder, base = os.path.split(name)
+        taken = [f[len(base):] for f in os.listdir(folder or ".") if f.startswith(base)]
+        if not taken:
+            return name
+        n = max(int(t[1:]) if t[1:].isdigit() else 0 for t in taken) + 1
+        return f"{name}.{n}"
+
+    def getFilesToDelete(self) -> list[str]:
+        # Базовый класс сортирует имена как строки — «.10» оказался бы старше «.9»
+        folder, base = os.path.split(self.baseFilename)
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if f.startswith(f"{base}.")]
+        files.sort(key=os.path.getmtime)
+        return files[:max(0, len(files) - self.backupCount)]
+
+
+# ===================== ФИЛЬТРЫ =====================
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает каждую N-ю DEBUG-запись с одним шаблоном сообщения (первая — всегда).
+
+    Шаблон — record.msg, поэтому сэмплирование работает для %-логов:
+    logger.debug("[ORDER] key=%s ...", key) — у всех таких записей один шаблон.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen: dict = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        n = self._seen.get(key, 0)
+        if len(self._seen) > 10_000:
+            self._seen.clear()
+        self._seen[key] = n + 1
+        return n % self.every == 0
+
+
+class _LazyQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() форматирует запись целиком (время, traceback); здесь
+    только подставляются аргументы, чтобы изменяемые объекты не поменялись,
+    пока запись ждёт в очереди. Остальное делают обработчики в потоке слушателя.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def queue_handler(*handlers: logging.Handler) -> QueueHandler:
+    """Обработчик-очередь перед handlers; поток-слушатель запускается сразу."""
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    with _lock:
+        _listeners.append(listener)
+    return _LazyQueueHandler(q)
+
+
+class _Redispatch(logging.Handler):
+    """Запись из дочернего процесса — в одноимённый логгер этого процесса."""
+
+    def emit(self, record: logging.LogRecord):
+        logging.getLogger(record.name).handle(record)
+
+
+def child_log_queue(ctx) -> queue.Queue:
+    """Очередь для логов дочерних процессов (ctx — контекст multiprocessing).
+
+    У дочерних процессов нет своего файла лога: их записи через эту очередь
+    пишет родитель, как свои.
+    """
+    q = ctx.Queue()
+    listener = QueueListener(q, _Redispatch())
+    listener.start()
+    with _lock:
+        _listeners.append(listener)
+    return q
+
+
+def log_to_queue(q, level: str):
+    """В дочернем процессе: все записи — в очередь от child_log_queue()."""
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(QueueHandler(q))  # стандартный prepare: запись уходит через pickle
+    root.setLevel(level.upper())
+
+
+def stop_logging():
+    """Дописывает очередь и останавливает потоки — перед выходом из процесса."""
+    with _lock:
+        listeners, _listeners[:] = list(_listeners), []
+    for listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+# ===================== НАСТРОЙКА =====================
+
+
+def parse_levels(spec: str) -> dict[str, str]:
+    """ "bot=DEBUG,telegram=WARNING" → {"bot": "DEBUG", "telegram": "WARNING"}."""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(
+    level: str, filename: str, json_file: bool, max_bytes: int, when: str, backups: int,
+    levels: dict[str, str], debug_sample: int,
+):
+    """Корневой логгер: очередь → (файл с ротацией, консоль)."""
+    file_handler = SizeTimedRotatingFileHandler(filename, when=when, max_bytes=max_bytes, backup_count=backups)
+    file_handler.setFormatter(JsonFormatter() if json_file else logging.Formatter(TEXT_FORMAT))
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    handler = queue_handler(file_handler, console)
+    handler.addFilter(DebugSampler(debug_sample))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    atexit.register(stop_logging)
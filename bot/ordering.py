@@ -0,0 +1,69 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot.config import logger
+from bot.tracing import trace
+
+
+def update_key(update: object) -> int | None:
+    """Ключ очереди апдейта: пользователь, а если его нет — чат."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Апдейты разных пользователей — параллельно (до max_concurrent_updates),
+    апдейты одного пользователя — строго по очереди.
+
+    Замок пользователя берётся до общего семафора: пока ждёт очередь одного
+    человека, слот параллельности не занят и другие пользователи не стоят.
+    asyncio.Lock отдаёт захват в порядке ожидания, а задачи на апдейты
+    создаются в порядке поступления — «да» всегда обработается после запроса,
+    который оно подтверждает.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._waiting: dict[int, int] = {}
+
+    async def process_update(self, update: object, coroutine) -> None:
+        key = update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        if lock.locked():
+            logger.debug("[ORDER] key=%s ждёт предыдущий апдейт (%d впереди)", key, self._waiting[key] - 1)
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._waiting[key] -= 1
+            if self._waiting[key] == 0:
+                del self._waiting[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        # Трейс открывается, когда апдейт дождался очереди пользователя и слота
+        with trace(getattr(update, "update_id", None), update_key(update)):
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def queued_keys(self) -> int:
+        """Сколько пользователей сейчас в обработке или в очереди."""
+        return len(self._locks)
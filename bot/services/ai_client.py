@@ -1,11 +1,18 @@
 import json
 import re
+import time
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-import anthropic
-
-from bot.config import ANTHROPIC_API_KEY, NAMES, DAYS_RU, MONTHS_SHEETS, MSK, logger
+from bot import config
+from bot.config import ANTHROPIC_API_KEY, DAYS_RU, MONTHS_SHEETS, MSK, logger
 from bot.state import append_user_context, get_user_context
+from bot.core.metrics import record_llm_call
+from bot.tracing import traced
+from bot.core.stats import METRICS as STATS_METRICS
+
+if TYPE_CHECKING:
+    import anthropic
 
 _client = None
 
@@ -14,24 +21,33 @@ CHAT_MODEL = "claude-haiku-4-5"
 
 VALID_ACTIONS = {
     "update", "update_many", "show_period", "show_history",
-    "show_changes_period", "show_workers", "check_changes",
-    "fill_schedule", "undo", "undo_batch",
+    "show_changes_period", "show_workers", "check_changes", "check_coverage",
+    "show_stats", "fill_schedule", "undo", "undo_batch",
     "cheer", "chat", "unknown",
 }
 
 
-def _get_client() -> anthropic.Anthropic:
+def _get_client() -> "anthropic.Anthropic":
+    """SDK импортируется здесь: это самый тяжёлый импорт бота (≈1–2 с)."""
     global _client
     if _client is None:
+        import anthropic
         _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
     return _client
 
 
+def warm_client():
+    """Импорт SDK и создание клиента заранее — для прогрева после старта."""
+    _get_client()
+
+
 # ===================== КЛАССИФИКАЦИЯ ОШИБОК =====================
 
 
 def _classify_error(e: Exception) -> RuntimeError:
     """Превращает ошибку Anthropic API в понятное сообщение для пользователя."""
+    import anthropic
+
     if isinstance(e, anthropic.RateLimitError):
         logger.warning(f"Claude 429 rate limit: {e}")
         return RuntimeError("Слишком много запросов, подожди немного")
@@ -63,7 +79,7 @@ def _get_system_prompt() -> str:
     return f"""Ты помощник для управления расписанием сотрудников.
 Сегодняшняя дата: {today.strftime('%d.%m.%Y')}, {DAYS_RU[today.weekday()]}.
 Текущий год: {year}.
-Сотрудники: {', '.join(NAMES)}.
+Сотрудники: {', '.join(config.NAMES)}.
 
 Твоя задача — распознать намерение пользователя и вернуть JSON.
 
@@ -75,7 +91,9 @@ def _get_system_prompt() -> str:
 - "show_changes_period" — кто менялся за период
 - "show_workers" — кто работает в конкретный день
 - "check_changes" — проверить изменения в таблице
-- "fill_schedule" — заполнить месяц по паттерну 2/2
+- "check_coverage" — проверить покрытие смен: дыры, когда никого нет, и перебор людей
+- "show_stats" — статистика: часы, смены, ночные смены, переработка
+- "fill_schedule" — заполнить месяц, квартал или год по графику сотрудников
 - "undo" — вернуть предыдущее значение
 - "undo_batch" — отменить последнее массовое обновление
 - "cheer" — похвалить/поддержать/подбодрить
@@ -90,7 +108,10 @@ show_history: {{"action":"show_history"}}
 show_changes_period: {{"action":"show_changes_period","date_from":"11.02","date_to":"18.02"}}
 show_workers: {{"action":"show_workers","date":"18.02"}}
 check_changes: {{"action":"check_changes"}}
+check_coverage: {{"action":"check_coverage","date_from":"01.03","date_to":"31.03"}}
+show_stats: {{"action":"show_stats","date_from":"01.02","date_to":"28.02","name":"Вова","metric":"hours"}}
 fill_schedule: {{"action":"fill_schedule","month":"03","year":{year}}}
+fill_schedule (несколько месяцев): {{"action":"fill_schedule","months":["04","05","06"],"year":{year}}}
 undo: {{"action":"undo","name":"Вова","date":"18.02"}}
 undo_batch: {{"action":"undo_batch"}}
 cheer: {{"action":"cheer","type":"praise"}}
@@ -101,6 +122,10 @@ unknown: {{"action":"unknown"}}
 - "заполни март" → month="03", year={year}
 - "заполни следующий месяц" → следующий месяц
 - "заполни май 2027" → month="05", year=2027
+- "заполни квартал" → months = три месяца текущего квартала
+- "заполни второй квартал" → months=["04","05","06"]; "заполни следующий квартал" → следующий квартал
+- "заполни год", "заполни 2027 год" → months = все 12 месяцев ("01"…"12")
+- "заполни апрель и май" → months=["04","05"]
 - Месяц всегда 2 цифры: "03", "04" и т.д.
 - Если год не указан → {year}
 
@@ -120,6 +145,11 @@ unknown: {{"action":"unknown"}}
 - Имена в любом падеже: Вове → "Вова"
 - "кто менялся" → show_history/show_changes_period, НЕ show_period
 - "кто работает" → show_workers, НЕ show_period
+- "покрытие", "есть ли дыры", "все ли часы закрыты", "перебор" → check_coverage (без периода — текущий месяц)
+- "сколько часов", "сколько смен", "у кого больше всего смен/ночей", "переработка" → show_stats
+  - name — только если спрашивают про одного сотрудника, иначе не указывай
+  - metric: "hours" (часы), "shifts" (смены), "night" (ночные смены), "overtime" (переработка)
+  - без периода — текущий месяц
 - "расписание/смены/график/покажи" → show_period
 - Верни ТОЛЬКО валидный JSON без markdown"""
 
@@ -140,11 +170,28 @@ def _validate_parsed(result: dict) -> dict | None:
             return None
 
     if action == "fill_schedule":
-        month = str(result.get("month", "")).zfill(2)
-        if month not in MONTHS_SHEETS:
-            logger.warning(f"LLM: невалидный месяц для fill_schedule: {month}")
+        raw_months = result.get("months")
+        if raw_months is None:
+            raw_months = [result.get("month", "")]
+        if not isinstance(raw_months, list) or not raw_months:
+            logger.warning(f"LLM: невалидный список месяцев для fill_schedule: {raw_months}")
             return None
-        result["month"] = month
+        months = sorted({str(m).zfill(2) for m in raw_months})
+        bad = [m for m in months if m not in MONTHS_SHEETS]
+        if bad:
+            logger.warning(f"LLM: невалидный месяц для fill_schedule: {bad}")
+            return None
+        result["months"] = months
+        result["month"] = months[0]
+
+    if action == "show_stats":
+        if not result.get("date_from") or not result.get("date_to"):
+            logger.warning("LLM: show_stats без периода")
+            return None
+        if result.get("metric") not in STATS_METRICS:
+            result["metric"] = "hours"
+        if result.get("name") not in config.NAMES:
+            result["name"] = None
 
     return result
 
@@ -152,16 +199,26 @@ def _validate_parsed(result: dict) -> dict | None:
 # ===================== ПАРСИНГ =====================
 
 
-def parse_with_claude(text: str, user_id: int) -> dict:
-    """Классифицирует намерение пользователя через Claude API."""
-    logger.info(f"[PARSE] user={user_id} text={text!r}")
+@traced("llm.parse")
+def parse_with_claude(text: str, user_id: int, meta: dict | None = None) -> dict:
+    """Классифицирует намерение пользователя через Claude API.
+
+    meta, если передан, заполняется подробностями разбора для корпуса запросов:
+    source ("llm" или "fallback"), model, raw (ответ модели), latency, usage.
+    """
+    logger.info("[PARSE] user=%s text=%r", user_id, text)
+    started = time.monotonic()
+    response = None
+    raw = None
+    if meta is None:
+        meta = {}
     try:
         today = datetime.now(MSK)
         messages = []
 
         ctx = get_user_context(user_id)[-3:]
         if ctx:
-            logger.debug(f"[PARSE] контекст пользователя ({len(ctx)} сообщ.): {ctx}")
+            logger.debug("[PARSE] контекст пользователя (%d сообщ.): %.300s", len(ctx), ctx)
         for prev in ctx:
             messages.append({"role": "user", "content": prev})
             messages.append({"role": "assistant", "content": '{"action":"chat"}'})
@@ -171,7 +228,7 @@ def parse_with_claude(text: str, user_id: int) -> dict:
             "content": f"Сегодня {today.strftime('%d.%m.%Y')} ({DAYS_RU[today.weekday()]}). Запрос: {text}",
         })
 
-        logger.debug(f"[PARSE] отправляю {len(messages)} сообщений в Claude ({PARSE_MODEL})")
+        logger.debug("[PARSE] отправляю %d сообщений в Claude (%s)", len(messages), PARSE_MODEL)
         response = _get_client().messages.create(
             model=PARSE_MODEL,
             max_tokens=1000,
@@ -180,33 +237,42 @@ def parse_with_claude(text: str, user_id: int) -> dict:
         )
 
         raw = response.content[0].text.strip()
-        logger.debug(f"[PARSE] raw ответ Claude: {raw!r}")
-        logger.debug(f"[PARSE] usage: input={response.usage.input_tokens} output={response.usage.output_tokens}")
+        logger.debug("[PARSE] raw ответ Claude: %.300r", raw)
+        logger.debug("[PARSE] usage: input=%s output=%s", response.usage.input_tokens, response.usage.output_tokens)
 
         raw = re.sub(r"```json|```", "", raw).strip()
         result = json.loads(raw)
-        logger.info(f"[PARSE] результат: {result}")
+        logger.info("[PARSE] результат: %s", result)
 
         validated = _validate_parsed(result)
         if validated is None:
             logger.warning("[PARSE] ответ LLM не прошёл валидацию, fallback на chat")
             validated = {"action": "chat"}
 
+        latency = time.monotonic() - started
+        record_llm_call(PARSE_MODEL, "parse", validated["action"], user_id, latency, response.usage)
+        meta.update(source="llm", model=PARSE_MODEL, raw=raw, latency=latency, usage=response.usage)
         append_user_context(user_id, text)
         return validated
 
     except (json.JSONDecodeError, IndexError, KeyError) as e:
         logger.error(f"[PARSE] ошибка парсинга ответа Claude: {e}", exc_info=True)
+        latency = time.monotonic() - started
+        usage = getattr(response, "usage", None)
+        record_llm_call(PARSE_MODEL, "parse", "chat", user_id, latency, usage, e)
+        meta.update(source="fallback", model=PARSE_MODEL, raw=raw, latency=latency, usage=usage)
         return {"action": "chat"}
     except Exception as e:
         logger.error(f"[PARSE] ошибка API: {e}")
+        record_llm_call(PARSE_MODEL, "parse", None, user_id, time.monotonic() - started, error=e)
         raise _classify_error(e) from e
 
 
 # ===================== ГЕНЕРАЦИЯ ТЕКСТА =====================
 
 
-def generate_cheer_and_chat(cheer_type: str = None, chat_text: str = None) -> str:
+@traced("llm.chat")
+def generate_cheer_and_chat(cheer_type: str = None, chat_text: str = None, user_id: int | None = None) -> str:
     """Генерирует ответ для подбадривания или свободного чата."""
     if cheer_type:
         prompts = {
@@ -244,9 +310,11 @@ def generate_cheer_and_chat(cheer_type: str = None, chat_text: str = None) -> st
         )
         max_tokens = 500
 
+    call = "cheer" if cheer_type else "chat"
+    started = time.monotonic()
     try:
         mode = f"cheer:{cheer_type}" if cheer_type else "chat"
-        logger.info(f"[CHAT] mode={mode} text={user_text!r:.80}")
+        logger.info("[CHAT] mode=%s text=%.80r", mode, user_text)
         response = _get_client().messages.create(
             model=CHAT_MODEL,
             max_tokens=max_tokens,
@@ -254,9 +322,11 @@ def generate_cheer_and_chat(cheer_type: str = None, chat_text: str = None) -> st
             messages=[{"role": "user", "content": user_text}],
         )
         result = response.content[0].text.strip()
-        logger.info(f"[CHAT] ответ ({len(result)} симв.): {result!r:.100}")
-        logger.debug(f"[CHAT] usage: input={response.usage.input_tokens} output={response.usage.output_tokens}")
+        logger.info("[CHAT] ответ (%d симв.): %.100r", len(result), result)
+        logger.debug("[CHAT] usage: input=%s output=%s", response.usage.input_tokens, response.usage.output_tokens)
+        record_llm_call(CHAT_MODEL, call, call, user_id, time.monotonic() - started, response.usage)
         return result
     except Exception as e:
         logger.error(f"[CHAT] ошибка API: {e}")
+        record_llm_call(CHAT_MODEL, call, call, user_id, time.monotonic() - started, error=e)
         raise _classify_error(e) from e
@@ -0,0 +1,149 @@
+import io
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+
+from bot.config import (
+    VOICE_PREPROCESS, VOICE_CHUNK_SECONDS, VOICE_MIN_CHUNK_SECONDS, VOICE_SILENCE_DB,
+    logger,
+)
+
+# Whisper внутри всё равно работает с 16 кГц моно
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+KEEP_PAD_MS = 200
+MIN_TRIM_SECONDS = 0.5
+
+_FFMPEG = shutil.which("ffmpeg")
+
+
+# ===================== FFMPEG =====================
+
+
+def _ffmpeg(args: list[str], data: bytes) -> bytes:
+    proc = subprocess.run(
+        [_FFMPEG, "-hide_banner", "-loglevel", "error", *args],
+        input=data, capture_output=True, timeout=60, check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg: {proc.stderr.decode(errors='replace')[:200]}")
+    return proc.stdout
+
+
+def decode_pcm(data: bytes) -> np.ndarray:
+    """OGG/Opus → 16 кГц моно int16, целиком через пайпы."""
+    raw = _ffmpeg(["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"], data)
+    return np.frombuffer(raw, dtype=np.int16)
+
+
+def encode_chunk(pcm: np.ndarray) -> tuple[bytes, str]:
+    """Кодирует кусок обратно в Opus; без libopus — в WAV."""
+    raw = pcm.astype(np.int16).tobytes()
+    if _FFMPEG:
+        try:
+            return _ffmpeg([
+                "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+                "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1",
+            ], raw), "chunk.ogg"
+        except Exception as e:
+            logger.debug(f"[AUDIO] opus недоступен, отдаю WAV: {e}")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(raw)
+    return buf.getvalue(), "chunk.wav"
+
+
+# ===================== АНАЛИЗ =====================
+
+
+def frame_levels(pcm: np.ndarray) -> np.ndarray:
+    """RMS каждого кадра в dBFS."""
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    n = len(pcm) // frame
+    if n == 0:
+        return np.empty(0)
+    frames = pcm[: n * frame].astype(np.float32).reshape(n, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+
+def trim_silence(pcm: np.ndarray, threshold_db: float = VOICE_SILENCE_DB) -> np.ndarray:
+    levels = frame_levels(pcm)
+    voiced = np.flatnonzero(levels > threshold_db)
+    if voiced.size == 0:
+        return pcm[:0]
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    pad = SAMPLE_RATE * KEEP_PAD_MS // 1000
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(pcm), (voiced[-1] + 1) * frame + pad)
+    return pcm[start:end]
+
+
+def split_on_silence(
+    pcm: np.ndarray,
+    max_seconds: float = VOICE_CHUNK_SECONDS,
+    min_seconds: float = VOICE_MIN_CHUNK_SECONDS,
+) -> list[np.ndarray]:
+    """Режет длинную запись на куски не длиннее max_seconds по самым тихим кадрам.
+
+    Кусок — хотя бы один кадр, иначе разрез может остаться на месте навсегда.
+    """
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    max_frames = max(2, int(max_seconds * 1000 // FRAME_MS))
+    min_frames = max(1, min(int(min_seconds * 1000 // FRAME_MS), max_frames - 1))
+    levels = frame_levels(pcm)
+    total = len(levels)
+
+    cuts = [0]
+    start = 0
+    while total - start > max_frames:
+        lo, hi = start + min_frames, start + max_frames
+        cut = lo + int(np.argmin(levels[lo:hi]))
+        cuts.append(cut)
+        start = cut
+    bounds = [c * frame for c in cuts] + [len(pcm)]
+    return [pcm[a:b] for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+# ===================== ПАЙПЛАЙН =====================
+
+
+def preprocessing_enabled() -> bool:
+    """Нужны ли байты записи: без ffmpeg или с VOICE_PREPROCESS=0 файл уходит как есть."""
+    return VOICE_PREPROCESS and _FFMPEG is not None
+
+
+def prepare_audio(data: bytes) -> list[tuple[bytes, str]] | None:
+    """Готовит запись к распознаванию: обрезка тишины, 16 кГц моно, нарезка.
+
+    None — отправить исходный файл как есть: предобработка выключена или
+    короткой записи без заметной тишины по краям она не нужна (не теряем
+    качество на перекодировании).
+    """
+    if not preprocessing_enabled():
+        return None
+    try:
+        pcm = decode_pcm(data)
+    except Exception as e:
+        logger.warning(f"[AUDIO] не удалось декодировать, отправляю как есть: {e}")
+        return None
+
+    trimmed = trim_silence(pcm)
+    if trimmed.size == 0:
+        logger.debug("[AUDIO] в записи одна тишина")
+        return None
+    original_s = len(pcm) / SAMPLE_RATE
+    trimmed_s = len(trimmed) / SAMPLE_RATE
+    if trimmed_s <= VOICE_CHUNK_SECONDS and original_s - trimmed_s < MIN_TRIM_SECONDS:
+        return None
+
+    chunks = split_on_silence(trimmed)
+    logger.debug(
+        f"[AUDIO] {original_s:.1f}с → {trimmed_s:.1f}с после обрезки, кусков: {len(chunks)}"
+    )
+    return [encode_chunk(c) for c in chunks]
@@ -0,0 +1,70 @@
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from bot.config import (
+    CORPUS_ENABLED, CORPUS_FILE, CORPUS_MAX_BYTES, CORPUS_BACKUPS, CORPUS_SALT, MSK, logger,
+)
+from bot.logs import queue_handler
+
+# Без соли ID всё равно хэшируются, но со случайной солью на запуск —
+# между перезапусками один и тот же человек получит разные ID
+_salt = (CORPUS_SALT or secrets.token_hex(16)).encode()
+
+_writer: logging.Logger | None = None
+
+
+def _get_writer() -> logging.Logger:
+    """Отдельный логгер с ротацией по размеру: строка JSONL — одна запись.
+
+    Пишет через свою очередь — диск не трогается в event loop.
+    """
+    global _writer
+    if _writer is None:
+        if not CORPUS_SALT:
+            logger.warning("[CORPUS] CORPUS_SALT не задан — ID пользователей не будут стабильны между запусками")
+        _writer = logging.getLogger("bot.corpus")
+        _writer.propagate = False
+        _writer.setLevel(logging.INFO)
+        handler = RotatingFileHandler(
+            CORPUS_FILE, maxBytes=CORPUS_MAX_BYTES, backupCount=CORPUS_BACKUPS, encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _writer.addHandler(queue_handler(handler))
+    return _writer
+
+
+def anon_user(user_id: int) -> str:
+    return hmac.new(_salt, str(user_id).encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def record(user_id: int, origin: str, text: str, parsed: dict, meta: dict):
+    """Пишет запрос в корпус: origin — "text" или "voice", meta — из parse_with_claude."""
+    if not CORPUS_ENABLED:
+        return
+    usage = meta.get("usage")
+    entry = {
+        "ts": datetime.now(MSK).isoformat(timespec="seconds"),
+        "user": anon_user(user_id),
+        "origin": origin,
+        "text": text,
+        "action": parsed.get("action"),
+        "parsed": parsed,
+        "source": meta.get("source"),
+        "model": meta.get("model"),
+        "raw": meta.get("raw"),
+        "latency_ms": round(meta.get("latency", 0.0) * 1000, 1),
+        "tokens": {
+            "input": getattr(usage, "input_tokens", 0) or 0,
+            "output": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        },
+    }
+    try:
+        _get_writer().info(json.dumps(entry, ensure_ascii=False))
+    except Exception as e:
+        logger.warning(f"[CORPUS] не удалось записать запрос: {e}")
@@ -1,29 +1,95 @@
-import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Protocol
 
-from groq import Groq
+from bot.config import GROQ_API_KEY, VOICE_CHUNK_WORKERS, logger
+from bot.services.audio import prepare_audio, preprocessing_enabled
+from bot.tracing import traced
 
-from bot.config import GROQ_API_KEY, logger
+if TYPE_CHECKING:
+    from groq import Groq
 
-_groq_client = None
+_chunk_executor = ThreadPoolExecutor(max_workers=VOICE_CHUNK_WORKERS)
 
 
-def _get_client() -> Groq:
-    global _groq_client
-    if _groq_client is None:
-        _groq_client = Groq(api_key=GROQ_API_KEY)
-    return _groq_client
+# ===================== БЭКЕНДЫ =====================
 
 
-def transcribe_voice(ogg_path: str) -> str:
-    """Транскрибирует голосовое сообщение через Groq Whisper API."""
-    try:
-        with open(ogg_path, "rb") as f:
-            transcription = _get_client().audio.transcriptions.create(
-                file=(os.path.basename(ogg_path), f.read()),
-                model="whisper-large-v3",
-                language="ru",
-            )
+class TranscriptionBackend(Protocol):
+    def transcribe(self, audio: BinaryIO | bytes, filename: str) -> str: ...
+
+
+class GroqWhisperBackend:
+    """Groq Whisper API."""
+
+    def __init__(self):
+        self._client = None
+
+    def _get_client(self) -> "Groq":
+        if self._client is None:
+            from groq import Groq
+            self._client = Groq(api_key=GROQ_API_KEY)
+        return self._client
+
+    def transcribe(self, audio: BinaryIO | bytes, filename: str) -> str:
+        transcription = self._get_client().audio.transcriptions.create(
+            file=(filename, audio),
+            model="whisper-large-v3",
+            language="ru",
+        )
         return transcription.text.strip()
+
+
+_backend: TranscriptionBackend | None = None
+
+
+def get_backend() -> TranscriptionBackend:
+    global _backend
+    if _backend is None:
+        _backend = GroqWhisperBackend()
+    return _backend
+
+
+def warm_backend():
+    """Создаёт клиент бэкенда заранее (для Groq — импорт SDK)."""
+    backend = get_backend()
+    if isinstance(backend, GroqWhisperBackend):
+        backend._get_client()
+
+
+def set_backend(backend: TranscriptionBackend | None):
+    """Подменяет бэкенд распознавания (например, локальным фейком)."""
+    global _backend
+    _backend = backend
+
+
+# ===================== РАСПОЗНАВАНИЕ =====================
+
+
+@traced("transcribe")
+def transcribe_voice(audio: BinaryIO, filename: str = "voice.ogg") -> str:
+    """Транскрибирует голосовое сообщение.
+
+    Без предобработки файл уходит в бэкенд как есть, потоком; иначе запись
+    читается целиком для ffmpeg, а куски длинной записи распознаются
+    параллельно и склеиваются по порядку.
+    """
+    try:
+        audio.seek(0)
+        chunks = prepare_audio(audio.read()) if preprocessing_enabled() else None
+        backend = get_backend()
+        if chunks is None:
+            audio.seek(0)
+            return backend.transcribe(audio, filename).strip()
+        if len(chunks) == 1:
+            data, name = chunks[0]
+            return backend.transcribe(data, name).strip()
+        logger.debug("[VOICE] распознаю %d кусков параллельно", len(chunks))
+        parts = list(_chunk_executor.map(lambda c: backend.transcribe(c[0], c[1]), chunks))
+        return " ".join(p.strip() for p in parts if p.strip())
     except Exception as e:
         logger.error(f"Ошибка транскрибации: {e}")
         raise
+
+
+def shutdown_voice_executor():
+    _chunk_executor.shutdown(wait=False)
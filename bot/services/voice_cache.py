@@ -0,0 +1,153 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from bot.config import (
+    TRANSCRIPT_CACHE_FILE, TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_TTL, TRANSCRIPT_CACHE_HASH,
+)
+from bot.core.metrics import register_collector
+from bot.shared import SharedJsonFile
+
+# Ключи: "uid:<file_unique_id>" и "sha:<sha256 содержимого>"
+_lock = threading.Lock()
+_stats = {"hit_uid": 0, "hit_hash": 0, "miss": 0}
+# Новые записи держатся в памяти и сбрасываются на диск flush() — раз в
+# TRANSCRIPT_CACHE_FLUSH_INTERVAL и при остановке, а не на каждую расшифровку
+_dirty = False
+
+
+# ===================== ДИСК =====================
+
+# Файл общий для воркеров вебхука: flush() сливает свои записи с чужими
+_file = SharedJsonFile(TRANSCRIPT_CACHE_FILE)
+
+
+def _fresh(data: dict) -> list[tuple[str, dict]]:
+    now = time.time()
+    return [(k, v) for k, v in data.items() if now - v.get("ts", 0) < TRANSCRIPT_CACHE_TTL]
+
+
+def _load() -> OrderedDict:
+    fresh = _fresh(_file.read())
+    fresh.sort(key=lambda kv: kv[1]["ts"])
+    return OrderedDict(fresh[-TRANSCRIPT_CACHE_SIZE:])
+
+
+_cache: OrderedDict = _load()
+
+
+# ===================== ОПЕРАЦИИ =====================
+
+
+def content_hash(audio: bytes) -> str | None:
+    """Хэш содержимого или None, если поиск по хэшу выключен."""
+    if not TRANSCRIPT_CACHE_HASH:
+        return None
+    return hashlib.sha256(audio).hexdigest()
+
+
+def _get(key: str) -> str | None:
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    if time.time() - entry["ts"] >= TRANSCRIPT_CACHE_TTL:
+        _cache.pop(key, None)
+        return None
+    _cache.move_to_end(key)
+    return entry["text"]
+
+
+def get_by_unique_id(file_unique_id: str) -> str | None:
+    """Ищет расшифровку по file_unique_id — до скачивания файла."""
+    with _lock:
+        text = _get(f"uid:{file_unique_id}")
+        if text is not None:
+            _stats["hit_uid"] += 1
+        return text
+
+
+def get_by_hash(digest: str | None) -> str | None:
+    """Ищет расшифровку по хэшу содержимого (переотправленный файл с новым ID)."""
+    if digest is None:
+        return None
+    with _lock:
+        text = _get(f"sha:{digest}")
+        if text is not None:
+            _stats["hit_hash"] += 1
+        return text
+
+
+def record_miss():
+    with _lock:
+        _stats["miss"] += 1
+
+
+def put(file_unique_id: str, text: str, digest: str | None = None):
+    global _dirty
+    if not text:
+        return
+    entry = {"text": text, "ts": time.time()}
+    keys = [f"uid:{file_unique_id}"] + ([f"sha:{digest}"] if digest else [])
+    with _lock:
+        for key in keys:
+            _cache[key] = entry
+            _cache.move_to_end(key)
+        while len(_cache) > TRANSCRIPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+        _dirty = True
+
+
+def flush():
+    """Пишет новые записи на диск, заодно подхватывая записи других воркеров.
+
+    Блокирует — вызывается из пула потоков и при остановке.
+    """
+    global _dirty
+    if not _dirty and not _file.changed():
+        return
+    with _file.lock():
+        theirs = _fresh(_file.read()) if _file.changed() else []
+        with _lock:
+            for key, entry in theirs:
+                mine = _cache.get(key)
+                if mine is None or mine["ts"] < entry["ts"]:
+                    _cache[key] = entry
+            while len(_cache) > TRANSCRIPT_CACHE_SIZE:
+                _cache.popitem(last=False)
+            data = dict(_cache) if _dirty or theirs else None
+            _dirty = False
+        if data is not None and not _file.write(data, indent=None):
+            _dirty = True
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_cache)
+    lookups = stats["hit_uid"] + stats["hit_hash"] + stats["miss"]
+    stats["hit_rate"] = (stats["hit_uid"] + stats["hit_hash"]) / lookups if lookups else 0.0
+    return stats
+
+
+def cache_summary() -> str:
+    s = cache_stats()
+    return (
+        f"🎙 Кэш распознавания: попаданий {s['hit_uid']} по ID, {s['hit_hash']} по хэшу, "
+        f"промахов {s['miss']} ({s['hit_rate']:.0%}), записей {s['size']}"
+    )
+
+
+@register_collector
+def _prometheus_lines() -> list[str]:
+    s = cache_stats()
+    return [
+        "# HELP transcript_cache_lookups_total Обращения к кэшу распознавания",
+        "# TYPE transcript_cache_lookups_total counter",
+        f'transcript_cache_lookups_total{{result="hit_uid"}} {s["hit_uid"]}',
+        f'transcript_cache_lookups_total{{result="hit_hash"}} {s["hit_hash"]}',
+        f'transcript_cache_lookups_total{{result="miss"}} {s["miss"]}',
+        "# HELP transcript_cache_entries Записей в кэше распознавания",
+        "# TYPE transcript_cache_entries gauge",
+        f"transcript_cache_entries {s['size']}",
+    ]
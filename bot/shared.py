@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: воркеров вебхука там нет, хватает блокировки потоков
+    fcntl = None
+
+from bot.config import logger
+
+# JSON-файлы состояния, общие для всех процессов бота: при WEBHOOK_WORKERS > 1
+# историю, снимок таблицы и outbox читают и пишут несколько воркеров сразу.
+# Запись — только под lock() (lockf на соседнем .lock-файле) и атомарно через
+# replace; перед чтением процесс перечитывает файл, если его сменил другой воркер.
+
+
+class SharedJsonFile:
+    """JSON-файл, который пишут несколько процессов; default — пустое значение."""
+
+    def __init__(self, path: str, default=dict):
+        self.path = path
+        self.default = default
+        self._stamp = None
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def lock(self, blocking: bool = True):
+        """Исключительный доступ к файлу между потоками и процессами.
+
+        blocking=False → отдаёт False, если файл уже занят (кем угодно).
+        """
+        if not self._thread_lock.acquire(blocking=blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            # lockf, а не flock: блокировку POSIX не наследуют дочерние процессы,
+            # запущенные, пока поток Sheets держит файл
+            with open(f"{self.path}.lock", "a") as handle:
+                try:
+                    fcntl.lockf(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    if blocking:
+                        raise
+                    yield False
+                    return
+                yield True  # блокировка снимается закрытием файла
+        finally:
+            self._thread_lock.release()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def changed(self) -> bool:
+        """Файл записан не этим процессом (или ещё не читался)."""
+        return self._file_stamp() != self._stamp
+
+    def read(self):
+        """Содержимое файла; запоминает, какую версию прочитали."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stamp = os.fstat(f.fileno())
+                data = json.load(f)
+            self._stamp = stamp.st_mtime_ns, stamp.st_size, stamp.st_ino
+            return data
+        except FileNotFoundError:
+            self._stamp = None
+            return self.default()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки {self.path}: {e}")
+            return self.default()
+
+    def write(self, data, indent: int | None = 2) -> bool:
+        """Атомарно: временный файл + replace, чтобы никто не прочитал половину JSON."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=indent)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._stamp = self._file_stamp()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения {self.path}: {e}")
+            return False
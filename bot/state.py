@@ -1,9 +1,11 @@
-import json
+import re
 import threading
-from collections import OrderedDict, defaultdict
+import time
+from collections import OrderedDict
 from datetime import datetime
 
-from bot.config import HISTORY_FILE, SNAPSHOT_FILE, MSK, logger
+from bot.config import HISTORY_FILE, SNAPSHOT_FILE, OWN_WRITES_FILE, WATCH_OWN_WRITES_TTL, MSK, logger
+from bot.shared import SharedJsonFile
 
 # ===================== LOCK =====================
 
@@ -11,43 +13,25 @@ _state_lock = threading.Lock()
 
 # ===================== ПЕРСИСТЕНТНЫЕ ДАННЫЕ =====================
 
+# История и снимок — общие для всех воркеров вебхука (см. bot/shared.py):
+# изменения пишутся сразу под блокировкой файла, чтение начинается с refresh_*()
+_history_file = SharedJsonFile(HISTORY_FILE)
+_snapshot_file = SharedJsonFile(SNAPSHOT_FILE)
+_own_writes_file = SharedJsonFile(OWN_WRITES_FILE)
+_history_unsaved = False
+
 
 def load_history() -> OrderedDict:
-    try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            return OrderedDict(json.load(f))
-    except FileNotFoundError:
-        return OrderedDict()
-    except Exception as e:
-        logger.error(f"Ошибка загрузки history.json: {e}")
-        return OrderedDict()
+    return OrderedDict(_history_file.read())
 
 
-def _save_history_to_disk():
-    try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(dict(history), f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка сохранения истории: {e}")
+def _save_history_to_disk(data: dict):
+    global _history_unsaved
+    _history_unsaved = not _history_file.write(data)
 
 
 def load_snapshot() -> dict:
-    try:
-        with open(SNAPSHOT_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except Exception as e:
-        logger.error(f"Ошибка загрузки snapshot.json: {e}")
-        return {}
-
-
-def save_snapshot(data: dict):
-    try:
-        with open(SNAPSHOT_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка сохранения снимка: {e}")
+    return _snapshot_file.read()
 
 
 # ===================== ГЛОБАЛЬНОЕ СОСТОЯНИЕ =====================
@@ -58,9 +42,15 @@ snapshot: dict = load_snapshot()
 sheets_cache: dict = {}
 sheets_cache_time: dict[str, float] = {}
 
-user_last_request: dict[int, float] = defaultdict(float)
+# Готовые картинки расписания: ключ — хэш (title, headers, rows)
+image_cache: OrderedDict = OrderedDict()
+
 user_context: OrderedDict = OrderedDict()
 
+_invalidate_listeners: list = []
+# Воркеры вебхука: рассылка сброса кэша остальным воркерам (см. bot/webhook.py)
+_peer_notifier = None
+
 pending_updates: dict = {}
 pending_fill: dict = {}
 last_batch: dict = {}
@@ -68,33 +58,185 @@ last_batch: dict = {}
 MAX_HISTORY = 500
 MAX_USER_CONTEXT = 500
 MAX_CONTEXT_MESSAGES = 10
+MAX_IMAGE_CACHE = 64
 
 
 # ===================== ОПЕРАЦИИ НАД СОСТОЯНИЕМ =====================
 
 
+def _reload(file: SharedJsonFile, target: dict):
+    """Перечитывает общий файл, если его записал другой воркер."""
+    if file.changed():
+        data = file.read()
+        with _state_lock:
+            target.clear()
+            target.update(data)
+
+
+def refresh_history():
+    """Подхватывает правки, сделанные через других воркеров, — перед чтением history."""
+    _reload(_history_file, history)
+
+
+def refresh_snapshot():
+    _reload(_snapshot_file, snapshot)
+
+
 def save_history_entry(key: str, old_val: str, new_val: str):
-    with _state_lock:
-        if len(history) > MAX_HISTORY:
-            history.popitem(last=False)
-        history[key] = {
-            "old": old_val,
-            "new": new_val,
-            "changed_at": datetime.now(MSK).strftime("%Y-%m-%d %H:%M:%S"),
-        }
-    _save_history_to_disk()
+    with _history_file.lock():
+        refresh_history()
+        with _state_lock:
+            if len(history) > MAX_HISTORY:
+                history.popitem(last=False)
+            history[key] = {
+                "old": old_val,
+                "new": new_val,
+                "changed_at": datetime.now(MSK).strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            data = dict(history)
+        _save_history_to_disk(data)
+
+
+def delete_history_entry(key: str, if_new: str | None = None):
+    """Удаляет запись истории; с if_new — только если она про это значение."""
+    with _history_file.lock():
+        refresh_history()
+        with _state_lock:
+            entry = history.get(key)
+            if entry is None:
+                return
+            if if_new is not None and (not isinstance(entry, dict) or entry.get("new") != if_new):
+                return
+            del history[key]
+            data = dict(history)
+        _save_history_to_disk(data)
 
 
-def delete_history_entry(key: str):
-    with _state_lock:
-        history.pop(key, None)
-    _save_history_to_disk()
+def save_snapshot(data: dict):
+    """Заменяет снимок таблицы целиком."""
+    with _snapshot_file.lock():
+        with _state_lock:
+            snapshot.clear()
+            snapshot.update(data)
+            data = dict(snapshot)
+        _snapshot_file.write(data)
+
+
+def update_snapshot(part: dict):
+    """Обновляет часть снимка (один лист), не трогая остальное — его мог записать другой воркер."""
+    with _snapshot_file.lock():
+        refresh_snapshot()
+        with _state_lock:
+            snapshot.update(part)
+            data = dict(snapshot)
+        _snapshot_file.write(data)
+
+
+def flush_state():
+    """Перед остановкой: дописывает историю, если последняя запись на диск не удалась."""
+    if not _history_unsaved:
+        return
+    with _history_file.lock():
+        with _state_lock:
+            data = dict(history)
+        _save_history_to_disk(data)
+
+
+# ===================== ЗАПИСИ БОТА В ТАБЛИЦУ =====================
 
+# Что бот сам записал в ячейки: "имя|день|месяц|значение" → время записи.
+# История для этого не годится: откат удаляет из неё запись, а заполнение
+# и восстановленное значение в ней не хранятся. Файл общий для воркеров.
 
-def invalidate_cache(month: str):
+
+def _own_write_key(name: str, date_str: str, value: str) -> str | None:
+    parts = re.findall(r"\d+", date_str)
+    if len(parts) < 2:
+        return None
+    return f"{name.strip()}|{int(parts[0])}|{int(parts[1])}|{str(value).strip()}"
+
+
+def _fresh_own_writes(data: dict) -> dict:
+    deadline = time.time() - WATCH_OWN_WRITES_TTL
+    return {k: ts for k, ts in data.items() if ts > deadline}
+
+
+def record_own_writes(cells: list[tuple[str, str, str]]):
+    """Запоминает записи бота [(имя, дата, значение)] — до того, как они попадут в таблицу."""
+    keys = [k for k in (_own_write_key(*c) for c in cells) if k]
+    if not keys:
+        return
+    with _own_writes_file.lock():
+        data = _fresh_own_writes(_own_writes_file.read())
+        now = time.time()
+        data.update((k, now) for k in keys)
+        _own_writes_file.write(data, indent=None)
+
+
+def take_own_writes(cells: list[tuple[str, str, str]]) -> list[bool]:
+    """Для каждой ячейки [(имя, дата, значение)]: записал ли её бот. Найденные записи снимаются."""
+    with _own_writes_file.lock():
+        stored = _own_writes_file.read()
+        data = _fresh_own_writes(stored)
+        found = [data.pop(k, None) is not None for k in (_own_write_key(*c) for c in cells)]
+        if len(data) != len(stored):
+            _own_writes_file.write(data, indent=None)
+    return found
+
+
+def add_invalidate_listener(fn):
+    """fn(month) вызывается после сброса кэша месяца — из любого потока."""
+    _invalidate_listeners.append(fn)
+    return fn
+
+
+def set_peer_notifier(fn):
+    """fn(month) — сообщить о сбросе кэша месяца другим процессам; из любого потока."""
+    global _peer_notifier
+    _peer_notifier = fn
+
+
+def invalidate_cache(month: str, notify_peers: bool = True):
+    """Сбрасывает кэш листа и картинок месяца; notify_peers=False — сброс пришёл от другого воркера."""
     with _state_lock:
         sheets_cache.pop(month, None)
         sheets_cache_time.pop(month, None)
+        for key in [k for k, v in image_cache.items() if month in v["months"]]:
+            del image_cache[key]
+    for listener in _invalidate_listeners:
+        try:
+            listener(month)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика сброса кэша: {e}")
+    if notify_peers and _peer_notifier is not None:
+        _peer_notifier(month)
+
+
+def get_cached_image(key: str) -> dict | None:
+    with _state_lock:
+        entry = image_cache.get(key)
+        if entry is not None:
+            image_cache.move_to_end(key)
+            return dict(entry)
+        return None
+
+
+def put_cached_image(key: str, png: bytes, months: set[str]):
+    with _state_lock:
+        entry = image_cache.get(key)
+        if entry is None:
+            image_cache[key] = {"png": png, "file_id": None, "months": set(months)}
+        else:
+            entry["png"] = png
+        image_cache.move_to_end(key)
+        while len(image_cache) > MAX_IMAGE_CACHE:
+            image_cache.popitem(last=False)
+
+
+def set_cached_image_file_id(key: str, file_id: str | None):
+    with _state_lock:
+        if key in image_cache:
+            image_cache[key]["file_id"] = file_id
 
 
 def append_user_context(user_id: int, text: str):
@@ -0,0 +1,181 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from telegram.request import HTTPXRequest
+
+from bot.config import SLOW_REQUEST_SECONDS, logger
+from bot.core.metrics import register_collector
+
+RESERVOIR_SIZE = 1024  # последние замеры этапа — по ним считаются перцентили
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Trace:
+    __slots__ = ("update_id", "user_id", "started", "spans")
+
+    def __init__(self, update_id, user_id):
+        self.update_id = update_id
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float, float, bool]] = []  # этап, начало, длительность, ошибка
+
+
+class _Stage:
+    __slots__ = ("samples", "count", "sum", "errors")
+
+    def __init__(self):
+        self.samples: deque = deque(maxlen=RESERVOIR_SIZE)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+
+_current: contextvars.ContextVar[_Trace | None] = contextvars.ContextVar("trace", default=None)
+_lock = threading.Lock()
+_stages: dict[str, _Stage] = {}
+
+
+def _observe(stage: str, duration: float, error: bool):
+    with _lock:
+        s = _stages.get(stage)
+        if s is None:
+            s = _stages[stage] = _Stage()
+        s.samples.append(duration)
+        s.count += 1
+        s.sum += duration
+        s.errors += error
+
+
+def reset_stages():
+    with _lock:
+        _stages.clear()
+
+
+# ===================== СПАНЫ =====================
+
+
+@contextmanager
+def span(stage: str):
+    """Замер одного этапа: попадает в перцентили этапа и в трейс текущего апдейта.
+
+    Трейс живёт в contextvar, поэтому виден и в потоках run_in_executor
+    (контекст копируется туда вместе с вызовом).
+    """
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _observe(stage, duration, error)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append((stage, started - trace.started, duration, error))
+
+
+def traced(stage: str):
+    """Декоратор для синхронной функции: весь вызов — один спан."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace(update_id, user_id):
+    """Трейс обработки апдейта: все спаны внутри помечаются его update_id."""
+    t = _Trace(update_id, user_id)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        total = time.perf_counter() - t.started
+        _observe("update", total, False)
+        if SLOW_REQUEST_SECONDS and total >= SLOW_REQUEST_SECONDS:
+            logger.warning(f"[SLOW] update={t.update_id} user={t.user_id} {total:.2f}с: {format_spans(t)}")
+
+
+def current_update_id():
+    """update_id обрабатываемого апдейта (None вне трейса) — ключ идемпотентности."""
+    t = _current.get()
+    return t.update_id if t is not None else None
+
+
+def format_spans(t: _Trace) -> str:
+    if not t.spans:
+        return "без этапов"
+    return ", ".join(
+        f"{stage}@{start * 1000:.0f}+{duration * 1000:.0f}мс{'!' if error else ''}"
+        for stage, start, duration, error in sorted(t.spans, key=lambda s: s[1])
+    )
+
+
+# ===================== BOT API =====================
+
+
+def _telegram_stage(url: str) -> str:
+    if "/file/bot" in url:
+        return "telegram.download"
+    return f"telegram.{url.rsplit('/', 1)[-1]}"
+
+
+class TracedRequest(HTTPXRequest):
+    """HTTPXRequest со спаном на каждый вызов Bot API и скачивание файла."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with span(_telegram_stage(url)):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+# ===================== ЭКСПОРТ =====================
+
+
+def _quantiles(samples) -> list[float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return [0.0] * len(QUANTILES)
+    return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES]
+
+
+def stage_summary() -> dict[str, dict]:
+    """{этап: {count, errors, p50, p95, p99}} — по последним RESERVOIR_SIZE замерам."""
+    with _lock:
+        snapshot = {name: (list(s.samples), s.count, s.errors) for name, s in _stages.items()}
+    result = {}
+    for name, (samples, count, errors) in sorted(snapshot.items()):
+        p50, p95, p99 = _quantiles(samples)
+        result[name] = {"count": count, "errors": errors, "p50": p50, "p95": p95, "p99": p99}
+    return result
+
+
+@register_collector
+def _prometheus_lines() -> list[str]:
+    with _lock:
+        snapshot = {name: (list(s.samples), s.count, s.sum, s.errors) for name, s in _stages.items()}
+    lines = [
+        "# HELP stage_latency_seconds Задержка этапов обработки (перцентили по последним замерам)",
+        "# TYPE stage_latency_seconds summary",
+    ]
+    for name, (samples, count, total, _) in sorted(snapshot.items()):
+        for q, value in zip(QUANTILES, _quantiles(samples)):
+            lines.append(f'stage_latency_seconds{{stage="{name}",quantile="{q:g}"}} {value:.6f}')
+        lines.append(f'stage_latency_seconds_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'stage_latency_seconds_count{{stage="{name}"}} {count}')
+    lines += [
+        "# HELP stage_errors_total Этапы, завершившиеся исключением",
+        "# TYPE stage_errors_total counter",
+    ]
+    for name, (_, _, _, errors) in sorted(snapshot.items()):
+        lines.append(f'stage_errors_total{{stage="{name}"}} {errors}')
+    return lines
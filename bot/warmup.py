@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from bot.config import WARMUP_ENABLED, logger
+from bot.core.sheets import warmup_sheets, run_in_executor
+from bot.core.image_gen import warm_render_pool
+from bot.services.ai_client import warm_client
+from bot.services.voice import warm_backend
+
+# Этапы прогрева: идут параллельно, ошибка одного не мешает остальным
+STEPS = {
+    "sheets": warmup_sheets,
+    "claude": lambda: run_in_executor(warm_client),
+    "groq": lambda: run_in_executor(warm_backend),
+    "render": warm_render_pool,
+}
+
+
+async def warmup() -> dict[str, float | str]:
+    """Прогревает всё из STEPS → {этап: секунды или текст ошибки}."""
+    results: dict[str, float | str] = {}
+
+    async def step(name: str, fn):
+        started = time.perf_counter()
+        try:
+            await fn()
+            results[name] = time.perf_counter() - started
+        except Exception as e:
+            results[name] = f"ошибка: {e}"
+
+    await asyncio.gather(*(step(name, fn) for name, fn in STEPS.items()))
+    summary = ", ".join(
+        f"{name} {r * 1000:.0f} мс" if isinstance(r, float) else f"{name} — {r}" for name, r in results.items()
+    )
+    logger.info(f"[WARMUP] {summary}")
+    return results
+
+
+async def _warmup_job(context):
+    await warmup()
+
+
+def setup_warmup(app):
+    """Прогрев первой задачей job_queue — уже после старта polling/вебхука."""
+    if not WARMUP_ENABLED:
+        return
+    app.job_queue.run_once(_warmup_job, when=0, name="warmup")
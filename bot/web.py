@@ -0,0 +1,161 @@
+import asyncio
+import json
+
+from bot.config import logger
+
+MAX_BODY = 1 << 20
+READ_TIMEOUT = 30
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+    502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, target: str, headers: dict[str, str], body: bytes):
+        self.method = method
+        self.path, _, self.query = target.partition("?")
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+# ===================== СЕРВЕР =====================
+
+
+class HttpServer:
+    """Минимальный HTTP/1.1 сервер на asyncio: keep-alive, Content-Length, без chunked.
+
+    Достаточно для вебхука Telegram и /metrics за локальным прокси; stop()
+    перестаёт принимать соединения и дожидается запросов, которые уже в работе.
+    """
+
+    def __init__(self, routes: dict, host: str, port: int, default=None):
+        # {(method, path): async handler(Request) -> (статус, тело, content-type)};
+        # default — обработчик для всех остальных путей
+        self.routes = routes
+        self.default = default
+        self.host = host
+        self.port = port
+        self._server: asyncio.AbstractServer | None = None
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        logger.info(f"[HTTP] слушаю {self.host}:{self.port}")
+
+    async def stop(self, timeout: float = 30):
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[HTTP] {self._in_flight} запросов не успели завершиться за {timeout}с")
+        logger.info(f"[HTTP] {self.host}:{self.port} остановлен")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Request | None:
+        line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        if not line:
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            h = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY:
+            raise ValueError("body too large")
+        body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b""
+        return Request(method, target, headers, body)
+
+    async def _dispatch(self, request: Request) -> tuple[int, bytes, str]:
+        handler = self.routes.get((request.method, request.path), self.default)
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return 405, b"", "text/plain"
+            return 404, b"", "text/plain"
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"[HTTP] ошибка обработки {request.method} {request.path}: {e}", exc_info=True)
+            return 500, b"", "text/plain"
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while not self._closing:
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    await _write_response(writer, 400, b"", "text/plain", keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self._in_flight += 1
+                self._idle.clear()
+                try:
+                    status, body, ctype = await self._dispatch(request)
+                finally:
+                    self._in_flight -= 1
+                    if self._in_flight == 0:
+                        self._idle.set()
+                keep_alive = request.headers.get("connection", "").lower() != "close" and not self._closing
+                await _write_response(writer, status, body, ctype, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _write_response(writer, status: int, body: bytes, ctype: str, keep_alive: bool):
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {ctype}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+# ===================== КЛИЕНТ =====================
+
+
+async def http_post(host: str, port: int, path: str, body: bytes, headers: dict | None = None,
+                    timeout: float = READ_TIMEOUT) -> tuple[int, bytes]:
+    """Один POST по отдельному соединению — для пересылки апдейтов воркерам."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        head = [f"POST {path} HTTP/1.1", f"Host: {host}:{port}",
+                f"Content-Length: {len(body)}", "Content-Type: application/json", "Connection: close"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            h = await asyncio.wait_for(reader.readline(), timeout)
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            if k.strip().lower() == "content-length":
+                length = int(v.strip())
+        data = await asyncio.wait_for(reader.readexactly(length), timeout) if length else b""
+        return status, data
+    finally:
+        writer.close()
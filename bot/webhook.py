@@ -0,0 +1,210 @@
+import asyncio
+import hmac
+import json
+import os
+import signal
+import subprocess
+import sys
+from functools import partial
+from urllib.parse import urlparse
+
+from telegram import Bot, Update
+
+from bot.config import (
+    TELEGRAM_TOKEN, TELEGRAM_API_URL, TELEGRAM_FILE_URL,
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_WORKERS,
+    WORKER_INDEX, WORKER_PORT, DRAIN_TIMEOUT, logger,
+)
+from bot.state import invalidate_cache, set_peer_notifier
+from bot.web import HttpServer, http_post
+
+WEBHOOK_PATH = urlparse(WEBHOOK_URL).path or "/telegram"
+INVALIDATE_PATH = "/internal/invalidate"
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def _secret_ok(headers: dict) -> bool:
+    if not WEBHOOK_SECRET:
+        return True
+    return hmac.compare_digest(headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET)
+
+
+def _update_key(data: dict) -> int:
+    """ID пользователя (или чата) апдейта — все апдейты одного человека идут в один воркер."""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        for field in ("from", "chat"):
+            if isinstance(value.get(field), dict) and "id" in value[field]:
+                return int(value[field]["id"])
+    return int(data.get("update_id", 0))
+
+
+async def _wait_for_signal() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+
+async def _register_webhook(bot: Bot):
+    if not WEBHOOK_URL:
+        logger.warning("[WEBHOOK] WEBHOOK_URL не задан, setWebhook пропущен")
+        return
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    logger.info(f"[WEBHOOK] вебхук установлен: {WEBHOOK_URL}")
+
+
+# ===================== СБРОС КЭША МЕЖДУ ВОРКЕРАМИ =====================
+
+# Кэш листов и картинок у каждого воркера свой: сброс месяца в одном воркере
+# рассылается остальным POST-ом на их локальный порт. Сбросы, пришедшие
+# за один проход цикла событий, уходят одним запросом.
+_peer_months: set[str] = set()
+
+
+def _peer_ports() -> list[int]:
+    return [WEBHOOK_PORT + 1 + i for i in range(WEBHOOK_WORKERS) if i != WORKER_INDEX]
+
+
+async def _send_invalidations():
+    await asyncio.sleep(0)
+    months = sorted(_peer_months)
+    _peer_months.clear()
+    body = json.dumps({"months": months}).encode()
+    headers = {SECRET_HEADER: WEBHOOK_SECRET} if WEBHOOK_SECRET else None
+    results = await asyncio.gather(
+        *(http_post("127.0.0.1", port, INVALIDATE_PATH, body, headers, timeout=5) for port in _peer_ports()),
+        return_exceptions=True,
+    )
+    for port, result in zip(_peer_ports(), results):
+        if isinstance(result, BaseException) or result[0] != 200:
+            logger.warning(f"[WEBHOOK] воркер на порту {port} не принял сброс кэша {months}: {result}")
+
+
+def _queue_invalidation(month: str):
+    if not _peer_months:
+        asyncio.ensure_future(_send_invalidations())
+    _peer_months.add(month)
+
+
+def _notify_peers(loop: asyncio.AbstractEventLoop, month: str):
+    try:
+        loop.call_soon_threadsafe(_queue_invalidation, month)
+    except RuntimeError:
+        pass  # цикл событий уже закрыт — воркер останавливается
+
+
+async def on_invalidate(request):
+    if not _secret_ok(request.headers):
+        return 403, b"", "text/plain"
+    for month in request.json().get("months", []):
+        invalidate_cache(month, notify_peers=False)
+    return 200, b"", "text/plain"
+
+
+# ===================== ВОРКЕР =====================
+
+
+async def serve_app(app, host: str, port: int, register: bool):
+    """Принимает апдейты по HTTP и отдаёт их в update_queue приложения.
+
+    При SIGTERM/SIGINT: перестаёт принимать запросы, дожидается уже принятых,
+    затем app.stop() разбирает очередь и ждёт обработчики до конца.
+    """
+
+    async def on_update(request):
+        if not _secret_ok(request.headers):
+            logger.warning("[WEBHOOK] запрос с неверным secret token")
+            return 403, b"", "text/plain"
+        try:
+            data = request.json()
+        except ValueError:
+            return 400, b"", "text/plain"
+        await app.update_queue.put(Update.de_json(data, app.bot))
+        return 200, b"", "text/plain"
+
+    routes = {("POST", WEBHOOK_PATH): on_update}
+    if WORKER_PORT:
+        routes[("POST", INVALIDATE_PATH)] = on_invalidate
+        set_peer_notifier(partial(_notify_peers, asyncio.get_running_loop()))
+    server = HttpServer(routes, host, port)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    await server.start()
+    if register:
+        await _register_webhook(app.bot)
+
+    await _wait_for_signal()
+    logger.info("[WEBHOOK] останавливаюсь: дожидаюсь текущих апдейтов...")
+    await server.stop(DRAIN_TIMEOUT)
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    set_peer_notifier(None)
+
+
+# ===================== НЕСКОЛЬКО ВОРКЕРОВ =====================
+
+
+def _spawn_workers() -> list[subprocess.Popen]:
+    workers = []
+    for i in range(WEBHOOK_WORKERS):
+        env = dict(os.environ, BOT_WORKER_INDEX=str(i), BOT_WORKER_PORT=str(WEBHOOK_PORT + 1 + i))
+        workers.append(subprocess.Popen([sys.executable, *sys.argv], env=env))
+        logger.info(f"[WEBHOOK] воркер {i} запущен: pid={workers[-1].pid}, порт {WEBHOOK_PORT + 1 + i}")
+    return workers
+
+
+async def serve_front():
+    """Локальный прокси перед воркерами: проверяет секрет и раскидывает апдейты.
+
+    Апдейты одного пользователя всегда идут в один воркер (по ID), поэтому
+    подтверждения, отмены и контекст разговора остаются в памяти одного процесса.
+    """
+    workers = _spawn_workers()
+
+    async def on_update(request):
+        if not _secret_ok(request.headers):
+            logger.warning("[WEBHOOK] запрос с неверным secret token")
+            return 403, b"", "text/plain"
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return 400, b"", "text/plain"
+        index = _update_key(data) % len(workers)
+        headers = {SECRET_HEADER: WEBHOOK_SECRET} if WEBHOOK_SECRET else None
+        try:
+            status, _ = await http_post("127.0.0.1", WEBHOOK_PORT + 1 + index, WEBHOOK_PATH, request.body, headers)
+        except (OSError, asyncio.TimeoutError) as e:
+            # Telegram повторит апдейт сам
+            logger.error(f"[WEBHOOK] воркер {index} недоступен: {e}")
+            return 502, b"", "text/plain"
+        return status, b"", "text/plain"
+
+    server = HttpServer({("POST", WEBHOOK_PATH): on_update}, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    await server.start()
+    async with Bot(TELEGRAM_TOKEN, base_url=TELEGRAM_API_URL, base_file_url=TELEGRAM_FILE_URL) as bot:
+        await _register_webhook(bot)
+
+    await _wait_for_signal()
+    logger.info("[WEBHOOK] останавливаю прокси и воркеров...")
+    await server.stop(DRAIN_TIMEOUT)
+    for proc in workers:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+    loop = asyncio.get_running_loop()
+    for proc in workers:
+        try:
+            await loop.run_in_executor(None, proc.wait, DRAIN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[WEBHOOK] воркер pid={proc.pid} не остановился, убиваю")
+            proc.kill()
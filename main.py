@@ -1,49 +1,181 @@
+import time
+
+_STARTED = time.perf_counter()  # для --profile-startup: время импорта main.py
+
+import asyncio
+import importlib
 import sys
-from datetime import time as dt_time
 
-from telegram.ext import ApplicationBuilder, MessageHandler, filters
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
 
 from bot.config import (
-    TELEGRAM_TOKEN, SCHEDULE_CHAT_ID, SCHEDULE_THREAD_ID, SCHEDULE_TIME, logger,
+    TELEGRAM_TOKEN, TELEGRAM_API_URL, TELEGRAM_FILE_URL, BOT_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    WEBHOOK_WORKERS, WORKER_INDEX, WORKER_PORT, UPDATE_CONCURRENCY, METRICS_PORT, METRICS_HOST,
+    logger,
+)
+from bot.handlers import (
+    handle_voice, handle_text, error_handler, setup_daily_schedule, setup_change_watcher,
+    setup_outbox_flush, setup_transcript_flush, handle_llm_stats, handle_metrics,
 )
-from bot.handlers import handle_voice, handle_text, error_handler, send_daily_schedule
+from bot.state import flush_state
+from bot.services import voice_cache
+from bot.logs import stop_logging
+from bot.ordering import OrderedUpdateProcessor
+from bot.tracing import TracedRequest
+from bot.web import HttpServer
+from bot.core.metrics import render_prometheus
 from bot.core.sheets import shutdown_executor
+from bot.core.image_gen import shutdown_render_pool
+from bot.services.voice import shutdown_voice_executor
+from bot.warmup import setup_warmup, warmup
 
+_IMPORTED = time.perf_counter()
 
-def main():
-    if not TELEGRAM_TOKEN:
-        logger.error("TELEGRAM_TOKEN не задан в .env")
-        sys.exit(1)
+# Тяжёлые зависимости импортируются при первом использовании
+LAZY_IMPORTS = ("anthropic", "groq", "gspread", "google.oauth2.service_account")
 
-    logger.info("Бот запускается...")
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+
+async def _serve_metrics(request):
+    return 200, render_prometheus().encode(), "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def _post_init(app):
+    if not METRICS_PORT:
+        return
+    server = HttpServer({("GET", "/metrics"): _serve_metrics}, METRICS_HOST, METRICS_PORT + WORKER_INDEX)
+    try:
+        await server.start()
+    except OSError as e:
+        logger.error(f"[METRICS] не удалось открыть порт {server.port}: {e}")
+        return
+    app.bot_data["metrics_server"] = server
+
+
+async def _post_stop(app):
+    server = app.bot_data.pop("metrics_server", None)
+    if server is not None:
+        await server.stop(1)
+
+
+def build_app(with_jobs: bool = True):
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .base_file_url(TELEGRAM_FILE_URL)
+        .concurrent_updates(OrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        .request(TracedRequest(connection_pool_size=256))
+        .post_init(_post_init)
+        .post_stop(_post_stop)
+    )
+    if BOT_MODE == "webhook":
+        builder = builder.updater(None)
+    app = builder.build()
     app.add_handler(MessageHandler(filters.VOICE, handle_voice))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    app.add_handler(CommandHandler("llm_stats", handle_llm_stats))
+    app.add_handler(CommandHandler("metrics", handle_metrics))
     app.add_error_handler(error_handler)
 
-    # Ежедневная отправка расписания
-    if SCHEDULE_CHAT_ID and SCHEDULE_THREAD_ID:
+    # Запись правок в таблицу и прогрев — в каждом воркере (запись планирует тот, кто
+    # принял правку; кэши у каждого свои)
+    setup_outbox_flush(app)
+    setup_transcript_flush(app)
+    setup_warmup(app)
+    # Фоновые задачи: ежедневная отправка расписания и проверка правок
+    if with_jobs:
+        setup_daily_schedule(app)
+        setup_change_watcher(app)
+    return app
+
+
+def _is_front() -> bool:
+    return BOT_MODE == "webhook" and WEBHOOK_WORKERS > 1 and not WORKER_PORT
+
+
+def run():
+    if BOT_MODE != "webhook":
+        build_app().run_polling(stop_signals=None)
+        return
+
+    from bot.webhook import serve_app, serve_front
+
+    if WORKER_PORT:
+        # Воркер за локальным прокси; задачи по расписанию — только в нулевом
+        logger.info(f"Воркер {WORKER_INDEX} на 127.0.0.1:{WORKER_PORT}")
+        asyncio.run(serve_app(build_app(with_jobs=WORKER_INDEX == 0), "127.0.0.1", WORKER_PORT, register=False))
+    elif _is_front():
+        logger.info(f"Вебхук: прокси на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, воркеров {WEBHOOK_WORKERS}")
+        asyncio.run(serve_front())
+    else:
+        logger.info(f"Вебхук на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+        asyncio.run(serve_app(build_app(), WEBHOOK_LISTEN, WEBHOOK_PORT, register=True))
+
+
+def profile_startup():
+    """python main.py --profile-startup: сколько стоят импорт, сборка приложения
+    и прогрев. Бот не запускается; Bot API и Sheets нужны настоящие."""
+    rows: list[tuple[str, float | str]] = [("импорт main.py", _IMPORTED - _STARTED)]
+    for module in LAZY_IMPORTS:
+        started = time.perf_counter()
         try:
-            h, m = SCHEDULE_TIME.split(":")
-            send_time = dt_time(hour=int(h), minute=int(m), second=0)
-            app.job_queue.run_daily(send_daily_schedule, time=send_time)
-            logger.info(
-                f"Автоотправка расписания: {SCHEDULE_TIME} → "
-                f"chat={SCHEDULE_CHAT_ID}, thread={SCHEDULE_THREAD_ID}"
-            )
+            importlib.import_module(module)
+            rows.append((f"ленивый импорт {module}", time.perf_counter() - started))
+        except ImportError as e:
+            rows.append((f"ленивый импорт {module}", f"ошибка: {e}"))
+
+    started = time.perf_counter()
+    app = build_app(with_jobs=False)
+    rows.append(("build_app", time.perf_counter() - started))
+
+    async def init():
+        started = time.perf_counter()
+        try:
+            await app.initialize()
+            rows.append(("initialize (getMe)", time.perf_counter() - started))
         except Exception as e:
-            logger.error(f"Не удалось настроить автоотправку: {e}")
-    else:
-        logger.info("Автоотправка расписания не настроена (нет SCHEDULE_CHAT_ID/SCHEDULE_THREAD_ID)")
+            rows.append(("initialize (getMe)", f"ошибка: {e}"))
+        for name, result in (await warmup()).items():
+            rows.append((f"прогрев {name}", result))
+        await app.shutdown()
+
+    asyncio.run(init())
+    for name, value in rows:
+        print(f"{name:45} {f'{value * 1000:8.0f} мс' if isinstance(value, float) else value}")
+    print(f"{'всего с начала импорта':45} {(time.perf_counter() - _STARTED) * 1000:8.0f} мс")
 
+
+def main():
+    if "--profile-startup" in sys.argv:
+        try:
+            profile_startup()
+        finally:
+            shutdown_executor()
+            shutdown_voice_executor()
+            shutdown_render_pool()
+            stop_logging()
+        return
+
+    if not TELEGRAM_TOKEN:
+        logger.error("TELEGRAM_TOKEN не задан в .env")
+        sys.exit(1)
+
+    logger.info("Бот запускается...")
     logger.info("Бот запущен!")
     try:
-        app.run_polling(stop_signals=None)
+        run()
     except KeyboardInterrupt:
         logger.info("Получен Ctrl+C, останавливаюсь...")
     finally:
+        # У прокси нет своего состояния — историю пишут воркеры
+        if not _is_front():
+            flush_state()
+            voice_cache.flush()
         shutdown_executor()
+        shutdown_voice_executor()
+        shutdown_render_pool()
         logger.info("Бот остановлен.")
+        stop_logging()
 
 
 if __name__ == "__main__":
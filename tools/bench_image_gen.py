@@ -0,0 +1,81 @@
+"""Бенчмарк рендера картинки расписания.
+
+Запуск из корня репозитория:
+    python tools/bench_image_gen.py [--days 31] [--people 6] [--runs 20]
+
+«cold» — кэши шрифтов и метрик текста сбрасываются перед каждым рендером
+(поведение до появления кэшей), «warm» — обычная работа бота.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.config import DAYS_RU  # noqa: E402
+from bot.core import image_gen  # noqa: E402
+
+SHIFTS = ["09:00 - 17:00", "13:00 - 21:00", "17:00 - 01:00", "Выходной"]
+NAMES = ["Гриша", "Данич", "Карина", "Бобер", "Вова", "Никита", "Маша", "Лёша"]
+
+
+def make_table(days: int, people: int):
+    start = date(2026, 3, 1)
+    headers = (NAMES * (people // len(NAMES) + 1))[:people]
+    rows = []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        rows.append({
+            "date": d.strftime("%d.%m"),
+            "day": DAYS_RU[d.weekday()],
+            "values": [SHIFTS[(i + j) % len(SHIFTS)] for j in range(people)],
+        })
+    return f"Расписание 01.03 — {days:02d}.03.2026", headers, rows
+
+
+def clear_caches():
+    for name in dir(image_gen):
+        fn = getattr(image_gen, name)
+        if hasattr(fn, "cache_clear"):
+            fn.cache_clear()
+
+
+def render(table) -> bytes:
+    return image_gen.generate_schedule_image(*table)
+
+
+def bench(table, runs: int, cold: bool) -> list[float]:
+    times = []
+    for _ in range(runs):
+        if cold:
+            clear_caches()
+        t0 = time.perf_counter()
+        render(table)
+        times.append((time.perf_counter() - t0) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--people", type=int, default=6)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    table = make_table(args.days, args.people)
+    png = render(table)  # прогрев импорта и кэшей PIL
+    print(f"PNG: {len(png) / 1024:.1f} KiB (IMAGE_PALETTE_COLORS={image_gen.IMAGE_PALETTE_COLORS})")
+    for label, cold in (("cold", True), ("warm", False)):
+        times = bench(table, args.runs, cold)
+        print(
+            f"{label:5s} {args.days}x{args.people}: "
+            f"median {statistics.median(times):7.2f} ms, "
+            f"min {min(times):7.2f} ms, max {max(times):7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""Фейковый Bot API на localhost и сквозная проверка вебхука.
+
+Сервер отвечает на методы Bot API, которые дергает бот, и запоминает вызовы.
+Проверка запускает main.py в режиме вебхука против этого сервера (Sheets и
+Claude — фейки из tools/fakes.py, таблица — JSON-файл на все процессы), шлёт
+апдейты с правильным и неправильным secret token, ждёт ответы бота и
+останавливает его через SIGTERM (проверка graceful drain).
+
+С несколькими воркерами правка, «кто работает», история и откат идут от
+двух пользователей, которые попадают в разные воркеры: проверяется общая
+история и outbox и сброс кэша листа во всех воркерах.
+
+    python tools/fake_telegram.py                 # один процесс
+    python tools/fake_telegram.py --workers 2     # прокси + 2 воркера
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bot.config import MONTHS_SHEETS, MSK  # noqa: E402
+from bot.web import HttpServer, http_post  # noqa: E402
+
+TOKEN = "123456:FAKE"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+class FakeTelegram:
+    """Bot API: POST /bot<token>/<method> → {"ok": true, "result": ...}."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency  # задержка ответа, секунды
+        self.calls: list[tuple[str, dict]] = []
+        self.files: dict[str, bytes] = {}  # file_id → содержимое для getFile и скачивания
+        self._message_id = 0
+        self._server = HttpServer({}, host, port, default=self._handle)
+
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    def methods(self) -> list[str]:
+        return [m for m, _ in self.calls]
+
+    async def start(self):
+        await self._server.start()
+
+    async def stop(self):
+        await self._server.stop(1)
+
+    def _params(self, request) -> dict:
+        ctype = request.headers.get("content-type", "")
+        if ctype.startswith("application/x-www-form-urlencoded"):
+            return dict(parse_qsl(request.body.decode()))
+        if ctype.startswith("application/json"):
+            return request.json() or {}
+        return {}  # multipart (файлы) — содержимое не разбираем
+
+    def _message(self, method: str, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0) or 0)
+        msg = {"message_id": self._message_id, "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        if "text" in params:
+            msg["text"] = params["text"]
+        if method in ("sendPhoto", "editMessageMedia"):
+            # multipart с файлом не разбираем — отвечаем как на фото
+            fid = f"photo{self._message_id}"
+            msg["photo"] = [{"file_id": fid, "file_unique_id": fid, "width": 1, "height": 1}]
+        return msg
+
+    def _file(self, file_id: str) -> dict:
+        return {"file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")), "file_path": f"voice/{file_id}.ogg"}
+
+    async def _handle(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.path.startswith("/file/"):
+            file_id = request.path.rsplit("/", 1)[-1].removesuffix(".ogg")
+            self.calls.append(("download", {"file_id": file_id}))
+            if file_id not in self.files:
+                return 404, b"", "text/plain"
+            return 200, self.files[file_id], "application/octet-stream"
+        method = request.path.rsplit("/", 1)[-1]
+        params = self._params(request)
+        self.calls.append((method, params))
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getFile":
+            result = self._file(params.get("file_id", ""))
+        elif method.startswith(("send", "edit")):
+            result = self._message(method, params)
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode(), "application/json"
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"U{user_id}"}
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": user, "entities": entities,
+        },
+    }
+
+
+def make_voice_update(update_id: int, user_id: int, file_id: str, duration: int = 3) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"U{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"}, "from": user,
+            "voice": {"file_id": file_id, "file_unique_id": file_id, "duration": duration,
+                      "mime_type": "audio/ogg"},
+        },
+    }
+
+
+# ===================== БОТ С ФЕЙКАМИ =====================
+
+SHIFT = "10:00 - 18:00"
+DAY = 5
+
+
+def _script(name: str, month: str) -> dict[str, str]:
+    """Ответы фейкового Claude на тексты сквозной проверки."""
+    date = f"{DAY:02d}.{month}"
+    parsed = {
+        "поставь смену": {"action": "update", "name": name, "date": date, "time": SHIFT},
+        "кто работает": {"action": "show_workers", "date": date},
+        "история": {"action": "show_history"},
+        "верни смену": {"action": "undo", "name": name, "date": date},
+    }
+    return {text: json.dumps(p, ensure_ascii=False) for text, p in parsed.items()}
+
+
+def run_bot():
+    """main.py с фейковыми Sheets, Claude и Groq; таблица — в FAKE_SHEETS_FILE.
+
+    Воркеры вебхука запускаются с теми же аргументами и получают те же фейки.
+    """
+    sys.path.insert(0, str(ROOT / "tools"))
+    from fakes import SharedFakeSpreadsheet, FakeAnthropic, FakeWhisper, install
+    from bot import config
+    from bot.core import sheets
+    from bot.core.schedule import generate_month_updates
+    from bot.shared import SharedJsonFile
+    import main as bot_main
+
+    today = datetime.now(MSK)
+    month = today.strftime("%m")
+    path = os.environ["FAKE_SHEETS_FILE"]
+    spreadsheet = SharedFakeSpreadsheet(path)
+    install(spreadsheet, FakeAnthropic(_script(config.NAMES[0], month)), FakeWhisper(0))
+    with SharedJsonFile(f"{path}.init").lock():
+        with spreadsheet.lock:
+            missing = MONTHS_SHEETS[month] not in spreadsheet.sheets
+        if missing:
+            sheets._create_month_sheets([month], today.year)
+            sheets._execute_fill_sync(generate_month_updates(month, today.year))
+    bot_main.main()
+
+
+# ===================== СКВОЗНАЯ ПРОВЕРКА =====================
+
+
+async def _wait_port(port: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, w = await asyncio.open_connection("127.0.0.1", port)
+            w.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"порт {port} так и не открылся")
+
+
+async def _wait_for(predicate, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+def _replies(fake: FakeTelegram, chat_id: int, start: int) -> list[str]:
+    """Тексты, отправленные и исправленные ботом в чате, начиная с вызова номер start."""
+    return [p["text"] for _, p in fake.calls[start:] if "text" in p and str(p.get("chat_id")) == str(chat_id)]
+
+
+def _cell(path: Path, name: str) -> str | None:
+    """Значение ячейки (name, DAY) текущего месяца в файле фейковой таблицы."""
+    try:
+        sheets = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    today = datetime.now(MSK)
+    rows = sheets.get(MONTHS_SHEETS[today.strftime("%m")], [0, []])[1]
+    if len(rows) < 2 or name not in rows[1]:
+        return None
+    col = rows[1].index(name)
+    for row in rows[2:]:
+        if row and row[0].startswith(f"{DAY:02d}."):
+            return row[col] if col < len(row) else ""
+    return None
+
+
+async def _shared_state(
+    fake: FakeTelegram, port: int, secret: str, users: list[int], table: Path, workers: int,
+) -> list[str]:
+    """Правка → «кто работает» → история → откат → «кто работает» от двух пользователей.
+
+    Пользователи попадают в разные воркеры (ID % WEBHOOK_WORKERS), так что
+    историю, outbox и кэш листа здесь видят и сбрасывают разные процессы.
+    """
+    name = next(iter(json.loads((ROOT / "employees.json").read_text(encoding="utf-8"))["employees"]))
+    author, other = users[0], users[1]
+    failures = []
+    update_id = 1000
+
+    async def ask(user_id: int, text: str, marker: str) -> str | None:
+        nonlocal update_id
+        update_id += 1
+        start = len(fake.calls)
+        body = json.dumps(make_update(update_id, user_id, text)).encode()
+        await http_post("127.0.0.1", port, "/telegram", body, {"X-Telegram-Bot-Api-Secret-Token": secret})
+        found = lambda: next((t for t in _replies(fake, user_id, start) if marker in t), None)  # noqa: E731
+        await _wait_for(lambda: found() is not None)
+        reply = found()
+        if reply is None:
+            failures.append(f"{text!r} от {user_id}: нет ответа с {marker!r}")
+        return reply
+
+    if not await _wait_for(lambda: _cell(table, name) is not None):
+        return ["фейковая таблица не создана"]
+    original = _cell(table, name)
+    await ask(author, "поставь смену", f"→ {SHIFT}")
+    if not await _wait_for(lambda: _cell(table, name) == SHIFT):
+        failures.append(f"правка не записана в таблицу: {_cell(table, name)!r}")
+    reply = await ask(other, "кто работает", "Кто работает")
+    if reply is not None and f"{name}: {SHIFT}" not in reply:
+        failures.append("другой воркер показывает лист без правки (кэш не сброшен)")
+    reply = await ask(other, "история", "изменения")
+    if reply is not None and SHIFT not in reply:
+        failures.append("в истории другого воркера нет правки")
+    await ask(other, "верни смену", "Восстановлено")
+    if not await _wait_for(lambda: _cell(table, name) == original):
+        failures.append(f"откат не записан в таблицу: {_cell(table, name)!r}")
+    reply = await ask(author, "кто работает", "Кто работает")
+    if reply is not None and f"{name}: {SHIFT}" in reply:
+        failures.append("воркер автора показывает лист до отката (кэш не сброшен)")
+    print(f"общее состояние: правка, история и откат, воркеров задействовано: {len({author % workers, other % workers})}")
+    return failures
+
+
+async def e2e(workers: int, port: int) -> int:
+    fake = FakeTelegram(port=port + 100)
+    await fake.start()
+    secret = "s3cret"
+    users = [1001, 1002, 1003, 1004]
+    # history.json, outbox.json, логи и таблица — во временной папке
+    workdir = Path(tempfile.mkdtemp(prefix="e2e-"))
+    shutil.copy(ROOT / "employees.json", workdir)
+    table = workdir / "sheets.json"
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=TOKEN, BOT_MODE="webhook",
+        TELEGRAM_API_URL=fake.api_url, TELEGRAM_FILE_URL=fake.file_url,
+        WEBHOOK_URL="https://example.invalid/telegram", WEBHOOK_SECRET=secret,
+        WEBHOOK_PORT=str(port), WEBHOOK_WORKERS=str(workers),
+        ADMIN_IDS=",".join(map(str, users)), SCHEDULE_CHAT_ID="0", SCHEDULE_TARGETS="",
+        SPREADSHEET_ID="fake", FAKE_SHEETS_FILE=str(table), VOICE_PREPROCESS="0",
+    )
+    proc = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "--bot"], cwd=workdir, env=env)
+    failures = []
+    try:
+        await _wait_port(port)
+        if workers > 1:
+            for i in range(workers):
+                await _wait_port(port + 1 + i)
+        if not await _wait_for(lambda: "setWebhook" in fake.methods()):
+            failures.append("setWebhook не вызван")
+
+        body = json.dumps(make_update(1, users[0], "/llm_stats")).encode()
+        status, _ = await http_post("127.0.0.1", port, "/telegram", body,
+                                    {"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        if status != 403:
+            failures.append(f"неверный секрет: ожидал 403, получил {status}")
+
+        started = time.monotonic()
+        for i, uid in enumerate(users, start=2):
+            body = json.dumps(make_update(i, uid, "/llm_stats")).encode()
+            status, _ = await http_post("127.0.0.1", port, "/telegram", body,
+                                        {"X-Telegram-Bot-Api-Secret-Token": secret})
+            if status != 200:
+                failures.append(f"апдейт {i}: статус {status}")
+        ok = await _wait_for(lambda: fake.methods().count("sendMessage") >= len(users))
+        print(f"ответов: {fake.methods().count('sendMessage')}/{len(users)} "
+              f"за {(time.monotonic() - started) * 1000:.0f} мс")
+        if not ok:
+            failures.append("бот ответил не на все апдейты")
+
+        failures += await _shared_state(fake, port, secret, users, table, workers)
+
+        # Апдейт, принятый прямо перед SIGTERM, всё равно должен быть обработан
+        sent = fake.methods().count("sendMessage")
+        body = json.dumps(make_update(99, users[0], "/llm_stats")).encode()
+        await http_post("127.0.0.1", port, "/telegram", body, {"X-Telegram-Bot-Api-Secret-Token": secret})
+        proc.send_signal(signal.SIGTERM)
+        code = await asyncio.get_running_loop().run_in_executor(None, proc.wait, 30)
+        if code != 0:
+            failures.append(f"код выхода {code}")
+        if fake.methods().count("sendMessage") < sent + 1:
+            failures.append("апдейт перед остановкой потерян")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        await fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("вызовы Bot API:", ", ".join(sorted(set(fake.methods()))))
+    for f in failures:
+        print("❌", f)
+    if not failures:
+        print("✅ вебхук работает")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--serve", action="store_true", help="только поднять фейковый Bot API")
+    parser.add_argument("--bot", action="store_true", help="запустить бота с фейками (для проверки)")
+    args = parser.parse_args()
+    if args.bot:
+        run_bot()
+        return
+    if args.serve:
+        async def serve():
+            fake = FakeTelegram(port=args.port)
+            await fake.start()
+            print(f"TELEGRAM_API_URL={fake.api_url}")
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+        return
+    sys.exit(asyncio.run(e2e(args.workers, args.port)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Фейки внешних сервисов для нагрузочного теста: Google Sheets, Claude, Groq.
+
+Все фейки считают вызовы, умеют задержку (с разбросом ±50%), а таблица —
+ещё и 429 с заданной вероятностью. install() подключает их к модулям бота
+вместо настоящих клиентов; Bot API подменяется FakeTelegram через TELEGRAM_API_URL.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from gspread.utils import a1_to_rowcol
+
+from bot.shared import SharedJsonFile
+from bot.tracing import span
+
+
+class _Calls:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def hit(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+
+# ===================== GOOGLE SHEETS =====================
+
+
+class FakeSheetsError(Exception):
+    pass
+
+
+class FakeWorksheet:
+    def __init__(self, ss: "FakeSpreadsheet", title: str):
+        self.ss = ss
+        self.title = title
+
+    def get_all_values(self) -> list:
+        self.ss._api("values.get")
+        with self.ss.lock:
+            return [list(r) for r in self.ss.sheets[self.title][1]]
+
+    def update_cell(self, row: int, col: int, value):
+        self.ss._api("values.put")
+        with self.ss.lock:
+            self.ss._set(self.title, row, col, value)
+
+    def batch_update(self, data: list):
+        self.ss._api("values:batchUpdate")
+        with self.ss.lock:
+            for item in data:
+                self.ss._write(self.title, item["range"], item["values"])
+
+
+class FakeSpreadsheet(_Calls):
+    """Таблица в памяти с API gspread, которым пользуется bot/core/sheets.py."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(latency)
+        self.error_rate = error_rate
+        self.sheets: dict[str, tuple[int, list]] = {}  # title → (sheetId, строки)
+        self.lock = threading.Lock()
+
+    def _api(self, op: str):
+        with span(f"sheets.{op}"):
+            self.hit(op)
+            if self.error_rate and random.random() < self.error_rate:
+                self.hit("429")
+                raise FakeSheetsError("APIError: [429]: Quota exceeded for quota metric 'Read requests'")
+
+    def _set(self, title: str, row: int, col: int, value):
+        grid = self.sheets[title][1]
+        while len(grid) < row:
+            grid.append([])
+        cells = grid[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = value
+
+    def _write(self, title: str, a1: str, values: list):
+        row, col = a1_to_rowcol(a1.split(":")[0])
+        for i, line in enumerate(values):
+            for j, value in enumerate(line):
+                self._set(title, row + i, col + j, value)
+
+    @staticmethod
+    def _split(rng: str) -> tuple[str, str]:
+        m = re.match(r"'(.+)'!?(.*)", rng)
+        return m.group(1), m.group(2) or "A1"
+
+    # --- клиент / таблица ---
+
+    def open_by_key(self, key: str):
+        self._api("metadata")  # gspread читает метаданные при открытии
+        return self
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self._api("metadata")
+        if title not in self.sheets:
+            raise FakeSheetsError(f"WorksheetNotFound: {title}")
+        return FakeWorksheet(self, title)
+
+    def fetch_sheet_metadata(self, params=None) -> dict:
+        self._api("metadata")
+        with self.lock:
+            return {"sheets": [{"properties": {"title": t, "sheetId": i}} for t, (i, _) in self.sheets.items()]}
+
+    def batch_update(self, body: dict):
+        self._api("batchUpdate")
+        with self.lock:
+            for request in body["requests"]:
+                if "addSheet" in request:
+                    self.sheets[request["addSheet"]["properties"]["title"]] = (len(self.sheets) + 1, [])
+                elif "duplicateSheet" in request:
+                    self.sheets[request["duplicateSheet"]["newSheetName"]] = (len(self.sheets) + 1, [])
+
+    def values_batch_update(self, body: dict):
+        self._api("values:batchUpdate")
+        with self.lock:
+            for item in body["data"]:
+                title, a1 = self._split(item["range"])
+                self._write(title, a1, item["values"])
+
+    def values_batch_get(self, ranges: list) -> dict:
+        self._api("values:batchGet")
+        with self.lock:
+            return {"valueRanges": [
+                {"values": [list(r) for r in self.sheets[self._split(x)[0]][1]]} for x in ranges
+            ]}
+
+
+class _FileLock:
+    """Замок SharedFakeSpreadsheet: на входе — блокировка файла и листы с диска, на выходе — запись."""
+
+    def __init__(self, ss: "SharedFakeSpreadsheet", path: str):
+        self.ss = ss
+        self.file = SharedJsonFile(path)
+        self._held = None
+
+    def __enter__(self):
+        held = self.file.lock()
+        held.__enter__()
+        self._held = held
+        self.ss.sheets = {title: tuple(sheet) for title, sheet in self.file.read().items()}
+
+    def __exit__(self, *exc):
+        held = self._held
+        try:
+            self.file.write(self.ss.sheets, indent=None)
+        finally:
+            held.__exit__(None, None, None)
+
+
+class SharedFakeSpreadsheet(FakeSpreadsheet):
+    """FakeSpreadsheet в JSON-файле: одна таблица на все процессы (прокси и воркеры вебхука)."""
+
+    def __init__(self, path: str, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(latency, error_rate)
+        self.lock = _FileLock(self, path)
+
+
+# ===================== CLAUDE =====================
+
+
+class FakeAnthropic(_Calls):
+    """messages.create: разбор — по сценарию {текст запроса: JSON}, болтовня — шаблон."""
+
+    def __init__(self, script: dict[str, str], latency: float = 0.0):
+        super().__init__(latency)
+        self.script = script
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, model: str, max_tokens: int, system, messages: list, **kwargs):
+        content = messages[-1]["content"]
+        request = content.split("Запрос: ", 1)
+        if len(request) == 2:
+            self.hit("parse")
+            text = self.script.get(request[1], '{"action":"chat"}')
+        else:
+            self.hit("chat")
+            text = "👍 Держись, всё получится!"
+        usage = SimpleNamespace(input_tokens=len(str(system)) // 4, output_tokens=len(text) // 4,
+                                cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage)
+
+
+# ===================== GROQ =====================
+
+VOICE_MAGIC = b"OggS-fake:"
+
+
+def voice_bytes(text: str, nonce: str = "") -> bytes:
+    """«Запись», которую FakeWhisper распознает как text; nonce делает файлы разными."""
+    return VOICE_MAGIC + text.encode() + b"\0" + nonce.encode()
+
+
+class FakeWhisper(_Calls):
+    """TranscriptionBackend: возвращает текст, зашитый в voice_bytes()."""
+
+    def transcribe(self, audio, filename: str) -> str:
+        self.hit("transcribe")
+        data = audio if isinstance(audio, bytes) else audio.read()
+        return data.removeprefix(VOICE_MAGIC).split(b"\0", 1)[0].decode(errors="replace")
+
+
+# ===================== ПОДКЛЮЧЕНИЕ =====================
+
+
+def install(spreadsheet: FakeSpreadsheet, claude: FakeAnthropic, whisper: FakeWhisper):
+    from bot.core import sheets
+    from bot.services import ai_client, voice
+
+    sheets._gc = SimpleNamespace(open_by_key=spreadsheet.open_by_key)
+    sheets._gc_last_check = float("inf")
+    sheets._spreadsheet = None
+    sheets._worksheets.clear()
+    ai_client._client = claude
+    voice.set_backend(whisper)
@@ -0,0 +1,304 @@
+"""Нагрузочный тест бота без сети: фейковые Telegram, Google Sheets, Claude и Groq.
+
+Синтетические пользователи шлют текстовые и голосовые апдейты через те же
+handle_text/handle_voice, очередь пользователя и admission, что и в бою.
+Внешние сервисы — фейки из tools/fakes.py с настраиваемой задержкой,
+Bot API — FakeTelegram на localhost. На каждый сценарий печатается
+пропускная способность, перцентили задержки, вызовы внешних сервисов и
+перцентили этапов из bot.tracing; --json сохраняет то же для сравнения
+между коммитами.
+
+    python tools/loadtest.py                          # все сценарии
+    python tools/loadtest.py --scenario mixed --users 50 --messages 20
+    python tools/loadtest.py --sheets-latency 0.3 --sheets-429 0.05 --json out.json
+
+Лимиты admission по умолчанию сняты (RATE_BURST/RATE_PER_MINUTE), чтобы мерить
+ёмкость; заданные в окружении значения не трогаются.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from calendar import monthrange
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    # сценарий: веса типов запросов
+    "read": {"read": 1},
+    "write": {"write": 1},
+    "voice": {"voice": 1},
+    "chat": {"chat": 1},
+    "mixed": {"read": 50, "workers": 15, "write": 15, "voice": 10, "chat": 10},
+}
+SHIFTS = ["09:00 - 17:00", "13:00 - 21:00", "17:00 - 01:00", "Выходной"]
+
+
+def _prepare_env(args):
+    """Окружение до импорта бота: config читает его один раз при импорте."""
+    workdir = Path(tempfile.mkdtemp(prefix="loadtest-"))
+    shutil.copy(ROOT / "employees.json", workdir)
+    os.chdir(workdir)  # history.json, snapshot.json, bot.log — во временной папке
+    os.environ.update(
+        TELEGRAM_TOKEN="123456:FAKE", SPREADSHEET_ID="fake",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.port}/bot",
+        TELEGRAM_FILE_URL=f"http://127.0.0.1:{args.port}/file/bot",
+        SCHEDULE_CHAT_ID="0", SCHEDULE_TARGETS="", VOICE_PREPROCESS="0", SLOW_REQUEST_SECONDS="0",
+    )
+    os.environ.setdefault("RATE_BURST", "1000000")
+    os.environ.setdefault("RATE_PER_MINUTE", "1000000")
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / "tools"))
+    return workdir
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _percentiles(values: list[float]) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+# ===================== ЗАПРОСЫ =====================
+
+
+class Requests:
+    """Генератор запросов: текст + ответ, который фейковый Claude вернёт на разбор."""
+
+    def __init__(self, names: list[str], script: dict):
+        from bot.config import MSK
+        from datetime import datetime
+
+        self.names = names
+        self.script = script
+        today = datetime.now(MSK)
+        self.month = today.strftime("%m")
+        self.days = monthrange(today.year, today.month)[1]
+        self.n = 0
+
+    def _day(self, day: int) -> str:
+        return f"{day:02d}.{self.month}"
+
+    def make(self, kind: str) -> tuple[str, str]:
+        """→ (тип апдейта "text"/"voice", текст)."""
+        self.n += 1
+        if kind == "voice":
+            return "voice", self.make("read")[1]
+        if kind == "read":
+            d1 = random.randint(1, self.days - 6)
+            d2 = d1 + random.randint(0, 6)
+            text, parsed = f"покажи {d1}-{d2}", {
+                "action": "show_period", "date_from": self._day(d1), "date_to": self._day(d2)}
+        elif kind == "workers":
+            d = random.randint(1, self.days)
+            text, parsed = f"кто работает {d}", {"action": "show_workers", "date": self._day(d)}
+        elif kind == "write":
+            name, d, shift = random.choice(self.names), random.randint(1, self.days), random.choice(SHIFTS)
+            text, parsed = f"поставь {name} {d} {shift} #{self.n}", {
+                "action": "update", "name": name, "date": self._day(d), "time": shift}
+        else:
+            text, parsed = f"как дела #{self.n}", {"action": "chat"}
+        self.script[text] = json.dumps(parsed, ensure_ascii=False)
+        return "text", text
+
+
+# ===================== ПРОГОН =====================
+
+
+async def run_scenario(name: str, args, fake_tg, fakes, bot_modules) -> dict:
+    from telegram import Update
+    from fake_telegram import make_update, make_voice_update
+    from fakes import voice_bytes
+
+    from bot.config import NAMES
+    from bot.core import sheets
+
+    main, state, tracing, voice_cache = bot_modules
+    sheets_fake, claude, whisper = fakes
+    state.sheets_cache.clear()
+    state.sheets_cache_time.clear()
+    state.image_cache.clear()
+    voice_cache._cache.clear()
+    tracing.reset_stages()
+    for f in (sheets_fake, claude, whisper):
+        f.counts.clear()
+    fake_tg.calls.clear()
+
+    weights = SCENARIOS[name]
+    kinds, kind_weights = list(weights), list(weights.values())
+    gen = Requests(list(NAMES), claude.script)
+    app = main.build_app(with_jobs=False)
+    await app.initialize()
+    update_ids = iter(range(1, 10 ** 9))
+    latencies: list[float] = []
+    failed = 0
+
+    async def user(uid: int):
+        nonlocal failed
+        for _ in range(args.messages):
+            kind, text = gen.make(random.choices(kinds, kind_weights)[0])
+            update_id = next(update_ids)
+            if kind == "voice":
+                file_id = f"v{update_id}"
+                fake_tg.files[file_id] = voice_bytes(text, file_id)
+                data = make_voice_update(update_id, uid, file_id)
+            else:
+                data = make_update(update_id, uid, text)
+            update = Update.de_json(data, app.bot)
+            started = time.perf_counter()
+            try:
+                await app.update_processor.process_update(update, app.process_update(update))
+            except Exception:
+                failed += 1
+            latencies.append(time.perf_counter() - started)
+            if args.think:
+                await asyncio.sleep(random.expovariate(1 / args.think))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(10_000 + i) for i in range(args.users)))
+    wall = time.perf_counter() - started
+    # Правки копятся в outbox; без запущенного job_queue пишем их в таблицу здесь
+    written, _, _ = await sheets.flush_outbox()
+    await app.shutdown()
+
+    replies = [p.get("text") or p.get("caption") or "" for m, p in fake_tg.calls
+               if m.startswith(("send", "edit"))]
+    return {
+        "scenario": name,
+        "updates": len(latencies),
+        "wall_s": wall,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "latency": _percentiles(latencies),
+        "failed": failed,
+        "outbox_written": written,
+        "error_replies": sum(1 for r in replies if r.startswith("❌") or "\n\n❌" in r),
+        "telegram": dict(Counter(m for m, _ in fake_tg.calls)),
+        "sheets": dict(sheets_fake.counts),
+        "claude": dict(claude.counts),
+        "groq": dict(whisper.counts),
+        "stages": tracing.stage_summary(),
+    }
+
+
+def print_report(r: dict):
+    lat = r["latency"]
+    print(f"\n=== {r['scenario']}: {r['updates']} апдейтов за {r['wall_s']:.2f}с "
+          f"→ {r['throughput']:.1f} апд/с")
+    print(f"задержка: p50 {lat['p50'] * 1000:.0f} мс, p95 {lat['p95'] * 1000:.0f} мс, "
+          f"p99 {lat['p99'] * 1000:.0f} мс, max {lat['max'] * 1000:.0f} мс; "
+          f"исключений {r['failed']}, ответов с ❌ {r['error_replies']}, "
+          f"из outbox записано ячеек {r['outbox_written']}")
+    for service in ("telegram", "sheets", "claude", "groq"):
+        calls = r[service]
+        if calls:
+            items = ", ".join(f"{k}={v}" for k, v in sorted(calls.items()))
+            print(f"{service}: {sum(v for k, v in calls.items() if k != '429')} вызовов ({items})")
+    print("этапы (вызовы / p50 / p95 / p99, мс):")
+    for stage, s in r["stages"].items():
+        print(f"  {stage:28} {s['count']:6} / {s['p50'] * 1000:7.1f} / "
+              f"{s['p95'] * 1000:7.1f} / {s['p99'] * 1000:7.1f}")
+
+
+async def amain(args) -> list[dict]:
+    import logging
+
+    from datetime import datetime
+
+    import main
+    from bot import state, tracing
+    from bot.config import MSK
+    from bot.core import sheets
+    from bot.core.schedule import generate_month_updates
+    from bot.services import voice_cache
+    from fake_telegram import FakeTelegram
+    from fakes import FakeSpreadsheet, FakeAnthropic, FakeWhisper, install
+
+    if not args.verbose:
+        logging.getLogger("bot").setLevel(logging.WARNING)
+        logging.getLogger("telegram").setLevel(logging.WARNING)
+
+    sheets_fake = FakeSpreadsheet(args.sheets_latency, args.sheets_429)
+    claude = FakeAnthropic({}, args.claude_latency)
+    whisper = FakeWhisper(args.groq_latency)
+    install(sheets_fake, claude, whisper)
+
+    # Таблица на текущий месяц — заполнение по графикам employees.json, без задержек
+    latency, error_rate = sheets_fake.latency, sheets_fake.error_rate
+    sheets_fake.latency = sheets_fake.error_rate = 0
+    now = datetime.now(MSK)
+    month = now.strftime("%m")
+    sheets._create_month_sheets([month], now.year)
+    sheets._execute_fill_sync(generate_month_updates(month, now.year))
+    sheets_fake.latency, sheets_fake.error_rate = latency, error_rate
+
+    fake_tg = FakeTelegram(port=args.port, latency=args.telegram_latency)
+    await fake_tg.start()
+    results = []
+    try:
+        for name in (args.scenario or list(SCENARIOS)):
+            result = await run_scenario(name, args, fake_tg, (sheets_fake, claude, whisper),
+                                        (main, state, tracing, voice_cache))
+            print_report(result)
+            results.append(result)
+    finally:
+        await fake_tg.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=10, help="сообщений на пользователя")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза между сообщениями, с")
+    parser.add_argument("--sheets-latency", type=float, default=0.15)
+    parser.add_argument("--sheets-429", type=float, default=0.0, help="доля запросов к Sheets с 429")
+    parser.add_argument("--claude-latency", type=float, default=0.8)
+    parser.add_argument("--groq-latency", type=float, default=0.5)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=18900)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="куда сохранить результаты")
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    json_path = Path(args.json).resolve() if args.json else None
+    workdir = _prepare_env(args)
+    try:
+        results = asyncio.run(amain(args))
+    finally:
+        from bot.core.sheets import shutdown_executor
+        from bot.core.image_gen import shutdown_render_pool
+        from bot.services.voice import shutdown_voice_executor
+        shutdown_executor()
+        shutdown_voice_executor()
+        shutdown_render_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        json_path.write_text(json.dumps(
+            {"commit": _git_commit(), "args": vars(args), "results": results},
+            ensure_ascii=False, indent=2,
+        ), encoding="utf-8")
+        print(f"\nрезультаты: {json_path}")
+
+
+if __name__ == "__main__":
+    main()
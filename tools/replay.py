@@ -0,0 +1,213 @@
+"""Прогон корпуса запросов (CORPUS_ENABLED=1) через разбор намерений.
+
+Каждая запись корпуса снова проходит parse_with_claude — тот же промпт,
+контекст пользователя и валидация. Ответ модели берётся:
+
+    --llm cached   из корпуса (по умолчанию): меряется собственная задержка
+                   конвейера, --latency добавляет задержку модели
+    --llm live     из настоящего Claude (нужен ANTHROPIC_API_KEY), --model
+                   подменяет PARSE_MODEL — для сравнения промптов и моделей
+
+--fast-path module:function подключает кандидат быстрого разбора без LLM:
+function(text) -> dict | None. Отчёт: задержка разбора p50/p95/p99, токены,
+совпадение действия и всего разбора с записанным, покрытие и точность
+быстрого пути.
+
+    python tools/replay.py corpus.jsonl
+    python tools/replay.py corpus.jsonl* --llm live --model claude-sonnet-4-5 --json out.json
+    python tools/replay.py corpus.jsonl --fast-path tools.my_rules:parse
+
+Относительные даты («завтра») разбираются от дня прогона, поэтому в live
+поля дат могут расходиться с корпусом; действие от этого не зависит.
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_corpus(patterns: list[str]) -> list[dict]:
+    """Записи в порядке времени: ротированные файлы (.N … .1) раньше текущего."""
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)},
+                   key=lambda p: (-int(p.rsplit(".", 1)[1]) if p.rsplit(".", 1)[1].isdigit() else 0))
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda e: e.get("ts", ""))
+    return entries
+
+
+def _percentiles(values: list[float]) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class CachedClient:
+    """Вместо Claude отвечает записанным в корпусе ответом на тот же текст."""
+
+    def __init__(self, entries: list[dict], latency: str):
+        self.raw = {e["text"]: e.get("raw") or json.dumps(e["parsed"], ensure_ascii=False) for e in entries}
+        self.recorded = {e["text"]: e.get("latency_ms", 0) / 1000 for e in entries}
+        self.latency = latency
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, model: str, messages: list, **kwargs):
+        text = messages[-1]["content"].split("Запрос: ", 1)[-1]
+        if self.latency == "recorded":
+            time.sleep(self.recorded.get(text, 0))
+        elif float(self.latency):
+            time.sleep(float(self.latency))
+        usage = SimpleNamespace(input_tokens=0, output_tokens=0,
+                                cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        return SimpleNamespace(content=[SimpleNamespace(text=self.raw.get(text, '{"action":"chat"}'))], usage=usage)
+
+
+def _load_fast_path(spec: str | None):
+    if not spec:
+        return None
+    module, _, func = spec.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+
+def replay(entries: list[dict], args) -> dict:
+    from bot.services import ai_client
+    from bot.state import user_context
+
+    if args.llm == "cached":
+        ai_client._client = CachedClient(entries, args.latency)
+    if args.model:
+        ai_client.PARSE_MODEL = args.model
+    fast_path = _load_fast_path(args.fast_path)
+    user_context.clear()
+
+    users: dict[str, int] = {}
+    latencies, fast_latencies = [], []
+    tokens = Counter()
+    agree_action = agree_full = fast_hits = fast_agree = errors = 0
+    disagreements = []
+    for e in entries:
+        user_id = users.setdefault(e.get("user", "-"), len(users) + 1)
+        started = time.perf_counter()
+        parsed = fast_path(e["text"]) if fast_path else None
+        if parsed is not None:
+            fast_latencies.append(time.perf_counter() - started)
+            fast_hits += 1
+            fast_agree += parsed.get("action") == e["action"]
+        else:
+            meta: dict = {}
+            try:
+                parsed = ai_client.parse_with_claude(e["text"], user_id, meta)
+            except Exception as ex:
+                errors += 1
+                print(f"❌ {e['text']!r}: {ex}", file=sys.stderr)
+                continue
+            latencies.append(time.perf_counter() - started)
+            usage = meta.get("usage")
+            tokens["input"] += getattr(usage, "input_tokens", 0) or 0
+            tokens["output"] += getattr(usage, "output_tokens", 0) or 0
+        if parsed.get("action") == e["action"]:
+            agree_action += 1
+        else:
+            disagreements.append((e["text"], e["action"], parsed.get("action")))
+        agree_full += parsed == e["parsed"]
+
+    total = len(entries)
+    return {
+        "entries": total,
+        "llm": args.llm,
+        "model": ai_client.PARSE_MODEL,
+        "errors": errors,
+        "parse_latency": _percentiles(latencies),
+        "recorded_latency": _percentiles([e.get("latency_ms", 0) / 1000 for e in entries]),
+        "fast_path_latency": _percentiles(fast_latencies),
+        "tokens": dict(tokens),
+        "recorded_tokens": {
+            "input": sum(e.get("tokens", {}).get("input", 0) for e in entries),
+            "output": sum(e.get("tokens", {}).get("output", 0) for e in entries),
+        },
+        "action_agreement": agree_action / total if total else 0.0,
+        "full_agreement": agree_full / total if total else 0.0,
+        "fast_path_coverage": fast_hits / total if total else 0.0,
+        "fast_path_agreement": fast_agree / fast_hits if fast_hits else 0.0,
+        "by_action": dict(Counter(e["action"] for e in entries)),
+        "disagreements": disagreements[:args.show],
+    }
+
+
+def print_report(r: dict):
+    ms = lambda p: f"p50 {p['p50'] * 1000:.1f} / p95 {p['p95'] * 1000:.1f} / p99 {p['p99'] * 1000:.1f} мс"  # noqa: E731
+    print(f"записей: {r['entries']}, LLM: {r['llm']} ({r['model']}), ошибок: {r['errors']}")
+    print(f"разбор сейчас:   {ms(r['parse_latency'])}")
+    print(f"разбор в корпусе: {ms(r['recorded_latency'])}")
+    if r["fast_path_coverage"]:
+        print(f"быстрый путь: покрытие {r['fast_path_coverage']:.1%}, точность {r['fast_path_agreement']:.1%}, "
+              f"{ms(r['fast_path_latency'])}")
+    if r["tokens"]:
+        print(f"токены: {r['tokens']} (в корпусе: {r['recorded_tokens']})")
+    print(f"совпадение действия: {r['action_agreement']:.1%}, всего разбора: {r['full_agreement']:.1%}")
+    print("действия в корпусе:", ", ".join(f"{a}={n}" for a, n in sorted(r["by_action"].items())))
+    for text, was, now in r["disagreements"]:
+        print(f"  ≠ {text!r}: {was} → {now}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="+", help="файлы корпуса (можно с *)")
+    parser.add_argument("--llm", choices=["cached", "live"], default="cached")
+    parser.add_argument("--latency", default="0", help="для cached: секунды или recorded")
+    parser.add_argument("--model", help="подменить PARSE_MODEL")
+    parser.add_argument("--fast-path", help="module:function — кандидат разбора без LLM")
+    parser.add_argument("--limit", type=int, default=0, help="взять N случайных записей")
+    parser.add_argument("--show", type=int, default=10, help="сколько расхождений показать")
+    parser.add_argument("--json", help="куда сохранить результаты")
+    args = parser.parse_args()
+
+    entries = load_corpus([str(Path(p).resolve()) for p in args.corpus])
+    if not entries:
+        sys.exit("корпус пуст")
+    if args.limit:
+        entries = sorted(random.Random(1).sample(entries, min(args.limit, len(entries))),
+                         key=lambda e: e.get("ts", ""))
+
+    json_path = Path(args.json).resolve() if args.json else None
+    # Бот пишет bot.log и читает employees.json из текущей папки
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    shutil.copy(ROOT / "employees.json", workdir)
+    os.chdir(workdir)
+    os.environ["CORPUS_ENABLED"] = "0"
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / "tools"))
+    import logging
+    from bot.config import logger
+    logger.setLevel(logging.WARNING)
+
+    try:
+        result = replay(entries, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report(result)
+    if json_path:
+        json_path.write_text(json.dumps({"args": vars(args), "result": result}, ensure_ascii=False, indent=2),
+                             encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()